@@ -0,0 +1,245 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+'''Count each test's API calls and hold tests to a budget.
+
+   Every request the managers and the bigip fixture make is tallied against
+the running test as '<service>_<verb>', e.g. neutron_list or heat_show.
+The service comes from the URL path and the verb from the HTTP method,
+with a GET of a collection counted as 'list' and a GET of one object,
+named by a UUID or a BIG-IP ~partition~name, as 'show'.
+
+    @pytest.mark.api_budget(neutron_list=10, neutron=40, total=60)
+    def test_listener(setup_with_listener):
+        ...
+
+A budget names counters, whole services or 'total'.  The test's setup,
+body and function-scoped fixture teardown count against it; setting up
+and tearing down wider-scoped fixtures, such as the shared clients and the
+loadbalancer pool, does not, nor does work such a fixture does lazily
+inside shared_calls().  A test over budget errors in its teardown, and the
+run ends with the heaviest tests listed.
+
+   Nothing is counted or checked unless the run is given --api-budget.
+'''
+from collections import Counter
+from contextlib import contextmanager
+import pytest
+import re
+from requests.adapters import HTTPAdapter
+import threading
+from urllib.parse import urlsplit
+
+
+# Calls made outside any test's own setup, body and teardown.
+SESSION = '<session>'
+
+KEYSTONE_V2 = frozenset(['tokens', 'tenants', 'users', 'roles', 'services',
+                         'endpoints'])
+
+_ID = re.compile(r'^[0-9a-f]{8}(-?[0-9a-f]{4}){3}-?[0-9a-f]{12}$', re.I)
+
+VERBS = {'GET': 'list', 'HEAD': 'list', 'POST': 'create', 'PUT': 'update',
+         'PATCH': 'update', 'DELETE': 'delete'}
+
+
+def service_of(path):
+    parts = [part for part in path.split('/') if part]
+    if not parts:
+        return 'other'
+    if parts[0] == 'mgmt':
+        return 'bigip'
+    if parts[0] == 'v3':
+        return 'keystone'
+    if parts[0] == 'v2.0':
+        if len(parts) == 1 or parts[1] in KEYSTONE_V2 or\
+                parts[1].startswith('OS-'):
+            return 'keystone'
+        return 'neutron'
+    if parts[0] == 'v2' or parts[1:2] == ['images']:
+        return 'glance'
+    if parts[0] == 'v1':
+        return 'heat'
+    return 'other'
+
+
+def verb_of(method, path):
+    verb = VERBS.get(method, method.lower())
+    if verb == 'list':
+        last = path.rstrip('/').rsplit('/', 1)[-1]
+        if last.endswith('.json'):
+            last = last[:-len('.json')]
+        if _ID.match(last) or '~' in last:
+            return 'show'
+    return verb
+
+
+def call_name(method, url):
+    path = urlsplit(url).path
+    return '%s_%s' % (service_of(path), verb_of(method, path))
+
+
+class ApiCallCounter(object):
+    '''Per-test tallies of API calls, from any number of threads.'''
+    def __init__(self):
+        self.tests = {}
+        self.current = SESSION
+        self._lock = threading.Lock()
+
+    def count(self, method, url):
+        name = call_name(method, url)
+        with self._lock:
+            self.tests.setdefault(self.current, Counter())[name] += 1
+
+    def calls(self, test):
+        '''The test's calls by counter, service and in total.'''
+        with self._lock:
+            counts = Counter(self.tests.get(test, {}))
+        for name, number in list(counts.items()):
+            counts[name.split('_', 1)[0]] += number
+            counts['total'] += number
+        return counts
+
+    def over_budget(self, test, budget):
+        '''(name, calls, allowed) for each budget entry exceeded.'''
+        calls = self.calls(test)
+        return [(name, calls[name], allowed)
+                for name, allowed in sorted(budget.items())
+                if calls[name] > allowed]
+
+    def heaviest(self, count):
+        '''The count tests that made the most calls, heaviest first.'''
+        with self._lock:
+            totals = [(sum(counts.values()), test)
+                      for test, counts in self.tests.items()
+                      if test != SESSION]
+        return [test for total, test in sorted(totals, reverse=True)[:count]]
+
+
+COUNTER = ApiCallCounter()
+
+_unpatched_send = None
+
+
+def install(counter):
+    '''Count every HTTPAdapter.send, wrapping any cassette already there.'''
+    global _unpatched_send
+    _unpatched_send = send = HTTPAdapter.send
+
+    def counted_send(adapter, request, **kwargs):
+        counter.count(request.method, request.url)
+        return send(adapter, request, **kwargs)
+    HTTPAdapter.send = counted_send
+
+
+def uninstall():
+    global _unpatched_send
+    if _unpatched_send is not None:
+        HTTPAdapter.send, _unpatched_send = _unpatched_send, None
+
+
+@contextmanager
+def shared_calls():
+    '''Charge the enclosed calls to the session, not the running test.
+
+    For work a wider-scoped fixture does on a test's behalf, such as the
+    loadbalancer pool filling itself on its first lease.
+    '''
+    test, COUNTER.current = COUNTER.current, SESSION
+    try:
+        yield
+    finally:
+        COUNTER.current = test
+
+
+def pytest_addoption(parser):
+    parser.addoption("--api-budget", action="store_true", default=False,
+                     help="Count each test's API calls, enforce api_budget "
+                          "markers and list the heaviest tests.")
+    parser.addoption("--api-calls-top", action="store", type=int,
+                     default=10,
+                     help="Number of tests listed in the API call summary; "
+                          "0 leaves it out.")
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers', 'api_budget(**limits): with --api-budget, fail the test '
+                   'if it makes more API calls than allowed, e.g. '
+                   'neutron_list=10, neutron=40 or total=60.')
+    if config.getoption('--api-budget'):
+        install(COUNTER)
+        config.pluginmanager.register(ApiBudgetPlugin(), 'api_budget_plugin')
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_unconfigure(config):
+    uninstall()
+
+
+class ApiBudgetPlugin(object):
+    '''The hooks and fixture registered for a run given --api-budget.'''
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        COUNTER.current = item.nodeid
+        yield
+        COUNTER.current = SESSION
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_fixture_setup(self, fixturedef, request):
+        if fixturedef.scope == 'function':
+            yield
+            return
+        with shared_calls():
+            yield
+
+    @pytest.fixture(autouse=True)
+    def api_budget_check(self, request):
+        '''Check the api_budget marker once function-scoped fixtures are gone.
+
+        Being autouse this is set up before, so torn down after, every other
+        function-scoped fixture; what is torn down after it is shared.
+        '''
+        def check():
+            COUNTER.current = SESSION
+            marker = request.node.get_closest_marker('api_budget')
+            if marker is None:
+                return
+            exceeded = COUNTER.over_budget(request.node.nodeid,
+                                           marker.kwargs)
+            if exceeded:
+                pytest.fail('API budget exceeded: ' + ', '.join(
+                    '%s=%d (allowed %d)' % entry for entry in exceeded),
+                    pytrace=False)
+        request.addfinalizer(check)
+
+    def pytest_terminal_summary(self, terminalreporter):
+        top = terminalreporter.config.getoption('--api-calls-top')
+        heaviest = COUNTER.heaviest(top) if top else []
+        if not heaviest:
+            return
+        terminalreporter.write_sep('=', 'API calls per test')
+        for test in heaviest:
+            calls = COUNTER.calls(test)
+            busiest = sorted(((number, name)
+                              for name, number in calls.items()
+                              if '_' in name), reverse=True)[:4]
+            terminalreporter.write_line('%6d  %s  (%s)' % (
+                calls['total'], test,
+                ', '.join('%s=%d' % (name, number)
+                          for number, name in busiest)))
+        session_calls = COUNTER.calls(SESSION)['total']
+        if session_calls:
+            terminalreporter.write_line('%6d  %s' % (session_calls, SESSION))
@@ -0,0 +1,319 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+'''Coroutine versions of the polling manager operations.
+
+   The OpenStack clients block, so each API call still runs on a thread, but
+only for the duration of the call: all managers share one small executor,
+and the sleeps between probes are asyncio.sleep on the caller's event loop.
+Provisioning five loadbalancers therefore overlaps on one loop without
+five threads sitting in time.sleep.
+
+    lbs = async_gather(nclientmanager.acreate_loadbalancer(conf_a),
+                       nclientmanager.acreate_loadbalancer(conf_b))
+'''
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from f5_os_test.exceptions import MaximumNumberOfAttemptsExceeded
+from f5_os_test.timing import TimingRecord
+from heatclient.exc import HTTPNotFound
+from neutronclient.common.exceptions import NotFound
+from neutronclient.common.exceptions import StateInvalidClient
+import functools
+import pytest
+import threading
+import time
+
+
+# Threads shared by every manager for the blocking client calls.
+ASYNC_WORKERS = 8
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ASYNC_WORKERS)
+        return _executor
+
+
+def _charged_call(record, call, args, kwargs):
+    started = time.time()
+    try:
+        return call(*args, **kwargs)
+    finally:
+        record.attempts = record.attempts + 1
+        record.http_time = record.http_time + time.time() - started
+
+
+class AsyncPollingMixin(object):
+    '''Awaitable counterparts of PollingMixin.wait_until and friends.
+
+    Every coroutine takes the TimingRecord of the operation it belongs to,
+    since records can't be found per thread when coroutines share one.
+    The manager supplies _strategy_for and _learn from PollingMixin.
+    '''
+    skip_sleeps = False
+
+    async def _acall(self, record, call, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            get_executor(),
+            functools.partial(_charged_call, record, call, args, kwargs))
+
+    async def _asleep(self, record, delay):
+        if self.skip_sleeps:
+            return
+        await asyncio.sleep(delay)
+        record.sleep_time = record.sleep_time + delay
+
+    async def await_until(self, record, probe, predicate=bool):
+        '''Await probe until predicate accepts its result, then return it.'''
+        strategy = self._strategy_for(record)
+        started = time.time()
+        if strategy.lead_in:
+            await self._asleep(record, strategy.lead_in)
+        observed = await self._acall(record, probe)
+        if predicate(observed):
+            return self._learn(record, started, observed)
+        for delay in strategy.delays():
+            await self._asleep(record, delay)
+            observed = await self._acall(record, probe)
+            if predicate(observed):
+                return self._learn(record, started, observed)
+        self._learn(record, started, None, timed_out=True)
+        raise MaximumNumberOfAttemptsExceeded
+
+    async def _acall_with_exceptions(self, record, exceptional, call, *args):
+        delays = self.wait_strategy.delays()
+        while True:
+            try:
+                return await self._acall(record, call, *args)
+            except exceptional as exc:
+                await self._acall(record, self._refused, exc)
+                try:
+                    delay = next(delays)
+                except StopIteration:
+                    raise MaximumNumberOfAttemptsExceeded
+                await self._asleep(record, delay)
+
+    async def _timed(self, resource, operation, coroutine):
+        record = TimingRecord(resource, operation)
+        try:
+            result = await coroutine(record)
+        except Exception as exc:
+            self.timing_recorder.finish(record, exc)
+            raise
+        self.timing_recorder.finish(record)
+        return result
+
+
+class AsyncNeutronMixin(AsyncPollingMixin):
+    '''Coroutine LBaaS operations for NeutronClientPollingManager.
+
+    The manager supplies _raw(name), the undecorated NeutronClient method.
+    '''
+    async def await_ids(self, record, collection, resource_ids,
+                        present=True):
+        resource_ids = frozenset(resource_ids)
+        with self.collection_waiter.pending(collection, resource_ids):
+            await self.await_until(
+                record, functools.partial(self._outstanding, collection,
+                                          resource_ids, present),
+                lambda ids: not ids)
+        return True
+
+    async def _acreate(self, record, create, collection, key, *args):
+        created = await self._acall_with_exceptions(
+            record, StateInvalidClient, self._raw(create), *args)
+        pool_id = args[0] if key == 'member' else None
+        self._track(key, created, pool_id)
+        await self.await_ids(
+            record, (collection, pool_id) if pool_id else collection,
+            [created[key]['id']])
+        return created
+
+    async def _adelete(self, record, delete, collection, resource_id,
+                       pool_id=None):
+        args = (resource_id, pool_id) if pool_id else (resource_id,)
+        await self._acall_with_exceptions(
+            record, StateInvalidClient, self._raw(delete), *args)
+        await self.await_ids(
+            record, (collection, pool_id) if pool_id else collection,
+            [resource_id], present=False)
+        self.untrack((collection[:-1], resource_id))
+        return True
+
+    # loadbalancers
+    async def acreate_loadbalancer(self, lbconf):
+        async def create(record):
+            lb = self._track('loadbalancer', await self._acall(
+                record, self._raw('create_loadbalancer'), lbconf))
+            lbid = lb['loadbalancer']['id']
+            return await self.await_until(
+                record,
+                functools.partial(self._raw('show_loadbalancer'), lbid),
+                self._loadbalancer_settled)
+        return await self._timed('loadbalancer', 'create', create)
+
+    async def aupdate_loadbalancer(self, lbid, lbconf):
+        return await self._timed(
+            'loadbalancer', 'update',
+            lambda record: self._acall_with_exceptions(
+                record, StateInvalidClient,
+                self._raw('update_loadbalancer'), lbid, lbconf))
+
+    async def adelete_loadbalancer(self, lbid):
+        async def delete(record):
+            try:
+                await self._acall_with_exceptions(
+                    record, StateInvalidClient,
+                    self._raw('delete_loadbalancer'), lbid)
+            except NotFound:
+                self.untrack(('loadbalancer', lbid))
+                return True
+            gone = await self.await_until(
+                record, functools.partial(self._loadbalancer_gone, lbid))
+            self.untrack(('loadbalancer', lbid))
+            return gone
+        return await self._timed('loadbalancer', 'delete', delete)
+
+    # listeners
+    async def acreate_listener(self, listener_conf):
+        return await self._timed(
+            'listener', 'create',
+            lambda record: self._acreate(
+                record, 'create_listener', 'listeners', 'listener',
+                listener_conf))
+
+    async def adelete_listener(self, listener_id):
+        return await self._timed(
+            'listener', 'delete',
+            lambda record: self._adelete(
+                record, 'delete_listener', 'listeners', listener_id))
+
+    # pools
+    async def acreate_lbaas_pool(self, pool_config):
+        return await self._timed(
+            'pool', 'create',
+            lambda record: self._acreate(
+                record, 'create_lbaas_pool', 'pools', 'pool', pool_config))
+
+    async def adelete_lbaas_pool(self, pool_id):
+        async def delete(record):
+            members = await self._acall(
+                record, self._raw('list_lbaas_members'), pool_id)
+            await asyncio.gather(*[
+                self.adelete_lbaas_member(member['id'], pool_id)
+                for member in members['members']])
+            return await self._adelete(
+                record, 'delete_lbaas_pool', 'pools', pool_id)
+        return await self._timed('pool', 'delete', delete)
+
+    # members
+    async def acreate_lbaas_member(self, pool_id, member_config):
+        return await self._timed(
+            'member', 'create',
+            lambda record: self._acreate(
+                record, 'create_lbaas_member', 'members', 'member',
+                pool_id, member_config))
+
+    async def adelete_lbaas_member(self, member_id, pool_id):
+        return await self._timed(
+            'member', 'delete',
+            lambda record: self._adelete(
+                record, 'delete_lbaas_member', 'members', member_id,
+                pool_id))
+
+    # healthmonitors
+    async def acreate_lbaas_healthmonitor(self, monitor_config):
+        return await self._timed(
+            'healthmonitor', 'create',
+            lambda record: self._acreate(
+                record, 'create_lbaas_healthmonitor', 'healthmonitors',
+                'healthmonitor', monitor_config))
+
+    async def adelete_lbaas_healthmonitor(self, healthmonitor_id):
+        return await self._timed(
+            'healthmonitor', 'delete',
+            lambda record: self._adelete(
+                record, 'delete_lbaas_healthmonitor', 'healthmonitors',
+                healthmonitor_id))
+
+
+class AsyncHeatMixin(AsyncPollingMixin):
+    '''Coroutine stack operations for HeatClientPollingManager.
+
+    Like the blocking ones they follow the event stream or poll the stack
+    according to the manager's completion setting.
+    '''
+    async def _apoll_stack(self, record, stack_id, action):
+        terminal = (action + '_COMPLETE', action + '_FAILED')
+        stack = await self.await_until(
+            record, functools.partial(self.stacks.get, stack_id),
+            lambda current: self.stack_status(current) in terminal)
+        return await self._acall(record, self._check_stack, stack, action)
+
+    async def afollow_stack_events(self, record, stack_id, action,
+                                   marker=None):
+        new_events, seen = self._stack_event_probe(stack_id, action, marker)
+        last = (await self.await_until(record, new_events))[-1]
+        return self._check_stack_event(stack_id, action, last, seen)
+
+    async def acreate_stack(self, configuration):
+        async def create(record):
+            stack = await self._acall(
+                record, functools.partial(
+                    self.stacks.create,
+                    **self._stack_configuration(configuration)))
+            stack_id = stack['stack']['id']
+            if self.completion == 'poll':
+                return await self._apoll_stack(record, stack_id, 'CREATE')
+            await self.afollow_stack_events(record, stack_id, 'CREATE')
+            return await self._acall(record, self.stacks.get, stack_id)
+        return await self._timed('stack', 'create', create)
+
+    async def adelete_stack(self, stack_id):
+        async def delete(record):
+            if self.completion == 'poll':
+                await self._acall(record, self.stacks.delete, stack_id)
+                return await self._apoll_stack(record, stack_id, 'DELETE')
+            marker = await self._acall(record, self._latest_event_id,
+                                       stack_id)
+            await self._acall(record, self.stacks.delete, stack_id)
+            try:
+                return await self.afollow_stack_events(record, stack_id,
+                                                       'DELETE', marker)
+            except HTTPNotFound:
+                return None
+        return await self._timed('stack', 'delete', delete)
+
+
+@pytest.fixture(scope='session')
+def async_gather(request):
+    '''Run awaitables concurrently on one event loop and return results.'''
+    loop = asyncio.new_event_loop()
+    request.addfinalizer(loop.close)
+
+    async def gather_all(awaitables):
+        # Inside a coroutine gather binds to the running loop, not the
+        # thread's default one.
+        return await asyncio.gather(*awaitables)
+
+    def gather(*awaitables):
+        return loop.run_until_complete(gather_all(awaitables))
+    return gather
@@ -0,0 +1,115 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+'''One authenticated keystoneauth session for every client manager.
+
+   Passing the same session to the Neutron, Heat, Keystone and Glance
+managers means they authenticate once, share one token (re-authenticating
+when it expires) and reuse one pool of keep-alive connections instead of
+each opening their own.
+
+   Tokens are also cached on disk, so separate pytest runs and xdist workers
+reuse one token until it nears expiry rather than logging in each time.
+A 401 makes the session invalidate the token, which drops it from the cache
+too, and the retried request authenticates afresh.
+'''
+from f5_os_test.locked_json import LockedJSONFile
+from keystoneauth1.identity import v2
+from keystoneauth1 import session as ksa_session
+import os
+import requests
+
+
+# Keep-alive connections kept per host; raise it for concurrent teardown.
+DEFAULT_POOL_SIZE = 10
+
+DEFAULT_TOKEN_CACHE = os.path.join(
+    os.path.expanduser('~'), '.cache', 'f5_os_test', 'keystone_tokens.json')
+
+# Cached tokens this close to expiry are not handed out.
+EXPIRY_MARGIN = 300
+
+
+class TokenCache(LockedJSONFile):
+    '''Keystone auth states in a JSON file shared between processes.'''
+    def __init__(self, path=DEFAULT_TOKEN_CACHE):
+        super(TokenCache, self).__init__(path)
+
+
+class CachedPassword(v2.Password):
+    '''Keystone v2 password auth that shares its token through a TokenCache.
+
+    Entries are keyed by auth URL, tenant and user.
+    '''
+    def __init__(self, auth_url, token_cache, **kwargs):
+        super(CachedPassword, self).__init__(auth_url, **kwargs)
+        self.token_cache = token_cache
+        self.cache_key = '%s|%s|%s' % (auth_url, kwargs.get('tenant_name'),
+                                       kwargs.get('username'))
+
+    def get_auth_ref(self, session, **kwargs):
+        with self.token_cache.locked() as entries:
+            self.set_auth_state(entries.get(self.cache_key))
+            if self.auth_ref is not None and\
+                    not self.auth_ref.will_expire_soon(EXPIRY_MARGIN):
+                return self.auth_ref
+            auth_ref = super(CachedPassword, self).get_auth_ref(
+                session, **kwargs)
+            self._prune(entries)
+            self.auth_ref = auth_ref
+            # A token issued already expired, e.g. a replayed one, is used
+            # but never shared.
+            if not auth_ref.will_expire_soon(0):
+                entries[self.cache_key] = self.get_auth_state()
+            else:
+                entries.pop(self.cache_key, None)
+            return auth_ref
+
+    def _prune(self, entries):
+        '''Drop other keys' expired tokens; this key's is replaced anyway.'''
+        for key, state in list(entries.items()):
+            if key == self.cache_key:
+                continue
+            self.set_auth_state(state)
+            if self.auth_ref.will_expire_soon(0):
+                del entries[key]
+
+    def invalidate(self):
+        rejected = self.get_auth_state()
+        if rejected is not None:
+            with self.token_cache.locked() as entries:
+                # Another process may already have replaced it.
+                if entries.get(self.cache_key) == rejected:
+                    del entries[self.cache_key]
+        return super(CachedPassword, self).invalidate()
+
+
+def make_session(auth_url, username, password, tenant_name,
+                 pool_size=DEFAULT_POOL_SIZE, token_cache=None):
+    '''Return a keystoneauth Session using Keystone v2 password auth.
+
+    token_cache is a TokenCache; without one every session logs in.
+    '''
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                            pool_maxsize=pool_size)
+    http = requests.Session()
+    http.mount('http://', adapter)
+    http.mount('https://', adapter)
+    credentials = dict(username=username, password=password,
+                       tenant_name=tenant_name)
+    if token_cache is None:
+        auth = v2.Password(auth_url=auth_url, **credentials)
+    else:
+        auth = CachedPassword(auth_url, token_cache, **credentials)
+    return ksa_session.Session(auth=auth, session=http)
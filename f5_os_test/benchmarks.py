@@ -0,0 +1,350 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+'''Throughput benchmarks for the polling managers and fixtures.
+
+   Every scenario runs against the in-process FakeOpenStack, so the numbers
+measure this package's own behaviour: how many API calls it makes, how long
+it sleeps and how much memory it holds, for a fixed backend latency.  Run
+
+    python -m f5_os_test.benchmarks --json results.json
+    python -m f5_os_test.benchmarks --compare results.json
+
+The second form re-runs the scenarios and exits non-zero when a metric is
+worse than the saved run by more than --tolerance.
+
+   Each scenario runs twice: once for its time, calls and sleeps, and once
+more under tracemalloc for its peak memory, since tracing slows the client
+enough to change how often it polls.
+'''
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from f5_os_test.auth_session import make_session
+from f5_os_test.fake_openstack import FakeOpenStackServer
+from f5_os_test import polling_clients
+from f5_os_test import teardown
+from f5_os_test.timing import RECORDER
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+# Metrics compared between runs; all of them are better when lower.
+COMPARED_METRICS = ('wall_time', 'api_calls', 'sleep_time', 'peak_memory')
+
+FIXTURE_PLUGINS = ('f5_os_test.polling_clients',
+                   'f5_os_test.infrastructure',
+                   'f5_os_test.heat_client_utils',
+                   'f5_os_test.timing',
+                   'f5_os_test.fake_openstack',
+                   'f5_os_test.async_polling')
+
+FULL_TREE_TEST = '''
+def test_full_tree(setup_with_healthmonitor):
+    nclientmanager, healthmonitor, pool, member = setup_with_healthmonitor
+    assert healthmonitor['healthmonitor']['id']
+'''
+
+STACK_TEMPLATE = '''heat_template_version: 2015-04-30
+resources:
+  first: {type: 'OS::Heat::None'}
+  second: {type: 'OS::Heat::None'}
+'''
+
+
+class BenchmarkEnvironment(object):
+    '''A FakeOpenStack plus factories for managers pointed at it.'''
+    def __init__(self, delay, wait_strategy, trace_memory=False):
+        self.delay = delay
+        self.wait_strategy = wait_strategy
+        self.trace_memory = trace_memory
+        self.server = FakeOpenStackServer().start()
+        self.backend = self.server.backend
+        self.backend.delay = 0
+        self.session = make_session(
+            self.backend.endpoints['identity'], 'testlab', 'changeme',
+            self.backend.tenant_name)
+        self.extra_calls = 0
+        self.measured_time = None
+        self.result = None
+
+    def close(self):
+        self.server.stop()
+
+    def neutron(self):
+        return polling_clients.NeutronClientPollingManager(
+            session=self.session, wait_strategy=self.wait_strategy)
+
+    def heat(self):
+        return polling_clients.HeatClientPollingManager(
+            endpoint=self.backend.endpoints['orchestration'],
+            session=self.session, wait_strategy=self.wait_strategy)
+
+    def subnet(self, role):
+        for subnet in self.backend.subnets.values():
+            if role in subnet['name']:
+                return subnet
+
+    @contextmanager
+    def measure(self):
+        '''Measure the enclosed block; setup before it runs with no delay.
+
+        With trace_memory only peak_memory is meaningful.  A scenario that
+        knows better what to time sets measured_time inside the block.
+        '''
+        self.backend.delay = self.delay
+        self.backend.calls.clear()
+        self.extra_calls = 0
+        self.measured_time = None
+        RECORDER.clear()
+        if self.trace_memory:
+            tracemalloc.start()
+        started = time.time()
+        try:
+            yield
+        finally:
+            wall_time = time.time() - started
+            peak = None
+            if self.trace_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            self.backend.delay = 0
+            self.result = {
+                'wall_time': wall_time if self.measured_time is None
+                else self.measured_time,
+                'api_calls': sum(self.backend.calls.values()) +
+                self.extra_calls,
+                'sleep_time': sum(record.sleep_time
+                                  for record in RECORDER.records),
+                'peak_memory': peak}
+
+
+def _build_tree(nclientmanager, subnet, name, members=0, monitor=False):
+    lb = nclientmanager.create_loadbalancer({'loadbalancer': {
+        'vip_subnet_id': subnet['id'], 'name': name}})
+    listener = nclientmanager.create_listener({'listener': {
+        'loadbalancer_id': lb['loadbalancer']['id'], 'protocol': 'HTTP',
+        'protocol_port': 80, 'name': name}})
+    pool = nclientmanager.create_lbaas_pool({'pool': {
+        'listener_id': listener['listener']['id'], 'protocol': 'HTTP',
+        'lb_algorithm': 'ROUND_ROBIN', 'name': name}})
+    for index in range(members):
+        nclientmanager.create_lbaas_member(pool['pool']['id'], {'member': {
+            'subnet_id': subnet['id'], 'address': '10.2.1.%d' % index,
+            'protocol_port': 80}})
+    if monitor:
+        nclientmanager.create_lbaas_healthmonitor({'healthmonitor': {
+            'pool_id': pool['pool']['id'], 'type': 'HTTP', 'delay': 3,
+            'timeout': 13, 'max_retries': 7}})
+    return lb, pool
+
+
+class _CallCollector(object):
+    '''pytest plugin that hands the fixture run's calls and time back.
+
+    The time is the sum of pytest's own setup, call and teardown durations,
+    so pytest's start-up and collection are left out.
+    '''
+    def __init__(self, env):
+        self.env = env
+        self.duration = 0.
+
+    def pytest_runtest_logreport(self, report):
+        self.duration = self.duration + report.duration
+
+    def pytest_sessionfinish(self, session):
+        server = getattr(session.config, 'fake_openstack', None)
+        if server is not None:
+            self.env.extra_calls = sum(server.backend.calls.values())
+
+
+def _plugin_args():
+    '''-p arguments for the fixture plugins pytest has not loaded itself.'''
+    try:
+        from importlib.metadata import entry_points
+        installed = set(ep.value for ep in
+                        entry_points().select(group='pytest11'))
+    except (ImportError, AttributeError):
+        installed = set()
+    args = []
+    for plugin in FIXTURE_PLUGINS:
+        if plugin not in installed:
+            args.extend(['-p', plugin])
+    return args
+
+
+def lb_full_tree(env):
+    '''The setup_with_healthmonitor fixture chain, run through pytest.'''
+    import pytest
+    directory = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(directory, 'test_tree.py'), 'w') as test:
+            test.write(FULL_TREE_TEST)
+        args = [directory, '-q', '-p', 'no:cacheprovider',
+                '--import-mode', 'importlib',
+                '--fake-openstack',
+                '--fake-openstack-delay', str(env.delay),
+                '--wait-strategy', env.wait_strategy] + _plugin_args()
+        collector = _CallCollector(env)
+        with env.measure():
+            code = pytest.main(args, plugins=[collector])
+            env.measured_time = collector.duration
+        if code != 0:
+            raise RuntimeError('fixture chain failed with exit code %s' %
+                               code)
+    finally:
+        shutil.rmtree(directory)
+
+
+def members_in_one_pool(env, count=50):
+    '''Add members one at a time to a single pool.'''
+    nclientmanager = env.neutron()
+    server_subnet = env.subnet('server-v4')
+    _, pool = _build_tree(nclientmanager, env.subnet('client-v4'), 'bench')
+    with env.measure():
+        for index in range(count):
+            nclientmanager.create_lbaas_member(pool['pool']['id'], {
+                'member': {'subnet_id': server_subnet['id'],
+                           'address': '10.2.0.%d' % (index + 10),
+                           'protocol_port': 80}})
+
+
+def members_in_one_pool_bulk(env, count=50):
+    '''Add the same members to a single pool in one bulk call.'''
+    nclientmanager = env.neutron()
+    server_subnet = env.subnet('server-v4')
+    _, pool = _build_tree(nclientmanager, env.subnet('client-v4'), 'bench')
+    with env.measure():
+        nclientmanager.create_lbaas_members(pool['pool']['id'], [
+            {'member': {'subnet_id': server_subnet['id'],
+                        'address': '10.2.0.%d' % (index + 10),
+                        'protocol_port': 80}} for index in range(count)])
+
+
+def teardown_stale_objects(env, trees=20):
+    '''Sweep 200 leftover objects: 20 trees of 10 objects each.'''
+    nclientmanager = env.neutron()
+    for index in range(trees):
+        _build_tree(nclientmanager, env.subnet('client-v4'),
+                    'stale-%d' % index, members=6, monitor=True)
+    with env.measure():
+        teardown.delete_all(nclientmanager)
+
+
+def concurrent_heat_stacks(env, count=10):
+    '''Create and delete several stacks at once.'''
+    heatclientmanager = env.heat()
+
+    def cycle(index):
+        stack = heatclientmanager.create_stack({
+            'stack_name': 'bench-%d' % index, 'template': STACK_TEMPLATE,
+            'parameters': {}})
+        heatclientmanager.delete_stack(stack.id)
+    with env.measure():
+        with ThreadPoolExecutor(max_workers=count) as executor:
+            list(executor.map(cycle, range(count)))
+
+
+SCENARIOS = OrderedDict([
+    ('lb_full_tree', lb_full_tree),
+    ('members_50_one_pool', members_in_one_pool),
+    ('members_50_bulk', members_in_one_pool_bulk),
+    ('teardown_200_stale', teardown_stale_objects),
+    ('heat_10_concurrent', concurrent_heat_stacks),
+])
+
+
+def _run_scenario(name, delay, wait_strategy, trace_memory):
+    env = BenchmarkEnvironment(delay, wait_strategy, trace_memory)
+    try:
+        SCENARIOS[name](env)
+    finally:
+        env.close()
+    return env.result
+
+
+def run(names, delay, wait_strategy):
+    results = OrderedDict()
+    for name in names:
+        result = _run_scenario(name, delay, wait_strategy, False)
+        result['peak_memory'] = _run_scenario(
+            name, delay, wait_strategy, True)['peak_memory']
+        results[name] = result
+    return {'meta': {'python': platform.python_version(),
+                     'delay': delay,
+                     'wait_strategy': wait_strategy,
+                     'timestamp': time.time()},
+            'scenarios': results}
+
+
+def compare(baseline, current, tolerance):
+    '''List (scenario, metric, old, new) for metrics worse than tolerance.'''
+    regressions = []
+    for name, metrics in current['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if not previous:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = previous.get(metric), metrics[metric]
+            if old and new > old * (1 + tolerance):
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='Run only this scenario; may be repeated.')
+    parser.add_argument('--delay', type=float, default=.05,
+                        help='Seconds the fake backend spends in PENDING '
+                             'states.')
+    parser.add_argument('--wait-strategy', default='exponential',
+                        help='Wait strategy given to every manager.')
+    parser.add_argument('--json', help='Write the results to this file.')
+    parser.add_argument('--compare',
+                        help='Fail on regressions against this results '
+                             'file.')
+    parser.add_argument('--tolerance', type=float, default=.2,
+                        help='Allowed fractional slowdown per metric.')
+    options = parser.parse_args(argv)
+    results = run(options.scenario or list(SCENARIOS), options.delay,
+                  options.wait_strategy)
+    for name, metrics in results['scenarios'].items():
+        sys.stdout.write('%-22s %8.2fs %6d calls %8.2fs sleep %10d B\n' % (
+            name, metrics['wall_time'], metrics['api_calls'],
+            metrics['sleep_time'], metrics['peak_memory']))
+    if options.json:
+        with open(options.json, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
+    if options.compare:
+        with open(options.compare) as baseline_file:
+            regressions = compare(json.load(baseline_file), results,
+                                  options.tolerance)
+        for name, metric, old, new in regressions:
+            sys.stdout.write('REGRESSION %s %s: %s -> %s\n' % (
+                name, metric, old, new))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+'''Session-wide BIG-IP connections, made on first use and reused after.
+
+   Building a BigIP object logs in and loads the REST API, so the devices
+are connected once per session.  Before a connection is handed out again a
+single cheap request checks that it still works, and a dead one is rebuilt.
+All devices, e.g. both members of an HA pair, send their requests through
+one connection pool.
+'''
+from f5.bigip import BigIP
+import requests
+import threading
+
+
+# Keep-alive connections kept per device.
+DEFAULT_POOL_SIZE = 4
+
+
+class BigIPDevices(object):
+    '''Lazily connected BigIP objects for one or more devices.'''
+    def __init__(self, netlocs, username, password,
+                 pool_size=DEFAULT_POOL_SIZE):
+        self.netlocs = list(netlocs)
+        self.username = username
+        self.password = password
+        self.adapter = requests.adapters.HTTPAdapter(
+            pool_connections=len(self.netlocs) or 1, pool_maxsize=pool_size)
+        self._lock = threading.Lock()
+        self._connected = {}
+
+    def _connect(self, netloc):
+        bigip = BigIP(netloc, self.username, self.password)
+        bigip._meta_data['icr_session'].session.mount('https://',
+                                                      self.adapter)
+        return bigip
+
+    @staticmethod
+    def is_alive(bigip):
+        try:
+            bigip._meta_data['icr_session'].get(
+                bigip._meta_data['uri'] + 'sys/version')
+        except Exception:
+            return False
+        return True
+
+    def device(self, netloc=None):
+        '''The connected BigIP for netloc, by default the first device.'''
+        netloc = netloc or self.netlocs[0]
+        with self._lock:
+            bigip = self._connected.get(netloc)
+            if bigip is None or not self.is_alive(bigip):
+                bigip = self._connected[netloc] = self._connect(netloc)
+            return bigip
+
+    def devices(self):
+        '''Connected BigIPs for every device, in the order given.'''
+        return [self.device(netloc) for netloc in self.netlocs]
+
+    def close(self):
+        with self._lock:
+            self._connected = {}
+        self.adapter.close()
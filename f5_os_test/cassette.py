@@ -0,0 +1,179 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+'''Record the suite's HTTP traffic to a cassette and replay it later.
+
+   Every client the managers and the bigip fixture use, Keystone, Neutron,
+Heat, Glance and iControl REST alike, goes through requests'
+HTTPAdapter.send, so that is the one place patched.
+
+    py.test --cassette run.json.gz --cassette-mode record ...
+    py.test --cassette run.json.gz ...
+
+Replay answers each request with the next response recorded for the same
+method, path and query, ignoring host and body, so generated names and a
+different --auth-netloc do not matter; options that end up in paths,
+such as --os-tenant-id, must match the recording.  The polling managers
+skip their sleeps while replaying, since nothing changes between probes
+except what the cassette says.
+'''
+from collections import deque
+import datetime
+from f5_os_test.async_polling import AsyncPollingMixin
+from f5_os_test.polling_clients import PollingMixin
+import gzip
+import json
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+import threading
+from urllib.parse import parse_qsl
+from urllib.parse import urlencode
+from urllib.parse import urlsplit
+
+
+class CassetteMiss(Exception):
+    '''A replayed request that was never recorded.'''
+
+
+def request_key(method, url):
+    '''Match requests on method, path and sorted query only.'''
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return '%s %s?%s' % (method, parts.path, query)
+
+
+def _encode_body(content):
+    try:
+        return {'text': content.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'latin1': content.decode('latin-1')}
+
+
+def _decode_body(body):
+    if 'text' in body:
+        return body['text'].encode('utf-8')
+    return body['latin1'].encode('latin-1')
+
+
+class Cassette(object):
+    '''Recorded exchanges, kept in order per request_key.'''
+    def __init__(self, path):
+        self.path = path
+        self.interactions = []
+        self._queues = {}
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        with gzip.open(self.path, 'rt') as cassette_file:
+            self.interactions = json.load(cassette_file)['interactions']
+        for interaction in self.interactions:
+            self._queues.setdefault(interaction['key'], deque()).append(
+                interaction)
+        return self
+
+    def save(self):
+        with gzip.open(self.path, 'wt') as cassette_file:
+            json.dump({'interactions': self.interactions}, cassette_file,
+                      separators=(',', ':'))
+
+    def record(self, request, response):
+        interaction = {'key': request_key(request.method, request.url),
+                       'status': response.status_code,
+                       'reason': response.reason,
+                       'headers': dict(response.headers),
+                       'body': _encode_body(response.content)}
+        with self._lock:
+            self.interactions.append(interaction)
+
+    def play(self, request):
+        '''Build the response recorded for request.
+
+        Once a key's recordings run out its last response is repeated.
+        '''
+        key = request_key(request.method, request.url)
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue:
+                self._last[key] = queue.popleft()
+            interaction = self._last.get(key)
+        if interaction is None:
+            raise CassetteMiss('No recorded response for %s' % key)
+        response = requests.Response()
+        response.status_code = interaction['status']
+        response.reason = interaction['reason']
+        response.headers = CaseInsensitiveDict(interaction['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = _decode_body(interaction['body'])
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.elapsed = datetime.timedelta(0)
+        return response
+
+
+_original_send = HTTPAdapter.send
+
+
+def install(cassette, mode):
+    '''Route every HTTPAdapter.send through cassette.'''
+
+    def send(adapter, request, **kwargs):
+        if mode == 'replay':
+            response = cassette.play(request)
+            response.connection = adapter
+            return response
+        response = _original_send(adapter, request, **kwargs)
+        cassette.record(request, response)
+        return response
+    HTTPAdapter.send = send
+    skip = mode == 'replay'
+    PollingMixin.skip_sleeps = AsyncPollingMixin.skip_sleeps = skip
+
+
+def uninstall():
+    HTTPAdapter.send = _original_send
+    PollingMixin.skip_sleeps = AsyncPollingMixin.skip_sleeps = False
+
+
+def pytest_addoption(parser):
+    parser.addoption("--cassette", action="store", default=None,
+                     help="Gzipped JSON file of recorded HTTP exchanges.")
+    parser.addoption("--cassette-mode", action="store",
+                     choices=('record', 'replay'), default='replay',
+                     help="Record this run into --cassette, or answer it "
+                          "from --cassette without any network.")
+
+
+def pytest_configure(config):
+    path = config.getoption('--cassette')
+    if not path:
+        return
+    mode = config.getoption('--cassette-mode')
+    cassette = Cassette(path)
+    if mode == 'replay':
+        cassette.load()
+    install(cassette, mode)
+    config.cassette = cassette
+
+
+def pytest_unconfigure(config):
+    cassette = getattr(config, 'cassette', None)
+    if cassette is None:
+        return
+    uninstall()
+    if config.getoption('--cassette-mode') == 'record':
+        cassette.save()
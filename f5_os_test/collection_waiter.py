@@ -0,0 +1,103 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+'''Coalesce concurrent existence checks against a Neutron collection.
+
+   Waiters register the ids they care about under a collection key and ask
+for a snapshot of which ids the collection currently holds.  When several
+waiters ask for the same key at the same time only one of them performs the
+list call; the others block until it returns and share its result.  The
+fetch function receives the union of all ids pending on that key, so it can
+narrow the query if the API allows it, and returns the listed resources as
+a dict keyed by id.
+
+   A snapshot is only ever shared with waiters whose ids the in-flight fetch
+already covers; anyone else waits for the next fetch.  A fetch that started
+before a create or delete finished can only make a waiter sleep one more
+tick, never report a false success.
+'''
+from collections import Counter
+from contextlib import contextmanager
+import threading
+
+
+class _Tick(object):
+    def __init__(self):
+        self.started = 0
+        self.completed = 0
+        self.in_flight = None
+        self.result = {}
+
+
+class CollectionWaiter(object):
+    '''Share one list call per tick among waiters on the same collection.'''
+    def __init__(self, fetch):
+        self._fetch = fetch
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._ticks = {}
+
+    @contextmanager
+    def pending(self, key, resource_ids):
+        '''Register resource_ids as awaited on key for the enclosed block.'''
+        with self._cond:
+            self._pending.setdefault(key, Counter()).update(resource_ids)
+        try:
+            yield
+        finally:
+            with self._cond:
+                remaining = self._pending[key]
+                remaining.subtract(resource_ids)
+                remaining += Counter()
+                if remaining:
+                    self._pending[key] = remaining
+                else:
+                    del self._pending[key]
+
+    def pending_ids(self, key):
+        with self._cond:
+            return frozenset(self._pending.get(key, ()))
+
+    def snapshot(self, key, resource_ids):
+        '''Return what a fetch covering resource_ids listed under key.
+
+        The result is the fetch's dict of resources by id, shared between
+        waiters, so treat it as read-only.
+        '''
+        resource_ids = frozenset(resource_ids)
+        with self._cond:
+            tick = self._ticks.setdefault(key, _Tick())
+            if tick.in_flight is not None and resource_ids <= tick.in_flight:
+                wanted = tick.started
+            else:
+                wanted = tick.started + 1
+            while tick.completed < wanted:
+                if tick.in_flight is not None:
+                    self._cond.wait()
+                    continue
+                tick.started = tick.started + 1
+                generation = tick.started
+                requested = frozenset(self._pending.get(key, ())) |\
+                    resource_ids
+                tick.in_flight = requested
+                self._cond.release()
+                try:
+                    found = self._fetch(key, requested)
+                finally:
+                    self._cond.acquire()
+                    tick.in_flight = None
+                    self._cond.notify_all()
+                tick.result = dict(found)
+                tick.completed = generation
+            return tick.result
@@ -0,0 +1,57 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+'''Exceptions raised by the polling managers.
+
+   polling_clients re-exports them, so they can still be imported from
+there.
+'''
+
+
+class MaximumNumberOfAttemptsExceeded(Exception):
+    pass
+
+
+class ProvisioningFailed(Exception):
+    '''A Neutron resource went into a failed provisioning_status.
+
+    observed is the last representation of it that was read.
+    '''
+    def __init__(self, resource, resource_id, observed):
+        super(ProvisioningFailed, self).__init__(
+            '%s %s is %s' % (resource, resource_id,
+                             observed.get('provisioning_status')))
+        self.resource = resource
+        self.resource_id = resource_id
+        self.observed = observed
+
+
+class ImageUploadFailed(Exception):
+    '''An image was killed, or holds other bytes than were uploaded.'''
+    def __init__(self, image_id, reason, observed):
+        super(ImageUploadFailed, self).__init__(
+            'Image %s: %s' % (image_id, reason))
+        self.image_id = image_id
+        self.observed = observed
+
+
+class StackFailed(Exception):
+    '''A stack ended its action FAILED; events are its failed resources.'''
+    def __init__(self, stack_id, status, reason, events):
+        super(StackFailed, self).__init__(
+            'Stack %s is %s: %s' % (stack_id, status, reason))
+        self.stack_id = stack_id
+        self.status = status
+        self.reason = reason
+        self.events = events
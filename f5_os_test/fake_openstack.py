@@ -0,0 +1,939 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+'''An in-process stand-in for the OpenStack APIs the polling managers use.
+
+   FakeOpenStack serves the Keystone v2 token API, the Neutron LBaaS v2,
+network and subnet APIs, the Heat v1 stack API and the Glance v2 image API
+from one local HTTP server.  It is not an emulator; it models just enough
+behaviour to exercise the polling and teardown logic:
+
+* loadbalancers sit in PENDING_CREATE/PENDING_UPDATE/PENDING_DELETE for
+  ``delay`` seconds after each change to them or their children, and any
+  change to a busy loadbalancer tree is refused with StateInvalid (409);
+* ``contention`` is the probability that a change is refused with
+  StateInvalid even when the tree is idle, standing in for the agent;
+* stacks and images move through their IN_PROGRESS/saving states on the
+  same ``delay``;
+* anything whose name is in ``fail_names`` ends in ERROR (CREATE_FAILED
+  for stacks, killed for images), and a stack whose name is in
+  ``fail_deletes`` ends its delete DELETE_FAILED.
+
+State only advances when a request arrives, so there are no background
+threads besides the server's own.  Enable the plugin with --fake-openstack
+and every fixture in infrastructure talks to it instead of --auth-netloc.
+'''
+from collections import Counter
+import datetime
+import hashlib
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+import json
+import random
+import re
+from socketserver import ThreadingMixIn
+import threading
+import time
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+import uuid
+
+
+TENANT_ID = 'fa4e0f1c6f7e4c1e9f3c0d5a7b2e8c11'
+TENANT_NAME = 'testlab'
+
+IMAGE_SCHEMA = {
+    'name': 'image',
+    'additionalProperties': {'type': 'string'},
+    'links': [{'href': '{self}', 'rel': 'self'},
+              {'href': '{file}', 'rel': 'enclosure'},
+              {'href': '{schema}', 'rel': 'describedby'}],
+    'properties': dict(
+        [(name, {'type': ['null', 'string']}) for name in (
+            'id', 'name', 'status', 'visibility', 'checksum', 'owner',
+            'container_format', 'disk_format', 'created_at', 'updated_at',
+            'self', 'file', 'schema', 'os_hash_algo', 'os_hash_value')] +
+        [(name, {'type': ['null', 'integer']}) for name in (
+            'size', 'virtual_size', 'min_disk', 'min_ram')] +
+        [('protected', {'type': 'boolean'}),
+         ('tags', {'type': 'array', 'items': {'type': 'string'}})])
+}
+
+
+class FakeError(Exception):
+    '''An API error; rendered in the owning service's error format.'''
+    def __init__(self, status, error_type, message=''):
+        super(FakeError, self).__init__(message)
+        self.status = status
+        self.error_type = error_type
+        self.message = message
+
+
+def _now():
+    return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _new_id():
+    return str(uuid.uuid4())
+
+
+def _refs(ids):
+    return [{'id': resource_id} for resource_id in ids]
+
+
+class FakeOpenStack(object):
+    '''State and behaviour behind the stand-in services.'''
+    def __init__(self, delay=0., contention=0., fail_names=(),
+                 fail_deletes=(), tenant_id=TENANT_ID, tenant_name=TENANT_NAME,
+                 token_lifetime=3600):
+        self.delay = delay
+        self.contention = contention
+        self.fail_names = set(fail_names)
+        self.fail_deletes = set(fail_deletes)
+        self.tenant_id = tenant_id
+        self.tenant_name = tenant_name
+        # Seconds a token is valid for; negative issues expired tokens.
+        self.token_lifetime = token_lifetime
+        self.base_url = None
+        self.calls = Counter()
+        self.tokens = set()
+        self._lock = threading.RLock()
+        self._busy = {}
+        self.loadbalancers = {}
+        self.listeners = {}
+        self.pools = {}
+        self.members = {}
+        self.healthmonitors = {}
+        self.networks = {}
+        self.subnets = {}
+        self.stacks = {}
+        self.images = {}
+        self._seed_topology()
+
+    # Topology seeded for the fixtures' subnet lookups
+    def _seed_topology(self):
+        for role, octet in (('client', 1), ('server', 2)):
+            network_id = _new_id()
+            subnet_id = _new_id()
+            self.networks[network_id] = {
+                'id': network_id, 'name': '%s-net' % role,
+                'tenant_id': self.tenant_id, 'subnets': [subnet_id],
+                'status': 'ACTIVE', 'admin_state_up': True, 'shared': False}
+            self.subnets[subnet_id] = {
+                'id': subnet_id, 'name': '%s-v4-subnet' % role,
+                'network_id': network_id, 'tenant_id': self.tenant_id,
+                'ip_version': 4, 'cidr': '10.%d.0.0/24' % octet,
+                'gateway_ip': '10.%d.0.1' % octet, 'enable_dhcp': True,
+                'allocation_pools': [{'start': '10.%d.0.10' % octet,
+                                      'end': '10.%d.0.250' % octet}]}
+
+    @property
+    def endpoints(self):
+        '''Service URLs, keyed like the Keystone catalog's service types.'''
+        return {'identity': self.base_url + '/v2.0',
+                'network': self.base_url,
+                'orchestration': '%s/v1/%s' % (self.base_url, self.tenant_id),
+                'image': self.base_url}
+
+    # Keystone
+    def issue_token(self, body):
+        auth = body.get('auth', {})
+        if 'token' in auth and auth['token'].get('id') not in self.tokens:
+            raise FakeError(401, 'Unauthorized', 'The token is not valid.')
+        token = uuid.uuid4().hex
+        self.tokens.add(token)
+        expires = datetime.datetime.utcnow() + datetime.timedelta(
+            seconds=self.token_lifetime)
+        catalog = []
+        for service_type, name in (('identity', 'keystone'),
+                                   ('network', 'neutron'),
+                                   ('orchestration', 'heat'),
+                                   ('image', 'glance')):
+            url = self.endpoints[service_type]
+            catalog.append({
+                'type': service_type, 'name': name, 'endpoints_links': [],
+                'endpoints': [{'id': uuid.uuid4().hex, 'region': 'RegionOne',
+                               'publicURL': url, 'internalURL': url,
+                               'adminURL': url}]})
+        username = auth.get('passwordCredentials', {}).get('username', 'test')
+        return {'access': {
+            'token': {'id': token, 'issued_at': _now(),
+                      'expires': expires.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                      'tenant': {'id': self.tenant_id,
+                                 'name': self.tenant_name,
+                                 'enabled': True, 'description': None}},
+            'serviceCatalog': catalog,
+            'user': {'id': uuid.uuid4().hex, 'name': username,
+                     'username': username, 'roles_links': [],
+                     'roles': [{'name': 'admin'}]},
+            'metadata': {'is_admin': 0, 'roles': []}}}
+
+    def revoke_tokens(self):
+        '''Forget every issued token, as a Keystone restart would.'''
+        with self._lock:
+            self.tokens.clear()
+
+    # LBaaS state machine
+    def _settle(self):
+        now = time.time()
+        for lbid, busy in list(self._busy.items()):
+            if busy['until'] > now:
+                continue
+            del self._busy[lbid]
+            lb = self.loadbalancers[lbid]
+            for kind, resource_id, action in busy['children']:
+                collection = getattr(self, kind)
+                if resource_id not in collection:
+                    continue
+                child = collection[resource_id]
+                if action == 'delete':
+                    self._remove(kind, resource_id)
+                elif child.get('name') in self.fail_names:
+                    child['provisioning_status'] = 'ERROR'
+                else:
+                    child['provisioning_status'] = 'ACTIVE'
+            if busy['action'] == 'delete':
+                del self.loadbalancers[lbid]
+            elif busy['action'] == 'create' and lb['name'] in self.fail_names:
+                lb['provisioning_status'] = 'ERROR'
+            else:
+                lb['provisioning_status'] = 'ACTIVE'
+
+    def _mark_busy(self, lbid, action, child=None):
+        lb = self.loadbalancers[lbid]
+        lb['provisioning_status'] = {'create': 'PENDING_CREATE',
+                                     'delete': 'PENDING_DELETE'}.get(
+                                         action, 'PENDING_UPDATE')
+        self._busy[lbid] = {'until': time.time() + self.delay,
+                            'action': action,
+                            'children': [child] if child else []}
+        self._settle()
+
+    def _check_idle(self, lbid, allow_error=False):
+        status = self.loadbalancers[lbid]['provisioning_status']
+        if lbid in self._busy or (status == 'ERROR' and not allow_error):
+            raise FakeError(409, 'StateInvalid',
+                            'Invalid state %s of loadbalancer resource %s' %
+                            (status, lbid))
+        if self.contention and random.random() < self.contention:
+            raise FakeError(409, 'StateInvalid',
+                            'Invalid state PENDING_UPDATE of loadbalancer '
+                            'resource %s' % lbid)
+
+    def _get(self, kind, resource_id):
+        collection = getattr(self, kind)
+        if resource_id not in collection:
+            raise FakeError(404, 'NotFound', '%s %s could not be found' %
+                            (kind, resource_id))
+        return collection[resource_id]
+
+    def _remove(self, kind, resource_id):
+        resource = getattr(self, kind).pop(resource_id)
+        if kind == 'listeners':
+            lb = self.loadbalancers[resource['loadbalancers'][0]['id']]
+            lb['listeners'] = [ref for ref in lb['listeners']
+                               if ref['id'] != resource_id]
+        elif kind == 'pools':
+            for member_id in _ids(resource['members']):
+                self.members.pop(member_id, None)
+            for hm in self.healthmonitors.values():
+                hm['pools'] = [ref for ref in hm['pools']
+                               if ref['id'] != resource_id]
+            for listener in self.listeners.values():
+                if listener['default_pool_id'] == resource_id:
+                    listener['default_pool_id'] = None
+            lb = self.loadbalancers[resource['loadbalancers'][0]['id']]
+            lb['pools'] = [ref for ref in lb['pools']
+                           if ref['id'] != resource_id]
+        elif kind == 'members':
+            pool = self.pools[resource['pool_id']]
+            pool['members'] = [ref for ref in pool['members']
+                               if ref['id'] != resource_id]
+        elif kind == 'healthmonitors':
+            for pool_id in _ids(resource['pools']):
+                self.pools[pool_id]['healthmonitor_id'] = None
+
+    def _lb_of(self, kind, resource):
+        '''The loadbalancer a child hangs off, or None if orphaned.'''
+        if kind == 'healthmonitors':
+            if not resource['pools']:
+                return None
+            resource = self.pools[resource['pools'][0]['id']]
+        elif kind == 'members':
+            resource = self.pools[resource['pool_id']]
+        return resource['loadbalancers'][0]['id']
+
+    def create_lbaas(self, kind, body, pool_id=None):
+        with self._lock:
+            self._settle()
+            resource = dict(body)
+            resource.setdefault('tenant_id', self.tenant_id)
+            resource.setdefault('name', '')
+            resource.setdefault('description', '')
+            resource.setdefault('admin_state_up', True)
+            resource['id'] = _new_id()
+            resource['provisioning_status'] = 'PENDING_CREATE'
+            resource['operating_status'] = 'OFFLINE'
+            if kind == 'loadbalancers':
+                subnet = self._get('subnets', resource['vip_subnet_id'])
+                resource.setdefault('vip_address', subnet['allocation_pools']
+                                    [0]['start'])
+                resource.update(vip_port_id=_new_id(), listeners=[],
+                                pools=[], provider='f5networks')
+                self.loadbalancers[resource['id']] = resource
+                self._mark_busy(resource['id'], 'create')
+                return resource
+            # (object, key) pairs pointed at the new id once it is accepted
+            backrefs = []
+            if kind == 'listeners':
+                lbid = resource.pop('loadbalancer_id')
+                self._get('loadbalancers', lbid)
+                resource.update(loadbalancers=_refs([lbid]),
+                                default_pool_id=None, connection_limit=-1,
+                                sni_container_refs=[],
+                                default_tls_container_ref=None)
+                parent_refs = self.loadbalancers[lbid]['listeners']
+            elif kind == 'pools':
+                listener_id = resource.pop('listener_id', None)
+                if listener_id:
+                    listener = self._get('listeners', listener_id)
+                    lbid = listener['loadbalancers'][0]['id']
+                    backrefs.append((listener, 'default_pool_id'))
+                else:
+                    lbid = resource.pop('loadbalancer_id')
+                    self._get('loadbalancers', lbid)
+                resource.update(
+                    listeners=_refs([listener_id] if listener_id else []),
+                    loadbalancers=_refs([lbid]), members=[],
+                    healthmonitor_id=None, session_persistence=None)
+                parent_refs = self.loadbalancers[lbid]['pools']
+            elif kind == 'members':
+                pool = self._get('pools', pool_id)
+                lbid = pool['loadbalancers'][0]['id']
+                resource.setdefault('weight', 1)
+                resource['pool_id'] = pool_id
+                parent_refs = pool['members']
+            else:
+                pool = self._get('pools', resource.pop('pool_id'))
+                if pool['healthmonitor_id']:
+                    raise FakeError(409, 'OneHealthMonitorPerPool',
+                                    'Only one health monitor per pool')
+                lbid = pool['loadbalancers'][0]['id']
+                resource.setdefault('http_method', 'GET')
+                resource.setdefault('url_path', '/')
+                resource.setdefault('expected_codes', '200')
+                resource['pools'] = _refs([pool['id']])
+                backrefs.append((pool, 'healthmonitor_id'))
+                parent_refs = []
+            self._check_idle(lbid)
+            for owner, key in backrefs:
+                owner[key] = resource['id']
+            getattr(self, kind)[resource['id']] = resource
+            parent_refs.append({'id': resource['id']})
+            self._mark_busy(lbid, 'update', (kind, resource['id'], 'create'))
+            return resource
+
+    def update_lbaas(self, kind, resource_id, body):
+        with self._lock:
+            self._settle()
+            resource = self._get(kind, resource_id)
+            lbid = resource_id if kind == 'loadbalancers' else\
+                self._lb_of(kind, resource)
+            if lbid is None:
+                resource.update(body)
+                return resource
+            self._check_idle(lbid)
+            resource.update(body)
+            self._mark_busy(lbid, 'update')
+            return resource
+
+    def delete_lbaas(self, kind, resource_id):
+        with self._lock:
+            self._settle()
+            resource = self._get(kind, resource_id)
+            if kind == 'loadbalancers':
+                if resource['listeners'] or resource['pools']:
+                    raise FakeError(409, 'EntityInUse',
+                                    'Loadbalancer %s is in use' % resource_id)
+                self._check_idle(resource_id, allow_error=True)
+                self._mark_busy(resource_id, 'delete')
+                return
+            if kind == 'listeners' and resource['default_pool_id']:
+                raise FakeError(409, 'EntityInUse',
+                                'Listener %s is in use' % resource_id)
+            lbid = self._lb_of(kind, resource)
+            if lbid is None:
+                self._remove(kind, resource_id)
+                return
+            self._check_idle(lbid)
+            resource['provisioning_status'] = 'PENDING_DELETE'
+            self._mark_busy(lbid, 'update', (kind, resource_id, 'delete'))
+
+    def show(self, kind, resource_id):
+        with self._lock:
+            self._settle()
+            return dict(self._get(kind, resource_id))
+
+    def list(self, kind, query, pool_id=None):
+        with self._lock:
+            self._settle()
+            if pool_id is not None:
+                self._get('pools', pool_id)
+            found = [dict(resource) for resource in
+                     getattr(self, kind).values()
+                     if pool_id is None or resource['pool_id'] == pool_id]
+        fields = query.pop('fields', None)
+        for key, values in query.items():
+            found = [resource for resource in found
+                     if str(resource.get(key)) in values]
+        if fields:
+            found = [dict((field, resource.get(field)) for field in fields)
+                     for resource in found]
+        return found
+
+    def status_tree(self, lbid):
+        with self._lock:
+            self._settle()
+            lb = self._get('loadbalancers', lbid)
+
+            def status(resource, **extra):
+                tree = {'id': resource['id'], 'name': resource['name'],
+                        'provisioning_status':
+                            resource['provisioning_status'],
+                        'operating_status': resource['operating_status']}
+                tree.update(extra)
+                return tree
+
+            def pool_status(pool_id):
+                pool = self.pools[pool_id]
+                extra = {'members': [
+                    status(self.members[member_id],
+                           address=self.members[member_id]['address'],
+                           protocol_port=self.members[member_id]
+                           ['protocol_port'])
+                    for member_id in _ids(pool['members'])]}
+                if pool['healthmonitor_id']:
+                    hm = self.healthmonitors[pool['healthmonitor_id']]
+                    extra['healthmonitor'] = {
+                        'id': hm['id'], 'type': hm['type'],
+                        'provisioning_status': hm['provisioning_status']}
+                return status(pool, **extra)
+            return {'statuses': {'loadbalancer': status(
+                lb,
+                listeners=[status(self.listeners[listener_id], pools=[
+                    pool_status(pool_id) for pool_id in
+                    _ids(self.pools.values()) if listener_id in
+                    _ids(self.pools[pool_id]['listeners'])])
+                    for listener_id in _ids(lb['listeners'])],
+                pools=[pool_status(pool_id)
+                       for pool_id in _ids(lb['pools'])])}}
+
+    # Heat
+    def _stack_event(self, stack, resource_name, status, reason=''):
+        stack['events'].append({
+            'id': _new_id(), 'resource_name': resource_name,
+            'logical_resource_id': resource_name,
+            'physical_resource_id': stack['id']
+            if resource_name == stack['stack_name'] else _new_id(),
+            'resource_status': status, 'resource_status_reason': reason,
+            'event_time': _now(), 'links': []})
+
+    def _settle_stacks(self):
+        now = time.time()
+        for stack in self.stacks.values():
+            if stack['until'] > now or\
+                    not stack['stack_status'].endswith('IN_PROGRESS'):
+                continue
+            action = stack['stack_status'].split('_')[0]
+            failed = stack['stack_name'] in {
+                'CREATE': self.fail_names,
+                'DELETE': self.fail_deletes}.get(action, ())
+            for position, name in enumerate(stack['resource_names']):
+                if failed and position == 0:
+                    self._stack_event(stack, name, '%s_FAILED' % action,
+                                      'Resource %s failed: fake failure' %
+                                      action)
+                    break
+                self._stack_event(stack, name, '%s_COMPLETE' % action)
+            stack['stack_status'] = '%s_%s' % (
+                action, 'FAILED' if failed else 'COMPLETE')
+            self._stack_event(stack, stack['stack_name'],
+                              stack['stack_status'],
+                              'Stack %s %s' % (action, 'failed' if failed
+                                               else 'completed successfully'))
+
+    def create_stack(self, body):
+        template = body.get('template') or {}
+        if not isinstance(template, dict):
+            try:
+                import yaml
+                template = yaml.safe_load(template) or {}
+            except Exception:
+                template = {}
+        with self._lock:
+            if [s for s in self.stacks.values()
+                    if s['stack_name'] == body['stack_name'] and
+                    s['stack_status'] != 'DELETE_COMPLETE']:
+                raise FakeError(409, 'StackExists', 'The Stack (%s) already '
+                                'exists.' % body['stack_name'])
+            stack = {'id': _new_id(), 'stack_name': body['stack_name'],
+                     'stack_status': 'CREATE_IN_PROGRESS',
+                     'stack_status_reason': '',
+                     'creation_time': _now(), 'updated_time': None,
+                     'description': template.get('description', ''),
+                     'parameters': body.get('parameters') or {},
+                     'tags': body.get('tags'),
+                     'resource_names': sorted(template.get('resources') or
+                                              {}),
+                     'until': time.time() + self.delay, 'events': []}
+            self._stack_event(stack, stack['stack_name'],
+                              'CREATE_IN_PROGRESS', 'Stack CREATE started')
+            for name in stack['resource_names']:
+                self._stack_event(stack, name, 'CREATE_IN_PROGRESS')
+            self.stacks[stack['id']] = stack
+            self._settle_stacks()
+            return stack
+
+    def find_stack(self, name_or_id):
+        with self._lock:
+            self._settle_stacks()
+            if name_or_id in self.stacks:
+                return self.stacks[name_or_id]
+            for stack in self.stacks.values():
+                if stack['stack_name'] == name_or_id and\
+                        stack['stack_status'] != 'DELETE_COMPLETE':
+                    return stack
+        raise FakeError(404, 'EntityNotFound',
+                        'The Stack (%s) could not be found.' % name_or_id)
+
+    def delete_stack(self, name_or_id):
+        with self._lock:
+            stack = self.find_stack(name_or_id)
+            stack['stack_status'] = 'DELETE_IN_PROGRESS'
+            stack['until'] = time.time() + self.delay
+            self._stack_event(stack, stack['stack_name'],
+                              'DELETE_IN_PROGRESS', 'Stack DELETE started')
+            self._settle_stacks()
+
+    def list_stacks(self, query):
+        with self._lock:
+            self._settle_stacks()
+            found = [s for s in self.stacks.values()
+                     if s['stack_status'] != 'DELETE_COMPLETE']
+        for key in ('name', 'stack_name'):
+            if key in query:
+                found = [s for s in found if s['stack_name'] in query[key]]
+        return found
+
+    def stack_events(self, name_or_id, query):
+        with self._lock:
+            events = list(self.find_stack(name_or_id)['events'])
+        if query.get('sort_dir') == ['desc']:
+            events.reverse()
+        if 'marker' in query:
+            ids = [event['id'] for event in events]
+            if query['marker'][0] in ids:
+                events = events[ids.index(query['marker'][0]) + 1:]
+        if 'limit' in query:
+            events = events[:int(query['limit'][0])]
+        return events
+
+    # Glance
+    def create_image(self, body):
+        image_id = body.get('id') or _new_id()
+        image = {'status': 'queued', 'visibility': 'private',
+                 'protected': False, 'tags': [], 'size': None,
+                 'virtual_size': None, 'checksum': None, 'min_disk': 0,
+                 'min_ram': 0, 'owner': self.tenant_id,
+                 'container_format': None, 'disk_format': None}
+        image.update(body)
+        image.update({'id': image_id, 'created_at': _now(),
+                      'updated_at': _now(),
+                      'self': '/v2/images/%s' % image_id,
+                      'file': '/v2/images/%s/file' % image_id,
+                      'schema': '/v2/schemas/image', 'until': 0})
+        with self._lock:
+            self.images[image_id] = image
+        return image
+
+    def _settle_images(self):
+        now = time.time()
+        for image in self.images.values():
+            if image['status'] == 'saving' and image['until'] <= now:
+                image['status'] = 'killed'\
+                    if image.get('name') in self.fail_names else 'active'
+
+    def upload_image(self, image_id, chunks):
+        with self._lock:
+            image = self._get('images', image_id)
+            image['status'] = 'saving'
+        checksum = hashlib.md5()
+        size = 0
+        for chunk in chunks:
+            checksum.update(chunk)
+            size = size + len(chunk)
+        with self._lock:
+            image.update(checksum=checksum.hexdigest(), size=size,
+                         until=time.time() + self.delay,
+                         updated_at=_now())
+            self._settle_images()
+
+    def show_image(self, image_id):
+        with self._lock:
+            self._settle_images()
+            return self._get('images', image_id)
+
+    def list_images(self, query):
+        with self._lock:
+            self._settle_images()
+            found = list(self.images.values())
+        for key, values in query.items():
+            if key == 'size_min':
+                found = [i for i in found
+                         if (i['size'] or 0) >= int(values[0])]
+            elif key == 'size_max':
+                found = [i for i in found
+                         if i['size'] is not None and
+                         i['size'] <= int(values[0])]
+            elif key not in ('limit', 'marker', 'sort_key', 'sort_dir',
+                             'sort'):
+                found = [i for i in found if str(i.get(key)) in values]
+        return found
+
+    def delete_image(self, image_id):
+        with self._lock:
+            self._get('images', image_id)
+            del self.images[image_id]
+
+
+def _ids(references):
+    return [reference['id'] for reference in references]
+
+
+def _image_view(image):
+    return dict((key, value) for key, value in image.items()
+                if key != 'until' and value is not None)
+
+
+def _stack_view(stack, base_url):
+    view = dict((key, value) for key, value in stack.items()
+                if key not in ('until', 'events', 'resource_names'))
+    view['links'] = [{'rel': 'self', 'href': '%s/stacks/%s/%s' % (
+        base_url, stack['stack_name'], stack['id'])}]
+    return view
+
+
+NEUTRON_COLLECTIONS = {
+    'loadbalancers': ('loadbalancers', 'loadbalancer'),
+    'listeners': ('listeners', 'listener'),
+    'pools': ('pools', 'pool'),
+    'healthmonitors': ('healthmonitors', 'healthmonitor'),
+}
+
+
+class FakeOpenStackHandler(BaseHTTPRequestHandler):
+    '''Routes requests to the FakeOpenStack held by the server.'''
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def backend(self):
+        return self.server.backend
+
+    def _send(self, status, body=None, headers=None):
+        payload = b'' if body is None else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        if payload:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _chunks(self):
+        self.body_read = True
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                size = int(line.split(b';')[0].strip(), 16)
+                if not size:
+                    self.rfile.readline()
+                    return
+                yield self.rfile.read(size)
+                self.rfile.readline()
+        remaining = int(self.headers.get('Content-Length') or 0)
+        while remaining:
+            chunk = self.rfile.read(min(remaining, 65536))
+            if not chunk:
+                return
+            remaining = remaining - len(chunk)
+            yield chunk
+
+    def _json_body(self):
+        data = b''.join(self._chunks())
+        return json.loads(data.decode('utf-8')) if data else {}
+
+    def _handle(self, method):
+        self.body_read = False
+        url = urlsplit(self.path)
+        path = re.sub(r'\.json$', '', url.path.rstrip('/')) or '/'
+        query = parse_qs(url.query)
+        try:
+            try:
+                service, kind = self._route(method, path, query)
+            except (KeyError, ValueError, TypeError) as error:
+                raise FakeError(400, 'BadRequest', 'Bad request: %r' % error)
+        except FakeError as error:
+            self._send_error(error, path)
+            return
+        with self.backend._lock:
+            self.backend.calls[(service, kind)] += 1
+
+    def _send_error(self, error, path):
+        # Drain an unread request body so the connection stays usable.
+        if not getattr(self, 'body_read', False):
+            for _ in self._chunks():
+                pass
+        if path.startswith('/v2.0/') and not path.startswith('/v2.0/tokens'):
+            body = {'NeutronError': {'type': error.error_type,
+                                     'message': error.message,
+                                     'detail': ''}}
+        else:
+            body = {'error': {'code': error.status, 'title': error.error_type,
+                              'message': error.message}}
+        self._send(error.status, body)
+
+    def _authorize(self):
+        if self.headers.get('X-Auth-Token') not in self.backend.tokens:
+            raise FakeError(401, 'Unauthorized',
+                            'Authentication required')
+
+    def _route(self, method, path, query):
+        if path in ('/', '/v2.0') and method == 'GET':
+            self._send(200, {'version': {
+                'id': 'v2.0', 'status': 'stable',
+                'links': [{'rel': 'self',
+                           'href': self.backend.base_url + '/v2.0/'}]}})
+            return 'identity', 'version'
+        if path == '/v2.0/tokens' and method == 'POST':
+            self._send(200, self.backend.issue_token(self._json_body()))
+            return 'identity', 'create'
+        self._authorize()
+        if path.startswith('/v2.0/'):
+            return 'network', self._neutron(method, path[6:], query)
+        if path.startswith('/v1/'):
+            return 'orchestration', self._heat(method, path, query)
+        if path.startswith('/v2/'):
+            return 'image', self._glance(method, path[4:], query)
+        raise FakeError(404, 'NotFound', 'No route for %s' % path)
+
+    def _neutron(self, method, path, query):
+        backend = self.backend
+        parts = path.split('/')
+        if parts[0] in ('networks', 'subnets') and method == 'GET':
+            if len(parts) == 1:
+                self._send(200, {parts[0]: backend.list(parts[0], query)})
+                return 'list'
+            self._send(200, {parts[0][:-1]: backend.show(parts[0], parts[1])})
+            return 'show'
+        if parts[0] != 'lbaas' or len(parts) < 2:
+            raise FakeError(404, 'NotFound', 'No route for %s' % path)
+        parts = parts[1:]
+        if len(parts) >= 3 and parts[0] == 'pools' and parts[2] == 'members':
+            return self._resource(method, 'members', 'members', 'member',
+                                  parts[3:], query, pool_id=parts[1])
+        if len(parts) == 3 and parts[0] == 'loadbalancers' and\
+                parts[2] == 'statuses' and method == 'GET':
+            self._send(200, backend.status_tree(parts[1]))
+            return 'show'
+        if parts[0] not in NEUTRON_COLLECTIONS:
+            raise FakeError(404, 'NotFound', 'No route for %s' % path)
+        plural, singular = NEUTRON_COLLECTIONS[parts[0]]
+        return self._resource(method, parts[0], plural, singular, parts[1:],
+                              query)
+
+    def _resource(self, method, kind, plural, singular, rest, query,
+                  pool_id=None):
+        backend = self.backend
+        if not rest and method == 'GET':
+            self._send(200, {plural: backend.list(kind, query, pool_id)})
+            return 'list'
+        if not rest and method == 'POST':
+            body = self._json_body()[singular]
+            self._send(201, {singular: backend.create_lbaas(kind, body,
+                                                            pool_id)})
+            return 'create'
+        if len(rest) != 1:
+            raise FakeError(404, 'NotFound', 'No route')
+        if method == 'GET':
+            self._send(200, {singular: backend.show(kind, rest[0])})
+            return 'show'
+        if method == 'PUT':
+            body = self._json_body()[singular]
+            self._send(200, {singular: backend.update_lbaas(kind, rest[0],
+                                                            body)})
+            return 'update'
+        if method == 'DELETE':
+            backend.delete_lbaas(kind, rest[0])
+            self._send(204)
+            return 'delete'
+        raise FakeError(405, 'MethodNotAllowed', method)
+
+    def _heat(self, method, path, query):
+        backend = self.backend
+        base_url = backend.endpoints['orchestration']
+        parts = path.split('/')[3:]
+        if parts[:1] != ['stacks']:
+            raise FakeError(404, 'NotFound', 'No route for %s' % path)
+        rest = parts[1:]
+        if not rest and method == 'POST':
+            stack = backend.create_stack(self._json_body())
+            self._send(201, {'stack': {'id': stack['id'], 'links': _stack_view(
+                stack, base_url)['links']}})
+            return 'create'
+        if not rest and method == 'GET':
+            self._send(200, {'stacks': [_stack_view(stack, base_url)
+                                        for stack in
+                                        backend.list_stacks(query)]})
+            return 'list'
+        if rest[-1] == 'events' and method == 'GET':
+            events = backend.stack_events(rest[-2], query)
+            self._send(200, {'events': events})
+            return 'list'
+        if len(rest) > 2:
+            raise FakeError(404, 'NotFound', 'No route for %s' % path)
+        if method == 'GET':
+            stack = backend.find_stack(rest[-1])
+            self._send(200, {'stack': _stack_view(stack, base_url)})
+            return 'show'
+        if method == 'DELETE':
+            backend.delete_stack(rest[-1])
+            self._send(204)
+            return 'delete'
+        raise FakeError(405, 'MethodNotAllowed', method)
+
+    def _glance(self, method, path, query):
+        backend = self.backend
+        parts = path.split('/')
+        if parts[0] == 'schemas' and method == 'GET':
+            if parts[1:] == ['image']:
+                self._send(200, IMAGE_SCHEMA)
+            else:
+                self._send(200, {'name': 'images', 'links': [],
+                                 'properties': {'images': {
+                                     'type': 'array',
+                                     'items': IMAGE_SCHEMA}}})
+            return 'show'
+        if parts[0] != 'images':
+            raise FakeError(404, 'NotFound', 'No route for %s' % path)
+        rest = parts[1:]
+        if not rest and method == 'POST':
+            image = backend.create_image(self._json_body())
+            self._send(201, _image_view(image))
+            return 'create'
+        if not rest and method == 'GET':
+            self._send(200, {'images': [_image_view(image) for image in
+                                        backend.list_images(query)],
+                             'first': '/v2/images',
+                             'schema': '/v2/schemas/images'})
+            return 'list'
+        if rest[1:] == ['file'] and method == 'PUT':
+            backend.upload_image(rest[0], self._chunks())
+            self._send(204)
+            return 'upload'
+        if len(rest) != 1:
+            raise FakeError(404, 'NotFound', 'No route for %s' % path)
+        if method == 'GET':
+            self._send(200, _image_view(backend.show_image(rest[0])))
+            return 'show'
+        if method == 'DELETE':
+            backend.delete_image(rest[0])
+            self._send(204)
+            return 'delete'
+        raise FakeError(405, 'MethodNotAllowed', method)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+
+class FakeOpenStackServer(ThreadingMixIn, HTTPServer):
+    '''Serves a FakeOpenStack on a local port from a daemon thread.'''
+    daemon_threads = True
+
+    def __init__(self, backend=None, host='127.0.0.1', port=0):
+        HTTPServer.__init__(self, (host, port), FakeOpenStackHandler)
+        self.backend = backend or FakeOpenStack()
+        self.backend.base_url = 'http://%s:%d' % self.server_address[:2]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+
+def pytest_addoption(parser):
+    parser.addoption("--fake-openstack", action="store_true", default=False,
+                     help="Run the fixtures against an in-process stand-in "
+                          "for Keystone, Neutron LBaaS, Heat and Glance.")
+    parser.addoption("--fake-openstack-delay", action="store", type=float,
+                     default=.05,
+                     help="Seconds the stand-in keeps objects in their "
+                          "PENDING/IN_PROGRESS states.")
+    parser.addoption("--fake-openstack-contention", action="store",
+                     type=float, default=0.,
+                     help="Probability the stand-in refuses an LBaaS change "
+                          "with StateInvalid on an idle loadbalancer.")
+
+
+def pytest_configure(config):
+    if not config.getoption('--fake-openstack'):
+        return
+    backend = FakeOpenStack(
+        delay=config.getoption('--fake-openstack-delay'),
+        contention=config.getoption('--fake-openstack-contention'))
+    config.fake_openstack = FakeOpenStackServer(backend).start()
+    for option, value in (('os_tenant_id', backend.tenant_id),
+                          ('os_tenant_name', backend.tenant_name),
+                          ('os_username', 'testlab'),
+                          ('os_password', 'changeme')):
+        if getattr(config.option, option, None) is None:
+            setattr(config.option, option, value)
+
+
+def pytest_unconfigure(config):
+    server = getattr(config, 'fake_openstack', None)
+    if server is not None:
+        server.stop()
+        del config.fake_openstack
@@ -14,38 +14,177 @@
 #
 #
 
+from collections import OrderedDict
+import hashlib
+from heatclient.exc import HTTPNotFound
+import json
+import os
 import pytest
+import threading
+
+
+_template_cache = {}
+
+
+def pytest_addoption(parser):
+    parser.addoption("--heat-reuse-stacks", action="store_true",
+                     default=False,
+                     help="Keep HeatStack stacks alive between tests and "
+                          "hand out an identical one instead of recreating "
+                          "it.")
+    parser.addoption("--heat-reuse-limit", action="store", type=int,
+                     default=4,
+                     help="Most stacks --heat-reuse-stacks keeps alive; the "
+                          "least recently used is deleted first.")
 
 
 def get_file_contents(file_path):
-    file = open(file_path)
-    file_contents = file.read()
-    file.close()
-    return file_contents
+    '''Read a template, reusing the last read while the file is unchanged.'''
+    key = (file_path, os.path.getmtime(file_path))
+    if key not in _template_cache:
+        file = open(file_path)
+        _template_cache[key] = file.read()
+        file.close()
+    return _template_cache[key]
+
+
+def stack_fingerprint(template, parameters, environment):
+    '''Hash of everything that decides what a stack is built from.'''
+    content = json.dumps([template, parameters, environment], sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
 
 
 def cleanup_stack_if_exists(heat_client, template_name):
-    stacks = heat_client.stacks.list()
+    stacks = heat_client.stacks.list(filters={'name': template_name})
     for stack in stacks:
         if stack.stack_name == template_name:
             heat_client.delete_stack(stack.id)
 
 
+class StackCache(object):
+    '''CREATE_COMPLETE stacks kept for reuse, keyed by stack_fingerprint
+    and stack name.
+
+    Holds at most limit stacks and deletes the least recently used one to
+    make room.  A stack is reused only under the name it was created with.
+    '''
+    def __init__(self, heat_client, limit):
+        self.heat_client = heat_client
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._stacks = OrderedDict()
+
+    def _drop(self, key):
+        '''Forget the stack kept under key; call with the lock held.'''
+        return self._stacks.pop(key)
+
+    def _delete(self, stacks):
+        '''Delete dropped stacks; called without the lock held.'''
+        for stack in stacks:
+            try:
+                self.heat_client.delete_stack(stack.id)
+            except HTTPNotFound:
+                pass
+
+    def get(self, fingerprint, stack_name):
+        '''Return the kept stack for fingerprint and stack_name, or None.
+
+        A kept stack holding stack_name under another fingerprint is deleted
+        so the name can be reused, as is a kept stack no longer
+        CREATE_COMPLETE.  One deleted out of band is just forgotten.
+        '''
+        key = (fingerprint, stack_name)
+        with self._lock:
+            dropped = [self._drop(kept) for kept in list(self._stacks)
+                       if kept != key and kept[1] == stack_name]
+            stack = self._stacks.get(key)
+        self._delete(dropped)
+        if stack is None:
+            return None
+        try:
+            current = self.heat_client.stacks.get(stack.id)
+        except HTTPNotFound:
+            current = None
+        with self._lock:
+            if self._stacks.get(key) is not stack:
+                return None
+            self._drop(key)
+            if current is None:
+                return None
+            if current.stack_status != 'CREATE_COMPLETE':
+                dropped = [stack]
+            else:
+                self._stacks[key] = current
+                return current
+        self._delete(dropped)
+        return None
+
+    def put(self, fingerprint, stack):
+        '''Keep stack; a different stack kept under its key is deleted.'''
+        key = (fingerprint, stack.stack_name)
+        with self._lock:
+            dropped = []
+            displaced = self._stacks.get(key)
+            if displaced is not None and displaced.id != stack.id:
+                dropped.append(self._drop(key))
+            self._stacks.pop(key, None)
+            self._stacks[key] = stack
+            while len(self._stacks) > self.limit:
+                dropped.append(self._drop(next(iter(self._stacks))))
+        self._delete(dropped)
+
+    def close(self):
+        with self._lock:
+            dropped = list(self._stacks.values())
+            self._stacks.clear()
+        self._delete(dropped)
+
+
+@pytest.fixture(scope='session')
+def heat_stack_cache(request, heatclientmanager):
+    '''Session StackCache behind HeatStack's reuse mode.'''
+    cache = StackCache(heatclientmanager,
+                       request.config.getoption('--heat-reuse-limit'))
+    request.addfinalizer(cache.close)
+    return cache
+
+
 @pytest.fixture
 def HeatStack(heatclientmanager, request):
-    '''Fixture for creating/deleting a heat stack.'''
-    def manage_stack(template_file, stack_name, parameters={}):
+    '''Fixture for creating/deleting a heat stack.
+
+    With reuse (by default --heat-reuse-stacks) a stack built from the same
+    template, parameters and environment by an earlier test is handed back
+    as is, and the stack is left running for later tests.
+    '''
+    def manage_stack(template_file, stack_name, parameters=None,
+                     environment=None, reuse=None):
         def teardown():
             heatclientmanager.delete_stack(stack.id)
 
+        if reuse is None:
+            reuse = request.config.getoption('--heat-reuse-stacks')
+        parameters = {} if parameters is None else parameters
+        environment = {} if environment is None else environment
         template = get_file_contents(template_file)
         config = {}
         config['stack_name'] = stack_name
         config['template'] = template
         config['parameters'] = parameters
+        config['environment'] = environment
+        if reuse:
+            cache = request.getfixturevalue('heat_stack_cache')
+            fingerprint = stack_fingerprint(template, parameters,
+                                            environment)
+            stack = cache.get(fingerprint, stack_name)
+            if stack is not None:
+                return heatclientmanager, stack
         # Call delete before create, in case previous teardown failed
         cleanup_stack_if_exists(heatclientmanager, stack_name)
         stack = heatclientmanager.create_stack(config)
-        request.addfinalizer(teardown)
+        if reuse:
+            cache.put(fingerprint, stack)
+        else:
+            request.addfinalizer(teardown)
         return heatclientmanager, stack
     return manage_stack
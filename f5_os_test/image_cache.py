@@ -0,0 +1,202 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+'''A session cache of Glance images, deduplicated by content.
+
+   image_cache.get(path, name=..., disk_format=..., container_format=...)
+returns an active image holding the file at path.  An image Glance already
+has with the same md5 and size is handed back as is, whatever its name;
+only a miss uploads, through create_image_from_file.  Callers asking for
+the same file at once share a single upload.
+
+   Each get leases the image until image_cache.release(image); the lease
+context manager does both:
+
+    with image_cache.lease(path, name='bigip') as image:
+        ...
+
+   Images the cache uploads are marked with CACHE_PROPERTY and survive the
+session, so the next session finds them.  To make room beyond
+--image-cache-limit images or --image-cache-bytes bytes the least recently
+used image nobody holds a lease on is dropped, and deleted from Glance if
+the cache uploaded it.  A leased image is never dropped, so the cache may
+stay over its bounds until the lease is given back.
+'''
+from collections import Counter
+from collections import OrderedDict
+from concurrent.futures import Future
+import contextlib
+from glanceclient.exc import HTTPNotFound
+import hashlib
+import mmap
+import os
+import pytest
+import threading
+
+
+# Image property marking the images uploaded by an ImageCache.
+CACHE_PROPERTY = 'f5_os_test_cache'
+
+_checksum_cache = {}
+
+
+def pytest_addoption(parser):
+    parser.addoption("--image-cache-limit", action="store", type=int,
+                     default=4,
+                     help="Most images the image_cache fixture holds; 0 "
+                          "for no limit.")
+    parser.addoption("--image-cache-bytes", action="store", type=int,
+                     default=0,
+                     help="Most bytes of images the image_cache fixture "
+                          "holds; 0 for no limit.")
+
+
+def file_checksum(path):
+    '''md5 and size of a file, reused while it is unchanged.'''
+    stat = os.stat(path)
+    key = (path, stat.st_mtime, stat.st_size)
+    if key not in _checksum_cache:
+        md5 = hashlib.md5()
+        if stat.st_size:
+            with open(path, 'rb') as image_file:
+                mapped = mmap.mmap(image_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+                try:
+                    md5.update(mapped)
+                finally:
+                    mapped.close()
+        _checksum_cache[key] = (md5.hexdigest(), stat.st_size)
+    return _checksum_cache[key]
+
+
+class ImageCache(object):
+    '''Active images kept for reuse, keyed by (md5, size).
+
+    limit and max_bytes bound what is held; None or 0 means no bound.
+    '''
+    def __init__(self, glance_client, limit=None, max_bytes=None):
+        self.glance_client = glance_client
+        self.limit = limit
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._images = OrderedDict()
+        self._in_flight = {}
+        self._leases = Counter()
+
+    def _find(self, checksum, size):
+        for image in self.glance_client.images.list(filters={
+                'checksum': checksum, 'size_min': size, 'size_max': size}):
+            if image['status'] == 'active' and\
+                    image.get('checksum') == checksum and\
+                    image.get('size') == size:
+                return image
+        return None
+
+    def _over(self):
+        held = sum(image.get('size') or 0 for image in self._images.values())
+        return (self.limit and len(self._images) > self.limit) or\
+            (self.max_bytes and held > self.max_bytes)
+
+    def _drop_unleased(self):
+        '''Drop least recently used unleased images while over the bounds.
+
+        Call with the lock held; returns the dropped images for _delete.
+        '''
+        dropped = []
+        for key in list(self._images):
+            if not self._over():
+                break
+            if not self._leases[key]:
+                dropped.append(self._images.pop(key))
+        return dropped
+
+    def _delete(self, images):
+        for image in images:
+            if image.get(CACHE_PROPERTY):
+                try:
+                    self.glance_client.images.delete(image['id'])
+                except HTTPNotFound:
+                    pass
+
+    def get(self, path, **properties):
+        '''Return an active image of the file at path, uploading on a miss.
+
+        properties are only used for an upload.  The image is leased to the
+        caller until release.
+        '''
+        key = file_checksum(path)
+        with self._lock:
+            if key in self._images:
+                self._images[key] = self._images.pop(key)
+                self._leases[key] += 1
+                return self._images[key]
+            self._leases[key] += 1
+            pending = self._in_flight.get(key)
+            if pending is None:
+                pending = self._in_flight[key] = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            return pending.result()
+        try:
+            image = self._find(*key)
+            if image is None:
+                properties[CACHE_PROPERTY] = 'true'
+                image = self.glance_client.create_image_from_file(
+                    path, **properties)
+        except Exception as exc:
+            with self._lock:
+                del self._in_flight[key]
+                del self._leases[key]
+            pending.set_exception(exc)
+            raise
+        with self._lock:
+            del self._in_flight[key]
+            self._images[key] = image
+            dropped = self._drop_unleased()
+        pending.set_result(image)
+        self._delete(dropped)
+        return image
+
+    def release(self, image):
+        '''Give back a lease taken by get, letting the image be dropped.'''
+        with self._lock:
+            for key, held in self._images.items():
+                if held['id'] == image['id']:
+                    break
+            else:
+                return
+            self._leases[key] -= 1
+            if not self._leases[key]:
+                del self._leases[key]
+            dropped = self._drop_unleased()
+        self._delete(dropped)
+
+    @contextlib.contextmanager
+    def lease(self, path, **properties):
+        '''get the image for the block, releasing it afterwards.'''
+        image = self.get(path, **properties)
+        try:
+            yield image
+        finally:
+            self.release(image)
+
+
+@pytest.fixture(scope='session')
+def image_cache(request, glanceclientmanager):
+    '''Session ImageCache over glanceclientmanager.'''
+    return ImageCache(glanceclientmanager,
+                      request.config.getoption('--image-cache-limit'),
+                      request.config.getoption('--image-cache-bytes'))
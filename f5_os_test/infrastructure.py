@@ -13,14 +13,24 @@
 # limitations under the License.
 #
 
-from f5.bigip import BigIP
+from f5_os_test import api_budget
+from f5_os_test import auth_session
+from f5_os_test.bigip_devices import BigIPDevices
+from f5_os_test import latency_model as latency
+from f5_os_test import teardown
+from f5_os_test.loadbalancer_pool import LoadbalancerPool
+from f5_os_test.topology import TopologyIndex
+from f5_os_test.wait_strategies import STRATEGY_NAMES
 from pprint import pprint as pp
 import pytest
+import time
+import uuid
 
 
 def pytest_addoption(parser):
     parser.addoption("--bigip-netloc", action="store",
-                     help="BIG-IP hostname or IP address")
+                     help="BIG-IP hostname or IP address; separate several "
+                          "devices, e.g. an HA pair, with commas")
     parser.addoption("--bigip-username", action="store",
                      help="BIG-IP REST username",
                      default="admin")
@@ -37,57 +47,220 @@ def pytest_addoption(parser):
                      help="Openstack password.")
     parser.addoption("--os-tenant-name", action="store",
                      help="Openstack tenant name.")
+    parser.addoption("--wait-strategy", action="store",
+                     choices=STRATEGY_NAMES, default="fixed",
+                     help="Sleep schedule the polling managers use while "
+                          "waiting on OpenStack resources.")
+    parser.addoption("--teardown-workers", action="store", type=int,
+                     default=8,
+                     help="Number of LBaaS objects deleted concurrently "
+                          "when cleaning up around each test.")
+    parser.addoption("--lb-pool-size", action="store", type=int,
+                     default=1,
+                     help="Number of loadbalancers provisioned up front "
+                          "for tests to lease.")
+    parser.addoption("--os-pool-size", action="store", type=int,
+                     default=auth_session.DEFAULT_POOL_SIZE,
+                     help="Keep-alive connections per OpenStack host shared "
+                          "by all client managers.")
+    parser.addoption("--resource-prefix", action="store", default="f5ost",
+                     help="Start of the name prefix that marks the LBaaS "
+                          "objects this session creates and may delete.")
+    parser.addoption("--stale-after", action="store", type=int,
+                     default=6 * 3600,
+                     help="Age in seconds after which LBaaS objects left by "
+                          "an earlier --resource-prefix run are deleted at "
+                          "session start.")
+    parser.addoption("--heat-completion", action="store",
+                     choices=('events', 'poll'), default='events',
+                     help="Wait for Heat stacks by following their event "
+                          "stream, or by polling the stack itself.")
+    parser.addoption("--os-token-cache", action="store",
+                     default=auth_session.DEFAULT_TOKEN_CACHE,
+                     help="File caching Keystone tokens between runs; "
+                          "pass an empty string to log in every run.")
+    parser.addoption("--latency-history", action="store",
+                     default=latency.DEFAULT_HISTORY,
+                     help="File of past wait durations that "
+                          "--wait-strategy learned schedules polls from; "
+                          "pass an empty string to learn within the run "
+                          "only.")
 
 
-@pytest.fixture
-def bigip(request, scope="module"):
-    '''bigip fixture'''
+@pytest.fixture(scope='session')
+def bigip_devices(request):
+    '''Session BigIPDevices for every device in --bigip-netloc.'''
     opt_bigip = request.config.getoption("--bigip-netloc")
     opt_username = request.config.getoption("--bigip-username")
     opt_password = request.config.getoption("--bigip-password")
-    b = BigIP(opt_bigip, opt_username, opt_password)
-    return b
+    devices = BigIPDevices(
+        [netloc.strip() for netloc in (opt_bigip or '').split(',')
+         if netloc.strip()],
+        opt_username, opt_password)
+    request.addfinalizer(devices.close)
+    return devices
+
+
+@pytest.fixture(scope='session')
+def latency_model(request, openstack_endpoints):
+    '''Session LatencyModel for --wait-strategy learned, else None.
+
+    The history is kept per Keystone URL.  Runs against --fake-openstack
+    learn only for the session, so its timings never reach a real lab's.
+    '''
+    if request.config.getoption('--wait-strategy') != 'learned':
+        return None
+    path = request.config.getoption('--latency-history')
+    if getattr(request.config, 'fake_openstack', None) is not None:
+        path = None
+    model = latency.LatencyModel(
+        path, scope=openstack_endpoints['identity']).load()
+    request.addfinalizer(model.save)
+    return model
 
 
 @pytest.fixture
-def nclientmanager(request, polling_neutronclient):
-    auth_url = 'http://%s:5000/v2.0' %\
-        request.config.getoption('--auth-netloc')
+def bigip(bigip_devices):
+    '''bigip fixture: the first device, connected once per session.'''
+    return bigip_devices.device()
+
+
+@pytest.fixture
+def bigips(bigip_devices):
+    '''Every device in --bigip-netloc, connected once per session.'''
+    return bigip_devices.devices()
+
+
+@pytest.fixture
+def bigipmanager(request, bigip, bigip_pollster, latency_model):
+    '''BIG-IP polling manager for the bigip fixture's device.'''
+    return bigip_pollster(
+        bigip, wait_strategy=request.config.getoption('--wait-strategy'),
+        latency_model=latency_model)
+
+
+@pytest.fixture(scope='session')
+def openstack_endpoints(request):
+    '''Service URLs keyed by Keystone service type.
+
+    These point at --auth-netloc, or at the in-process stand-in when the
+    fake_openstack plugin was started with --fake-openstack.
+    '''
+    fake = getattr(request.config, 'fake_openstack', None)
+    if fake is not None:
+        return fake.backend.endpoints
+    auth_address = request.config.getoption('--auth-netloc')
+    tenant_id = request.config.getoption('--os-tenant-id')
+    return {'identity': 'http://{}:5000/v2.0'.format(auth_address),
+            'network': 'http://{}:9696'.format(auth_address),
+            'orchestration': 'http://{0}:8004/v1/{1}'.format(auth_address,
+                                                             tenant_id),
+            'image': 'http://{}:9292'.format(auth_address)}
+
+
+@pytest.fixture(scope='session')
+def os_session(request, openstack_endpoints):
+    '''The keystoneauth session every client manager fixture shares.
+
+    A cassette turns the token cache off, so every run records or replays
+    its own login whatever the cache holds, and replayed tokens stay out
+    of it.
+    '''
+    cache_path = request.config.getoption('--os-token-cache')
+    if getattr(request.config, 'cassette', None) is not None:
+        cache_path = ''
+    return auth_session.make_session(
+        openstack_endpoints['identity'],
+        request.config.getoption('--os-username'),
+        request.config.getoption('--os-password'),
+        request.config.getoption('--os-tenant-name'),
+        pool_size=request.config.getoption('--os-pool-size'),
+        token_cache=auth_session.TokenCache(cache_path) if cache_path
+        else None)
+
+
+@pytest.fixture(scope='session')
+def resource_namespace(request):
+    '''Name prefix unique to this session and xdist worker.
+
+    Cleanup only touches objects named with it (and what hangs off them),
+    so parallel workers and concurrent runs on one tenant leave each
+    other's objects alone.  The session's start time is part of it, so a
+    later run can tell when the objects of a dead run are safe to sweep.
+    '''
+    workerinput = getattr(request.config, 'workerinput', {})
+    worker = workerinput.get('workerid', 'main')
+    run = workerinput.get('testrunuid') or uuid.uuid4().hex
+    return '{0}-{1}-{2}-{3}-'.format(
+        request.config.getoption('--resource-prefix'), int(time.time()),
+        run[:8], worker)
+
+
+@pytest.fixture(scope='session')
+def nclientmanager(request, polling_neutronclient, os_session,
+                   resource_namespace, latency_model):
     nclient_config = {
-        'username': 'testlab',
-        'password': 'changeme',
-        'tenant_name': 'testlab',
-        'auth_url': auth_url}
+        'session': os_session,
+        'namespace': resource_namespace,
+        'wait_strategy': request.config.getoption('--wait-strategy'),
+        'latency_model': latency_model}
 
     pnc = polling_neutronclient(**nclient_config)
+    # Clear up after earlier sessions under --resource-prefix that died
+    # before their cleanup, once they are too old to still be running;
+    # from here on each test deletes just what it created.
+    teardown.delete_stale(
+        pnc, request.config.getoption('--resource-prefix'),
+        request.config.getoption('--stale-after'),
+        request.config.getoption('--teardown-workers'))
     return pnc
 
 
+@pytest.fixture(scope='session')
+def topology(nclientmanager):
+    '''Session TopologyIndex of the test tenant's subnets.'''
+    return TopologyIndex(nclientmanager)
+
+
+@pytest.fixture(scope='session')
+def loadbalancer_pool(request, nclientmanager, topology):
+    '''Session pool of ACTIVE loadbalancers leased by the LBaaS fixtures.'''
+    def make_config():
+        sn = topology.subnet('client-v4')
+        lbconf = {'vip_subnet_id': sn['id'],
+                  'tenant_id':     sn['tenant_id'],
+                  'name':          nclientmanager.namespaced('testlb_01')}
+        return {'loadbalancer': lbconf}
+
+    pool = LoadbalancerPool(
+        nclientmanager, make_config,
+        size=request.config.getoption('--lb-pool-size'),
+        max_workers=request.config.getoption('--teardown-workers'),
+        retry=topology.retry, shared=api_budget.shared_calls)
+    request.addfinalizer(pool.close)
+    return pool
+
+
 @pytest.fixture
-def setup_with_nclientmanager(request, nclientmanager):
+def setup_with_nclientmanager(request, nclientmanager, loadbalancer_pool):
     def finalize():
         pp('Entered setup/finalize.')
-        nclientmanager.delete_all_lbaas_healthmonitors()
-        nclientmanager.delete_all_lbaas_pools()
-        nclientmanager.delete_all_listeners()
-        nclientmanager.delete_all_loadbalancers()
+        teardown.delete_created(
+            nclientmanager,
+            request.config.getoption('--teardown-workers'),
+            keep_loadbalancers=loadbalancer_pool.loadbalancer_ids)
 
-    finalize()
     request.addfinalizer(finalize)
     return nclientmanager
 
 
 @pytest.fixture
-def setup_with_loadbalancer(setup_with_nclientmanager):
+def setup_with_loadbalancer(request, setup_with_nclientmanager,
+                            loadbalancer_pool):
+    '''Lease a pooled loadbalancer; it is reset, not deleted, afterwards.'''
     nclientmanager = setup_with_nclientmanager
-    subnets = nclientmanager.list_subnets()['subnets']
-    for sn in subnets:
-        if 'client-v4' in sn['name']:
-            lbconf = {'vip_subnet_id': sn['id'],
-                      'tenant_id':     sn['tenant_id'],
-                      'name':          'testlb_01'}
-    activelb =\
-        nclientmanager.create_loadbalancer({'loadbalancer': lbconf})
+    activelb = loadbalancer_pool.lease()
+    request.addfinalizer(lambda: loadbalancer_pool.release(activelb))
     return nclientmanager, activelb
 
 
@@ -95,7 +268,7 @@ def setup_with_loadbalancer(setup_with_nclientmanager):
 def setup_with_listener(setup_with_loadbalancer):
     nclientmanager, activelb = setup_with_loadbalancer
     listener_config =\
-        {'listener': {'name': 'test_listener',
+        {'listener': {'name': nclientmanager.namespaced('test_listener'),
                       'loadbalancer_id': activelb['loadbalancer']['id'],
                       'protocol': 'HTTP',
                       'protocol_port': 80}}
@@ -107,7 +280,7 @@ def setup_with_listener(setup_with_loadbalancer):
 def setup_with_pool(setup_with_listener):
     nclientmanager, activelistener = setup_with_listener
     pool_config = {'pool': {
-                   'name': 'test_pool_anur23rgg',
+                   'name': nclientmanager.namespaced('test_pool_anur23rgg'),
                    'lb_algorithm': 'ROUND_ROBIN',
                    'listener_id': activelistener['listener']['id'],
                    'protocol': 'HTTP'}}
@@ -116,20 +289,26 @@ def setup_with_pool(setup_with_listener):
 
 
 @pytest.fixture
-def setup_with_pool_member(setup_with_pool):
+def setup_with_pool_member(request, setup_with_pool, topology):
     nclientmanager, activepool = setup_with_pool
     pool_id = activepool['pool']['id']
-    for sn in nclientmanager.list_subnets()['subnets']:
-        if 'server-v4' in sn['name']:
-            address = sn['allocation_pools'][0]['start']
-            subnet_id = sn['id']
-            break
-
-    member_config = {'member': {
-                     'subnet_id': subnet_id,
-                     'address': address,
-                     'protocol_port': 80}}
-    member = nclientmanager.create_lbaas_member(pool_id, member_config)
+
+    def create():
+        address = topology.allocate_addresses('server-v4')[0]
+        member_config = {'member': {
+                         'subnet_id': topology.subnet('server-v4')['id'],
+                         'address': address,
+                         'protocol_port': 80}}
+        try:
+            member = nclientmanager.create_lbaas_member(pool_id,
+                                                        member_config)
+        except Exception:
+            topology.release_addresses([address])
+            raise
+        request.addfinalizer(
+            lambda: topology.release_addresses([address]))
+        return member
+    member = topology.retry(create)
     return nclientmanager, activepool, member
 
 
@@ -147,43 +326,47 @@ def setup_with_healthmonitor(setup_with_pool_member):
 
 
 @pytest.fixture
-def get_auth_config(request, keystoneclientmanager):
-    token_id = keystoneclientmanager.auth_ref['token']['id']
+def get_auth_config(request, os_session):
+    token_id = os_session.get_token()
     auth_address = request.config.getoption('--auth-netloc')
     tenant_id = request.config.getoption('--os-tenant-id')
     return token_id, auth_address, tenant_id
 
 
-@pytest.fixture
-def heatclientmanager(heatclient_pollster, get_auth_config):
+@pytest.fixture(scope='session')
+def heatclientmanager(request, heatclient_pollster, os_session,
+                      openstack_endpoints, latency_model):
     '''Heat client manager fixture.'''
-    token_id, auth_address, tenant_id = get_auth_config
     config_dict = {
-        'endpoint': 'http://{0}:8004/v1/{1}'.format(auth_address, tenant_id),
-        'token': token_id
+        'endpoint': openstack_endpoints['orchestration'],
+        'session': os_session,
+        'completion': request.config.getoption('--heat-completion'),
+        'wait_strategy': request.config.getoption('--wait-strategy'),
+        'latency_model': latency_model
     }
     return heatclient_pollster(**config_dict)
 
 
-@pytest.fixture
-def keystoneclientmanager(request, keystoneclient_pollster):
+@pytest.fixture(scope='session')
+def keystoneclientmanager(request, keystoneclient_pollster, os_session,
+                          latency_model):
     '''Keystone client manager fixture.'''
-    auth_address = request.config.getoption('--auth-netloc')
     config_dict = {
-        'auth_url': 'http://{}:5000/v2.0'.format(auth_address),
-        'tenant_name': request.config.getoption('--os-tenant-name'),
-        'username': request.config.getoption('--os-username'),
-        'password': request.config.getoption('--os-password')
+        'session': os_session,
+        'wait_strategy': request.config.getoption('--wait-strategy'),
+        'latency_model': latency_model
     }
     return keystoneclient_pollster(**config_dict)
 
 
-@pytest.fixture
-def glanceclientmanager(glanceclient_pollster, get_auth_config):
+@pytest.fixture(scope='session')
+def glanceclientmanager(request, glanceclient_pollster, os_session,
+                        openstack_endpoints, latency_model):
     '''Glance client manager fixture.'''
-    token, auth_address, _ = get_auth_config
     config_dict = {
-        'endpoint': 'http://{}:9292'.format(auth_address),
-        'token': token
+        'endpoint': openstack_endpoints['image'],
+        'session': os_session,
+        'wait_strategy': request.config.getoption('--wait-strategy'),
+        'latency_model': latency_model
     }
     return glanceclient_pollster(**config_dict)
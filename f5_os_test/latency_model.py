@@ -0,0 +1,154 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+'''Poll schedules learned from how long each kind of wait has taken.
+
+   Loadbalancers take seconds to go ACTIVE while members are there almost
+at once, so one interval fits neither.  With --wait-strategy learned the
+managers report how long each wait_until took, keyed by the resource and
+operation being timed, and build every later wait for that key from the
+recent history:
+
+* the first probe comes when the fastest tenth of past waits had finished,
+* later probes are spread so about PROBES_PER_SPREAD of them fall between
+  the 10th and 90th percentiles, but never closer than the manager's own
+  interval,
+* the wait gives up after TIMEOUT_FACTOR times the 95th percentile.
+
+A wait that gives up is recorded too, as censored: the operation took at
+least that long.  The next wait then allows TIMEOUT_GROWTH times as long
+as the longest censored wait in the window, so a slower environment
+stretches the timeout instead of failing every wait.  No timeout exceeds
+MAX_TIMEOUT_FACTOR times the manager's own budget, so a broken environment
+does not make each wait longer than the last.
+
+Keys with fewer than MIN_SAMPLES waits use the manager's own schedule.  The
+history is a rolling window per environment, named by the model's scope,
+kept in a JSON file, so it follows the environment across runs and xdist
+workers without one lab's figures applying to another.
+'''
+from f5_os_test.locked_json import LockedJSONFile
+from f5_os_test.timing import percentile
+from f5_os_test.wait_strategies import LeadInWait
+import os
+import threading
+
+
+DEFAULT_HISTORY = os.path.join(
+    os.path.expanduser('~'), '.cache', 'f5_os_test', 'latency_history.json')
+
+# Most recent waits kept per (resource, operation).
+HISTORY_LENGTH = 50
+MIN_SAMPLES = 5
+PROBES_PER_SPREAD = 4
+TIMEOUT_FACTOR = 3
+TIMEOUT_GROWTH = 2
+MAX_TIMEOUT_FACTOR = 4
+# So a fast history can't make waits give up early.
+MIN_TIMEOUT = 10
+
+
+def _sample(entry):
+    '''(seconds, censored) from a history entry.'''
+    if isinstance(entry, list):
+        return entry[0], bool(entry[1])
+    return entry, False
+
+
+def _budget(strategy):
+    '''Seconds strategy waits before giving up, or None if it never does.'''
+    timeout = getattr(strategy, 'timeout', None)
+    if timeout is not None:
+        return timeout
+    if getattr(strategy, 'max_attempts', None) is not None:
+        return sum(strategy.delays())
+    return None
+
+
+class LatencyModel(object):
+    '''Recent wait durations per (resource, operation).
+
+    path is the JSON history file; without one the model only learns for
+    the life of the process.  scope names the environment, e.g. its
+    Keystone URL, and keeps its history apart from other environments'.
+    '''
+    def __init__(self, path=None, scope=''):
+        self.history_file = LockedJSONFile(path) if path else None
+        self.scope = scope
+        self._history = {}
+        self._unsaved = {}
+        self._lock = threading.Lock()
+
+    def _key(self, resource, operation):
+        return '%s|%s/%s' % (self.scope, resource, operation)
+
+    def load(self):
+        if self.history_file is not None:
+            with self.history_file.locked() as entries:
+                history = dict(entries)
+            with self._lock:
+                self._history = history
+        return self
+
+    def save(self):
+        '''Append this process's waits to the file, keeping the window.'''
+        with self._lock:
+            unsaved, self._unsaved = self._unsaved, {}
+        if self.history_file is None or not unsaved:
+            return
+        with self.history_file.locked() as entries:
+            for key, samples in unsaved.items():
+                entries[key] = (entries.get(key, []) +
+                                samples)[-HISTORY_LENGTH:]
+
+    def observe(self, resource, operation, duration, censored=False):
+        '''Remember that a wait for this operation took duration seconds.
+
+        censored means it gave up then, so the operation took longer.
+        '''
+        key = self._key(resource, operation)
+        entry = [duration, 1] if censored else duration
+        with self._lock:
+            self._history[key] = (self._history.get(key, []) +
+                                  [entry])[-HISTORY_LENGTH:]
+            self._unsaved.setdefault(key, []).append(entry)
+
+    def strategy(self, resource, operation, fallback, min_interval=0):
+        '''The schedule for the next wait on this operation.
+
+        Probes come at most every min_interval seconds.  fallback, the
+        manager's own schedule, is used until there is enough history, and
+        its budget bounds the timeout.
+        '''
+        with self._lock:
+            samples = [_sample(entry) for entry in
+                       self._history.get(self._key(resource, operation), [])]
+        if len(samples) < MIN_SAMPLES:
+            return fallback
+        durations = [seconds for seconds, _ in samples]
+        fast = percentile(durations, .1)
+        slow = percentile(durations, .9)
+        timeout = max(percentile(durations, .95) * TIMEOUT_FACTOR,
+                      MIN_TIMEOUT)
+        censored = [seconds for seconds, gave_up in samples if gave_up]
+        if censored:
+            timeout = max(timeout, max(censored) * TIMEOUT_GROWTH)
+        budget = _budget(fallback)
+        if budget is not None:
+            timeout = min(timeout, max(budget * MAX_TIMEOUT_FACTOR,
+                                       MIN_TIMEOUT))
+        return LeadInWait(
+            fast,
+            max((slow - fast) / PROBES_PER_SPREAD, min_interval),
+            timeout)
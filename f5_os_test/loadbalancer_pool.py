@@ -0,0 +1,163 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+'''A session-wide pool of ACTIVE loadbalancers that tests lease and return.
+
+   Bringing a loadbalancer to ACTIVE is the slowest step of building an
+LBaaS tree, so the pool creates them once and hands them out per test.  On
+release everything under the loadbalancer is deleted and any edited
+attributes are put back, leaving it as it was first created.  A
+loadbalancer that cannot be reset, or is no longer ACTIVE, is deleted and
+replaced on the next lease.
+'''
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from f5_os_test.exceptions import ProvisioningFailed
+from f5_os_test import teardown
+from neutronclient.common.exceptions import NotFound
+import threading
+
+
+# Attributes a test may edit that release() puts back.
+RESTORED_ATTRIBUTES = ('name', 'description', 'admin_state_up')
+
+
+@contextmanager
+def _unshared():
+    yield
+
+
+class LoadbalancerPool(object):
+    '''Lease pre-provisioned loadbalancers and reset them between tests.
+
+    make_config is called with no arguments and returns the body for
+    create_loadbalancer.  Each create goes through retry, e.g. a
+    TopologyIndex's, called with a function doing the create.  Nothing is
+    created until the first lease, which provisions size loadbalancers
+    concurrently inside shared(), e.g. api_budget.shared_calls, since that
+    work is the pool's rather than the leasing test's; leases beyond that
+    grow the pool on demand.
+    '''
+    def __init__(self, nclientmanager, make_config, size=1, max_workers=8,
+                 retry=None, shared=None):
+        self.nclientmanager = nclientmanager
+        self.make_config = make_config
+        self.retry = retry or (lambda call: call())
+        self.shared = shared or _unshared
+        self.size = size
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._free = []
+        self._leased = {}
+        self._filled = False
+
+    @property
+    def loadbalancer_ids(self):
+        '''Ids of every loadbalancer the pool owns, leased or free.'''
+        with self._lock:
+            return set(self._leased) |\
+                set(lb['loadbalancer']['id'] for lb in self._free)
+
+    def _create(self):
+        return self.retry(lambda: self.nclientmanager.create_loadbalancer(
+            self.make_config()))
+
+    def _fill(self):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            created = list(executor.map(
+                lambda _: self._create(), range(self.size)))
+        with self._lock:
+            self._free.extend(created)
+
+    def _is_usable(self, lb):
+        try:
+            current = self.nclientmanager.show_loadbalancer(
+                lb['loadbalancer']['id'])
+        except NotFound:
+            return False
+        return current['loadbalancer']['provisioning_status'] == 'ACTIVE'
+
+    def lease(self):
+        '''Return an ACTIVE loadbalancer for the exclusive use of one test.'''
+        with self._lock:
+            fill, self._filled = not self._filled, True
+        if fill:
+            with self.shared():
+                self._fill()
+        while True:
+            with self._lock:
+                lb = self._free.pop() if self._free else None
+            if lb is None:
+                lb = self._create()
+            elif not self._is_usable(lb):
+                self._discard(lb)
+                continue
+            with self._lock:
+                self._leased[lb['loadbalancer']['id']] = lb
+            return lb
+
+    def _reset(self, lb):
+        '''Strip the loadbalancer and wait for it to be ACTIVE again.'''
+        lbid = lb['loadbalancer']['id']
+        graph = teardown.loadbalancer_graph(self.nclientmanager, lbid)
+        graph.discard([('loadbalancer', lbid)])
+        teardown.delete_graph(self.nclientmanager, graph, self.max_workers)
+        # Deleting children and updating leave it PENDING_UPDATE for a while.
+        current = self.nclientmanager.wait_for_loadbalancer(lbid)
+        current = current['loadbalancer']
+        drifted = dict((attr, lb['loadbalancer'][attr])
+                       for attr in RESTORED_ATTRIBUTES
+                       if attr in lb['loadbalancer'] and
+                       current.get(attr) != lb['loadbalancer'][attr])
+        if drifted:
+            self.nclientmanager.update_loadbalancer(
+                lbid, {'loadbalancer': drifted})
+            self.nclientmanager.wait_for_loadbalancer(lbid)
+
+    def _discard(self, lb):
+        lbid = lb['loadbalancer']['id']
+        try:
+            graph = teardown.loadbalancer_graph(self.nclientmanager, lbid)
+            teardown.delete_graph(self.nclientmanager, graph, self.max_workers)
+        except NotFound:
+            pass
+
+    def release(self, lb):
+        '''Strip a leased loadbalancer back to its created state.'''
+        with self._lock:
+            self._leased.pop(lb['loadbalancer']['id'], None)
+        try:
+            self._reset(lb)
+        except (NotFound, ProvisioningFailed):
+            self._discard(lb)
+            return
+        except Exception:
+            self._discard(lb)
+            raise
+        with self._lock:
+            self._free.append(lb)
+
+    def close(self):
+        '''Delete every loadbalancer the pool owns.'''
+        with self._lock:
+            owned = list(self._leased.values()) + self._free
+            self._leased, self._free = {}, []
+        graph = teardown.ResourceGraph()
+        for lb in owned:
+            try:
+                graph.update(teardown.loadbalancer_graph(
+                    self.nclientmanager, lb['loadbalancer']['id']))
+            except NotFound:
+                continue
+        teardown.delete_graph(self.nclientmanager, graph, self.max_workers)
@@ -0,0 +1,70 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+'''A JSON object in a file that several processes read and update.'''
+from contextlib import contextmanager
+import fcntl
+import json
+import os
+import tempfile
+
+
+class LockedJSONFile(object):
+    '''A JSON object on disk, shared between processes.
+
+    Every read-modify-write happens under an exclusive flock on a sibling
+    .lock file, and the file is replaced atomically, so concurrent writers
+    never see a partial file.
+    '''
+    def __init__(self, path):
+        self.path = path
+
+    @contextmanager
+    def locked(self):
+        '''Yield the stored entries; changes to them are written back.'''
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory, 0o700)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+        with open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                entries = self._read()
+                original = dict(entries)
+                yield entries
+                if entries != original:
+                    self._write(entries)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self):
+        try:
+            with open(self.path) as json_file:
+                return json.load(json_file)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _write(self, entries):
+        fd, temporary = tempfile.mkstemp(
+            dir=os.path.dirname(self.path) or '.')
+        try:
+            with os.fdopen(fd, 'w') as json_file:
+                json.dump(entries, json_file)
+            os.rename(temporary, self.path)
+        except Exception:
+            os.unlink(temporary)
+            raise
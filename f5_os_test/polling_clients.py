@@ -24,7 +24,18 @@ IF a client has methods that provide a uniform means of observing state changes
 then we could probably effectively used such a decorator, but I'm not yet
 familiar enough with OS to make that leap.
 '''
-from f5.bigip import BigIP
+from f5_os_test.async_polling import AsyncHeatMixin
+from f5_os_test.async_polling import AsyncNeutronMixin
+from f5_os_test.exceptions import ImageUploadFailed
+from f5_os_test.exceptions import MaximumNumberOfAttemptsExceeded
+from f5_os_test.exceptions import ProvisioningFailed
+from f5_os_test.exceptions import StackFailed
+from f5_os_test import teardown
+from f5_os_test.latency_model import LatencyModel
+from f5_os_test import wait_strategies
+from f5_os_test.collection_waiter import CollectionWaiter
+from f5_os_test import timing
+from f5_os_test.timing import timed
 from glanceclient.v2.client import Client as GlanceClient
 from heatclient.exc import HTTPNotFound
 from heatclient.v1.client import Client as HeatClient
@@ -32,82 +43,356 @@ from keystoneclient.v2_0.client import Client as KeystoneClient
 from neutronclient.common.exceptions import NotFound
 from neutronclient.common.exceptions import StateInvalidClient
 from neutronclient.v2_0.client import Client as NeutronClient
+import hashlib
+import mmap
+import os
 from pprint import pprint as pp
 import pytest
+import re
+import threading
 import time
 
 
-# flake8 hack
-pp(BigIP)
+# Ids per server-side id= filter, to keep the query string a sane length.
+ID_FILTER_CHUNK = 50
 
+# Most bytes handed to the HTTP layer at once by create_image_from_file.
+IMAGE_CHUNK_SIZE = 1024 * 1024
 
-class MaximumNumberOfAttemptsExceeded(Exception):
-    pass
+# provisioning_status values that end a wait on any LBaaS v2 resource.
+# Resources listed without a provisioning_status count as ACTIVE.
+ACTIVE_STATUSES = frozenset(['ACTIVE'])
+FAILED_STATUSES = frozenset(['ERROR'])
+
+# How Neutron's StateInvalid names the loadbalancer that refused a change.
+_STATE_INVALID = re.compile(
+    r'Invalid state (\w+) of loadbalancer resource ([0-9a-fA-F-]+)')
 
 
 class PollingMixin(object):
     '''Use this mixin to poll for resource entering 'target' from other.'''
+    # Set while replaying a cassette: probes answer at once, so don't wait.
+    skip_sleeps = False
+    # A LatencyModel scheduling waits from their history, if any.
+    latency_model = None
+
+    def wait_until(self, probe, predicate=bool):
+        '''Call probe until predicate accepts its result, then return it.
+
+        Sleeps between probes follow self.wait_strategy, or the latency
+        model's schedule for the operation being timed; running out of
+        delays raises MaximumNumberOfAttemptsExceeded.
+        '''
+        record = self.timing_recorder.current()
+        strategy = self._strategy_for(record)
+        started = time.time()
+        if strategy.lead_in:
+            self._sleep(strategy.lead_in)
+        observed = self._probe(probe)
+        if predicate(observed):
+            return self._learn(record, started, observed)
+        for delay in strategy.delays():
+            self._sleep(delay)
+            observed = self._probe(probe)
+            if predicate(observed):
+                return self._learn(record, started, observed)
+        self._learn(record, started, None, timed_out=True)
+        raise MaximumNumberOfAttemptsExceeded
+
+    def _strategy_for(self, record):
+        if self.latency_model is None or record is None:
+            return self.wait_strategy
+        return self.latency_model.strategy(
+            record.resource, record.operation, self.wait_strategy,
+            min_interval=self.interval)
+
+    def _learn(self, record, started, observed, timed_out=False):
+        '''Report a finished wait to the latency model; return observed.
+
+        A wait that timed_out only shows the operation takes longer than
+        it waited.
+        '''
+        # Replayed waits say nothing about the environment.
+        if self.latency_model is not None and record is not None and\
+                not self.skip_sleeps:
+            self.latency_model.observe(record.resource, record.operation,
+                                       time.time() - started,
+                                       censored=timed_out)
+        return observed
+
+    def _probe(self, call, *args, **kwargs):
+        '''Make one API call, charging it to the operation being timed.'''
+        record = self.timing_recorder.current()
+        started = time.time()
+        try:
+            return call(*args, **kwargs)
+        finally:
+            if record is not None:
+                record.attempts = record.attempts + 1
+                record.http_time = record.http_time + time.time() - started
+
+    def _sleep(self, delay):
+        if self.skip_sleeps:
+            return
+        time.sleep(delay)
+        record = self.timing_recorder.current()
+        if record is not None:
+            record.sleep_time = record.sleep_time + delay
+
+    def _refused(self, exc):
+        '''Called with each exception a retried call is refused with.
+
+        Raise to stop retrying; by default every refusal is retried.
+        '''
+
     def poll(self, observer, resource_id,
              status_reader, target_status='ACTIVE'):
-        current_state = observer(resource_id)
-        current_status = status_reader(current_state)
-        attempts = 0
-        while current_status != target_status:
-            time.sleep(self.interval)
-            current_state = observer(resource_id)
-            current_status = status_reader(current_state)
-            attempts = attempts + 1
-            if attempts > self.max_attempts:
-                raise MaximumNumberOfAttemptsExceeded
-        return current_state
+        return self.wait_until(
+            lambda: observer(resource_id),
+            lambda state: status_reader(state) == target_status)
 
 
 class ClientManagerMixin(PollingMixin):
     '''Base class for polling manager common functionality.'''
-    pass
-
-
-class NeutronClientPollingManager(NeutronClient, ClientManagerMixin):
+    def _configure_polling(self, kwargs, interval, max_attempts):
+        '''Pop the polling options out of a client's constructor kwargs.
+
+        wait_strategy may be a WaitStrategy instance or one of the names in
+        wait_strategies.STRATEGY_NAMES; names are sized from interval and
+        max_attempts.  'learned' schedules waits with latency_model, a
+        LatencyModel, or with one private to this manager if none is given.
+        '''
+        self.interval = kwargs.pop('interval', interval)
+        self.max_attempts = kwargs.pop('max_attempts', max_attempts)
+        strategy = kwargs.pop('wait_strategy', None)
+        self.wait_strategy = wait_strategies.resolve(
+            strategy, self.interval, self.max_attempts)
+        latency_model = kwargs.pop('latency_model', None)
+        if strategy == 'learned':
+            self.latency_model = latency_model or LatencyModel()
+        self.timing_recorder = kwargs.pop('timing_recorder', None) or\
+            timing.RECORDER
+
+
+class NeutronClientPollingManager(NeutronClient, ClientManagerMixin,
+                                  AsyncNeutronMixin):
     '''Invokes Neutronclient methods and polls for target expected states.'''
     def __init__(self, **kwargs):
         pp("got here in the constructor")
-        self.interval = kwargs.pop('interval', .4)
-        self.max_attempts = kwargs.pop('max_attempts', 12)
+        self._configure_polling(kwargs, .4, 12)
+        # Name prefix of the objects the delete_all_* methods may touch.
+        self.namespace = kwargs.pop('namespace', None)
+        # Objects created through this manager and not yet deleted.
+        self.created = teardown.ResourceGraph()
+        self._created_lock = threading.Lock()
+        self.collection_waiter = kwargs.pop(
+            'collection_waiter', None) or\
+            CollectionWaiter(self._list_collection_ids)
         super(NeutronClientPollingManager, self).__init__(**kwargs)
 
+    def _raw(self, name):
+        '''The plain NeutronClient method, for the coroutine versions.'''
+        return getattr(super(NeutronClientPollingManager, self), name)
+
+    def namespaced(self, name):
+        '''Prefix name with this manager's namespace, if it has one.'''
+        return (self.namespace or '') + name
+
+    def _namespace_ids(self, kind):
+        '''Ids of the kind of LBaaS object inside this manager's namespace.
+
+        See teardown.namespace_ids; usually a single list call.
+        '''
+        return teardown.namespace_ids(self, kind, self.namespace)
+
+    def _record(self, kind, resource, pool_id=None):
+        if kind == 'member':
+            parents, attrs = [('pool', pool_id)], {'pool_id': pool_id}
+        else:
+            parents, attrs = teardown.parents_of(kind, resource), {}
+        with self._created_lock:
+            self.created.add(kind, resource['id'], parents, tracked=True,
+                             **attrs)
+
+    def _track(self, kind, created, pool_id=None):
+        '''Record a just-created object in self.created and return it.'''
+        self._record(kind, created[kind], pool_id)
+        return created
+
+    def observe(self, kind, resource, pool_id=None):
+        '''Record an object seen but not created here, e.g. one made by a
+        Heat stack, so that delete_created removes it too.
+
+        resource is its body as listed or shown; a member needs pool_id.
+        '''
+        self._record(kind, resource, pool_id)
+
+    def observe_loadbalancer(self, lbid):
+        '''Record everything under a loadbalancer, from one statuses call.
+
+        Picks up children made by Heat or the agent rather than here.
+        '''
+        graph = teardown.loadbalancer_graph(self, lbid)
+        for attrs in graph.nodes.values():
+            attrs['tracked'] = True
+        with self._created_lock:
+            self.created.update(graph)
+
+    def untrack(self, key):
+        '''Forget a (kind, id) object once it has been deleted.'''
+        with self._created_lock:
+            self.created.discard([key])
+
+    def created_graph(self):
+        '''A copy of self.created holding only the objects created or
+        observed here.
+        '''
+        graph = teardown.ResourceGraph()
+        with self._created_lock:
+            graph.update(self.created)
+        graph.discard([key for key, attrs in graph.nodes.items()
+                       if not attrs.get('tracked')])
+        return graph
+
+    def _refused(self, exc):
+        '''Raise ProvisioningFailed if exc names a loadbalancer in ERROR.
+
+        A change under a loadbalancer in ERROR is refused with StateInvalid
+        for good, so retrying it would only use up the wait.
+        '''
+        match = _STATE_INVALID.search(str(exc))
+        if match is None or match.group(1) not in FAILED_STATUSES:
+            return
+        try:
+            lb = self._probe(super(NeutronClientPollingManager, self)
+                             .show_loadbalancer, match.group(2))
+        except NotFound:
+            return
+        self._loadbalancer_settled(lb)
+
     def _poll_call_with_exceptions(self, exceptional, call, *args, **kwargs):
-        attempts = 0
-        while attempts <= self.max_attempts:
+        delays = self.wait_strategy.delays()
+        while True:
             try:
-                retval = call(*args)
-            except exceptional:
-                time.sleep(self.interval)
-                attempts = attempts + 1
-                if attempts > self.max_attempts:
+                return self._probe(call, *args, **kwargs)
+            except exceptional as exc:
+                self._refused(exc)
+                try:
+                    delay = next(delays)
+                except StopIteration:
                     raise MaximumNumberOfAttemptsExceeded
-                continue
-            break
-        return retval
+                self._sleep(delay)
+
+    def _list_ids_filtered(self, collection, resource_ids):
+        client = super(NeutronClientPollingManager, self)
+        query = {'fields': ['id', 'provisioning_status', 'operating_status']}
+        if resource_ids is not None:
+            query['id'] = resource_ids
+        if collection == 'listeners':
+            return client.list_listeners(**query)['listeners']
+        elif collection == 'pools':
+            return client.list_lbaas_pools(**query)['pools']
+        elif collection == 'healthmonitors':
+            return client.list_lbaas_healthmonitors(
+                **query)['healthmonitors']
+        _, pool_id = collection
+        try:
+            return client.list_lbaas_members(pool_id, **query)['members']
+        except NotFound:
+            # The members went away with their pool.
+            return []
+
+    def _list_collection_ids(self, collection, resource_ids):
+        '''Return which of resource_ids exist; collection_waiter's fetcher.
+
+        collection is 'listeners', 'pools', 'healthmonitors' or a
+        ('members', pool_id) pair.  The query is filtered server-side on id
+        and trimmed to the id and status fields, so its cost follows the
+        number of ids asked about rather than the size of the tenant.  More
+        ids than fit one filter are answered from a single unfiltered
+        listing instead.  The result maps each listed id to those fields.
+        '''
+        resource_ids = sorted(resource_ids)
+        if len(resource_ids) > ID_FILTER_CHUNK:
+            listed = self._list_ids_filtered(collection, None)
+        else:
+            listed = self._list_ids_filtered(collection, resource_ids)
+        wanted = set(resource_ids)
+        return dict((resource['id'], resource) for resource in listed
+                    if resource['id'] in wanted)
+
+    def _outstanding(self, collection, resource_ids, present=True):
+        '''Ids not yet ACTIVE (or, if not present, not yet gone).
+
+        Raises ProvisioningFailed as soon as any of them reads ERROR.
+        '''
+        listed = self.collection_waiter.snapshot(collection, resource_ids)
+        for resource_id in resource_ids:
+            observed = listed.get(resource_id)
+            if observed and\
+                    observed.get('provisioning_status') in FAILED_STATUSES:
+                resource = collection[0] if isinstance(collection, tuple)\
+                    else collection
+                raise ProvisioningFailed(resource[:-1], resource_id, observed)
+        if not present:
+            return resource_ids.intersection(listed)
+        return frozenset(
+            resource_id for resource_id in resource_ids
+            if resource_id not in listed or
+            listed[resource_id].get('provisioning_status', 'ACTIVE')
+            not in ACTIVE_STATUSES)
+
+    def wait_for_ids(self, collection, resource_ids, present=True):
+        '''Wait until every id is ACTIVE (or, if not present, unlisted).
+
+        Concurrent waits on the same collection share their list calls
+        through self.collection_waiter.  An id in ERROR raises
+        ProvisioningFailed without waiting further.
+        '''
+        resource_ids = frozenset(resource_ids)
+        with self.collection_waiter.pending(collection, resource_ids):
+            self.wait_until(
+                lambda: self._outstanding(collection, resource_ids, present),
+                lambda ids: not ids)
+        return True
 
     # begin loadbalancer section
+    def _loadbalancer_settled(self, loadbalancer):
+        '''True once ACTIVE; raises ProvisioningFailed if it is in ERROR.'''
+        status = loadbalancer['loadbalancer']['provisioning_status']
+        if status in FAILED_STATUSES:
+            raise ProvisioningFailed('loadbalancer',
+                                     loadbalancer['loadbalancer']['id'],
+                                     loadbalancer['loadbalancer'])
+        return status in ACTIVE_STATUSES
+
+    @timed('loadbalancer', 'create')
     def create_loadbalancer(self, lbconf):
-        init_lb = super(NeutronClientPollingManager, self)\
-            .create_loadbalancer(lbconf)
-        lbid = init_lb['loadbalancer']['id']
-
-        def lb_reader(loadbalancer):
-            return loadbalancer['loadbalancer']['provisioning_status']
-        return self.poll(super(NeutronClientPollingManager, self)
-                         .show_loadbalancer, lbid, lb_reader)
-
-    def _lb_delete_helper(self, lbid):
+        init_lb = self._track('loadbalancer', self._probe(
+            super(NeutronClientPollingManager, self).create_loadbalancer,
+            lbconf))
+        return self.wait_for_loadbalancer(init_lb['loadbalancer']['id'])
+
+    def wait_for_loadbalancer(self, lbid):
+        '''Wait until the loadbalancer is ACTIVE and return it.
+
+        ERROR raises ProvisioningFailed without waiting further.
+        '''
+        return self.wait_until(
+            lambda: super(NeutronClientPollingManager, self)
+            .show_loadbalancer(lbid),
+            self._loadbalancer_settled)
+
+    def _loadbalancer_gone(self, lbid):
         try:
-            super(NeutronClientPollingManager, self)\
-                .delete_loadbalancer(lbid)
+            loadbalancer = super(NeutronClientPollingManager, self)\
+                .show_loadbalancer(lbid)
         except NotFound:
             return True
+        self._loadbalancer_settled(loadbalancer)
         return False
 
+    @timed('loadbalancer', 'update')
     def update_loadbalancer(self, lbid, lbconf):
         updated = self._poll_call_with_exceptions(
             StateInvalidClient,
@@ -115,39 +400,40 @@ class NeutronClientPollingManager(NeutronClient, ClientManagerMixin):
             lbid, lbconf)
         return updated
 
+    @timed('loadbalancer', 'delete')
     def delete_loadbalancer(self, lbid):
-        attempts = 0
-        while not self._lb_delete_helper(lbid):
-            time.sleep(self.interval)
-            attempts = attempts + 1
-            if attempts > self.max_attempts:
-                raise MaximumNumberOfAttemptsExceeded
-        return True
+        # StateInvalidClient here means children are still being deleted.
+        try:
+            self._poll_call_with_exceptions(
+                StateInvalidClient,
+                super(NeutronClientPollingManager, self).delete_loadbalancer,
+                lbid)
+        except NotFound:
+            self.untrack(('loadbalancer', lbid))
+            return True
+        gone = self.wait_until(lambda: self._loadbalancer_gone(lbid))
+        self.untrack(('loadbalancer', lbid))
+        return gone
 
     def delete_all_loadbalancers(self):
-        for lb in super(NeutronClientPollingManager, self)\
-                .list_loadbalancers()['loadbalancers']:
-            self.delete_loadbalancer(lb['id'])
+        for lbid in self._namespace_ids('loadbalancer'):
+            self.delete_loadbalancer(lbid)
 
     # begin listener section
+    @timed('listener', 'create')
     def create_listener(self, listener_conf):
-        init_listener = self._poll_call_with_exceptions(
-            StateInvalidClient,
-            super(NeutronClientPollingManager, self).create_listener,
-            listener_conf)
+        init_listener = self._track('listener',
+                                    self._poll_call_with_exceptions(
+                                        StateInvalidClient,
+                                        super(NeutronClientPollingManager,
+                                              self).create_listener,
+                                        listener_conf))
         # The dict returned by show listener doesn't have a status.
-        lids = [l['id'] for l in super(NeutronClientPollingManager, self)
-                .list_listeners()['listeners']]
-        attempts = 0
-        while init_listener['listener']['id'] not in lids:
-            time.sleep(self.interval)
-            lids = [l['id'] for l in super(NeutronClientPollingManager, self)
-                    .list_listeners()['listeners']]
-            attempts = attempts + 1
-            if attempts > self.max_attempts:
-                raise MaximumNumberOfAttemptsExceeded
+        listener_id = init_listener['listener']['id']
+        self.wait_for_ids('listeners', [listener_id])
         return init_listener
 
+    @timed('listener', 'update')
     def update_listener(self, listener_id, listener_conf):
         updated = self._poll_call_with_exceptions(
             StateInvalidClient,
@@ -155,46 +441,33 @@ class NeutronClientPollingManager(NeutronClient, ClientManagerMixin):
             listener_id, listener_conf)
         return updated
 
+    @timed('listener', 'delete')
     def delete_listener(self, listener_id):
         self._poll_call_with_exceptions(
             StateInvalidClient,
             super(NeutronClientPollingManager, self).delete_listener,
             listener_id)
-        lids = [l['id'] for l in super(NeutronClientPollingManager, self)
-                .list_listeners()['listeners']]
-        attempts = 0
-        while listener_id in lids:
-            time.sleep(self.interval)
-            lids = [l['id'] for l in super(NeutronClientPollingManager, self)
-                    .list_listeners()['listeners']]
-            attempts = attempts + 1
-            if attempts > self.max_attempts:
-                raise MaximumNumberOfAttemptsExceeded
+        self.wait_for_ids('listeners', [listener_id], present=False)
+        self.untrack(('listener', listener_id))
         return True
 
     def delete_all_listeners(self):
-        for listener in super(NeutronClientPollingManager, self)\
-                .list_listeners()['listeners']:
-            pp(listener['id'])
-            self.delete_listener(listener['id'])
+        for listener_id in self._namespace_ids('listener'):
+            pp(listener_id)
+            self.delete_listener(listener_id)
 
     # Begin lbaas pool section
+    @timed('pool', 'create')
     def create_lbaas_pool(self, pool_config):
-        pool = self._poll_call_with_exceptions(
+        pool = self._track('pool', self._poll_call_with_exceptions(
             StateInvalidClient,
             super(NeutronClientPollingManager, self).create_lbaas_pool,
-            pool_config)
-        attempts = 0
+            pool_config))
         pool_id = pool['pool']['id']
-        while pool_id not in\
-                [p['id'] for p in super(NeutronClientPollingManager, self)
-                    .list_lbaas_pools()['pools']]:
-            time.sleep(self.interval)
-            attempts = attempts + 1
-            if attempts > self.max_attempts:
-                raise MaximumNumberOfAttemptsExceeded
+        self.wait_for_ids('pools', [pool_id])
         return pool
 
+    @timed('pool', 'update')
     def update_lbaas_pool(self, lbaas_pool_id, lbaas_pool_conf):
         updated = self._poll_call_with_exceptions(
             StateInvalidClient,
@@ -202,57 +475,57 @@ class NeutronClientPollingManager(NeutronClient, ClientManagerMixin):
             lbaas_pool_id, lbaas_pool_conf)
         return updated
 
+    @timed('pool', 'delete')
     def delete_lbaas_pool(self, pool_id):
         self.delete_all_lbaas_pool_members(pool_id)
         self._poll_call_with_exceptions(
             StateInvalidClient,
             super(NeutronClientPollingManager, self).delete_lbaas_pool,
             pool_id)
-        attempts = 0
-        while pool_id in\
-                [p['id'] for p in super(NeutronClientPollingManager, self)
-                    .list_lbaas_pools()['pools']]:
-            time.sleep(self.interval)
-            attempts = attempts + 1
-            if attempts > self.max_attempts:
-                raise MaximumNumberOfAttemptsExceeded
+        self.wait_for_ids('pools', [pool_id], present=False)
+        self.untrack(('pool', pool_id))
         return True
 
     def delete_all_lbaas_pools(self):
-        for pool in super(NeutronClientPollingManager, self)\
-                .list_lbaas_pools()['pools']:
+        pool_ids = self._namespace_ids('pool')
+        for pool_id in pool_ids:
             try:
-                self.delete_lbaas_pool(pool['id'])
+                self.delete_lbaas_pool(pool_id)
             except NotFound:
                 continue
-        attempts = 0
-        while super(NeutronClientPollingManager, self)\
-                .list_lbaas_pools()['pools']:
-            time.sleep(self.interval)
-            attempts = attempts + 1
-            if attempts > self.max_attempts:
-                raise MaximumNumberOfAttemptsExceeded
+        if pool_ids:
+            self.wait_for_ids('pools', pool_ids, present=False)
         return True
 
     # Begin member section
+    @timed('member', 'create')
     def create_lbaas_member(self, pool_id, member_config):
-        member = self._poll_call_with_exceptions(
+        member = self._track('member', self._poll_call_with_exceptions(
             StateInvalidClient,
             super(NeutronClientPollingManager, self).create_lbaas_member,
-            pool_id, member_config)
-        attempts = 0
+            pool_id, member_config), pool_id)
         member_id = member['member']['id']
-        while member_id not in [
-                m['id'] for m in
-                super(NeutronClientPollingManager, self)
-                .list_lbaas_members(pool_id)['members']
-                ]:
-            time.sleep(self.interval)
-            attempts = attempts + 1
-            if attempts > self.max_attempts:
-                raise MaximumNumberOfAttemptsExceeded
+        self.wait_for_ids(('members', pool_id), [member_id])
         return member
 
+    @timed('member', 'bulk_create')
+    def create_lbaas_members(self, pool_id, member_configs):
+        '''Create several members of one pool and wait for them together.
+
+        Each create goes out as soon as the loadbalancer accepts it (busy
+        is retried on StateInvalidClient) without waiting for the one
+        before to become ACTIVE; then a single wait covers the whole batch.
+        '''
+        members = [self._track('member', self._poll_call_with_exceptions(
+            StateInvalidClient,
+            super(NeutronClientPollingManager, self).create_lbaas_member,
+            pool_id, member_config), pool_id)
+            for member_config in member_configs]
+        self.wait_for_ids(('members', pool_id),
+                          [member['member']['id'] for member in members])
+        return members
+
+    @timed('member', 'update')
     def update_lbaas_member(self, member_id, pool_id, member_conf):
         updated = self._poll_call_with_exceptions(
             StateInvalidClient,
@@ -260,21 +533,14 @@ class NeutronClientPollingManager(NeutronClient, ClientManagerMixin):
             member_id, pool_id, member_conf)
         return updated
 
+    @timed('member', 'delete')
     def delete_lbaas_member(self, member_id, pool_id):
         self._poll_call_with_exceptions(
             StateInvalidClient,
             super(NeutronClientPollingManager, self).delete_lbaas_member,
             member_id, pool_id)
-        attempts = 0
-        while member_id in [
-                m['id'] for m in
-                super(NeutronClientPollingManager, self)
-                .list_lbaas_members(pool_id)['members']
-                ]:
-            time.sleep(self.interval)
-            attempts = attempts + 1
-            if attempts > self.max_attempts:
-                raise MaximumNumberOfAttemptsExceeded
+        self.wait_for_ids(('members', pool_id), [member_id], present=False)
+        self.untrack(('member', member_id))
         return True
 
     def delete_all_lbaas_pool_members(self, pool_id):
@@ -287,25 +553,36 @@ class NeutronClientPollingManager(NeutronClient, ClientManagerMixin):
         return True
 
     # Begin healthmonitor section
+    @timed('healthmonitor', 'create')
     def create_lbaas_healthmonitor(self, monitor_config):
-        healthmonitor = self._poll_call_with_exceptions(
-            StateInvalidClient,
-            super(NeutronClientPollingManager, self)
-            .create_lbaas_healthmonitor,
-            monitor_config)
-        healthmonitor_id = healthmonitor['healthmonitor']['id']
-        attempts = 0
-        while healthmonitor_id not in [
-                hm['id'] for hm in
+        healthmonitor = self._track(
+            'healthmonitor', self._poll_call_with_exceptions(
+                StateInvalidClient,
                 super(NeutronClientPollingManager, self)
-                .list_lbaas_healthmonitors()['healthmonitors']
-                ]:
-            time.sleep(self.interval)
-            attempts = attempts + 1
-            if attempts > self.max_attempts:
-                raise MaximumNumberOfAttemptsExceeded
+                .create_lbaas_healthmonitor,
+                monitor_config))
+        healthmonitor_id = healthmonitor['healthmonitor']['id']
+        self.wait_for_ids('healthmonitors', [healthmonitor_id])
         return healthmonitor
 
+    @timed('healthmonitor', 'bulk_create')
+    def create_lbaas_healthmonitors(self, monitor_configs):
+        '''Create healthmonitors for several pools and wait for them together.
+
+        As create_lbaas_members: the creates are not separated by waits.
+        '''
+        healthmonitors = [self._track(
+            'healthmonitor', self._poll_call_with_exceptions(
+                StateInvalidClient,
+                super(NeutronClientPollingManager, self)
+                .create_lbaas_healthmonitor,
+                monitor_config)) for monitor_config in monitor_configs]
+        self.wait_for_ids('healthmonitors',
+                          [healthmonitor['healthmonitor']['id']
+                           for healthmonitor in healthmonitors])
+        return healthmonitors
+
+    @timed('healthmonitor', 'update')
     def update_lbaas_healthmonitor(self,
                                    lbaas_healthmonitor_id,
                                    lbaas_healthmonitor_conf):
@@ -316,36 +593,29 @@ class NeutronClientPollingManager(NeutronClient, ClientManagerMixin):
             lbaas_healthmonitor_id, lbaas_healthmonitor_conf)
         return updated
 
+    @timed('healthmonitor', 'delete')
     def delete_lbaas_healthmonitor(self, healthmonitor_id):
         self._poll_call_with_exceptions(
             StateInvalidClient,
             super(NeutronClientPollingManager, self)
             .delete_lbaas_healthmonitor,
             healthmonitor_id)
-        attempts = 0
-        while healthmonitor_id in [
-                hm['id'] for hm in
-                super(NeutronClientPollingManager, self)
-                .list_lbaas_healthmonitors()['healthmonitors']
-                ]:
-            time.sleep(self.interval)
-            attempts = attempts + 1
-            if attempts > self.max_attempts:
-                raise MaximumNumberOfAttemptsExceeded
+        self.wait_for_ids('healthmonitors', [healthmonitor_id],
+                          present=False)
+        self.untrack(('healthmonitor', healthmonitor_id))
         return True
 
     def delete_all_lbaas_healthmonitors(self):
-        for healthmonitor in\
-                super(NeutronClientPollingManager, self)\
-                .list_lbaas_healthmonitors()['healthmonitors']:
+        for healthmonitor_id in self._namespace_ids('healthmonitor'):
             try:
-                self.delete_lbaas_healthmonitor(healthmonitor['id'])
+                self.delete_lbaas_healthmonitor(healthmonitor_id)
             except NotFound:
                 continue
         return True
 
 
-class HeatClientPollingManager(HeatClient, ClientManagerMixin):
+class HeatClientPollingManager(HeatClient, ClientManagerMixin,
+                               AsyncHeatMixin):
     '''Utilizes heat client to create/delete heat stacks.'''
 
     default_stack_config = {
@@ -357,76 +627,323 @@ class HeatClientPollingManager(HeatClient, ClientManagerMixin):
     }
 
     def __init__(self, **kwargs):
-        self.interval = kwargs.pop('interval', 10)
-        self.max_attempts = kwargs.pop('max_attempts', 100)
-
+        self._configure_polling(kwargs, 10, 100)
+        self.completion = kwargs.pop('completion', 'events')
         super(HeatClientPollingManager, self).__init__(**kwargs)
 
     def stack_status(self, stack):
         return stack.stack_status
 
+    def _failed_events(self, stack_id):
+        return [event for event in self.events.list(stack_id)
+                if event.resource_status.endswith('_FAILED')]
+
+    def _check_stack(self, stack, action):
+        '''Raise StackFailed if stack ended action FAILED, else return it.'''
+        if self.stack_status(stack) == action + '_FAILED':
+            raise StackFailed(stack.id, stack.stack_status,
+                              stack.stack_status_reason,
+                              self._probe(self._failed_events, stack.id))
+        return stack
+
+    def _poll_stack(self, stack_id, action):
+        terminal = (action + '_COMPLETE', action + '_FAILED')
+        stack = self.wait_until(
+            lambda: self.stacks.get(stack_id),
+            lambda current: self.stack_status(current) in terminal)
+        return self._check_stack(stack, action)
+
+    def _latest_event_id(self, stack_id):
+        '''The id of the stack's newest event, or None if it has none.'''
+        try:
+            events = self._probe(self.events.list, stack_id,
+                                 sort_dir='desc', limit=1)
+        except HTTPNotFound:
+            return None
+        return events[0].id if events else None
+
+    def _stack_event_probe(self, stack_id, action, marker=None):
+        '''Return a probe for the stack's new terminal events, and the
+        list of every event it has read.
+
+        Only events after the one with id marker are read, so the end of an
+        earlier run of the same action is not taken for this one's.
+        '''
+        seen = []
+        terminal = (action + '_COMPLETE', action + '_FAILED')
+
+        def new_events():
+            query = {'sort_dir': 'asc'}
+            if seen:
+                query['marker'] = seen[-1].id
+            elif marker is not None:
+                query['marker'] = marker
+            events = self.events.list(stack_id, **query)
+            seen.extend(events)
+            return [event for event in events
+                    if event.physical_resource_id == stack_id and
+                    event.resource_status in terminal]
+        return new_events, seen
+
+    def _check_stack_event(self, stack_id, action, last, seen):
+        '''Raise StackFailed if last is a FAILED event, else return it.'''
+        if last.resource_status == action + '_FAILED':
+            raise StackFailed(
+                stack_id, last.resource_status, last.resource_status_reason,
+                [event for event in seen
+                 if event.resource_status.endswith('_FAILED')])
+        return last
+
+    def follow_stack_events(self, stack_id, action, marker=None):
+        '''Read the stack's event stream until action ends for the stack.
+
+        Each probe asks only for events after the last one seen, starting
+        after marker, and the wait ends on the stack's own COMPLETE or
+        FAILED event.  A FAILED one raises StackFailed carrying the failed
+        resource events.
+        '''
+        new_events, seen = self._stack_event_probe(stack_id, action, marker)
+        last = self.wait_until(new_events)[-1]
+        return self._check_stack_event(stack_id, action, last, seen)
+
+    def _stack_configuration(self, configuration):
+        '''The defaults overlaid with the caller's stack configuration.'''
+        merged = dict(self.default_stack_config)
+        merged.update(configuration)
+        return merged
+
+    @timed('stack', 'create')
     def create_stack(self, configuration):
-        configuration.update(self.default_stack_config)
-        stack = self.stacks.create(**configuration)
-        return self.poll(
-            self.stacks.get,
-            stack['stack']['id'],
-            self.stack_status,
-            target_status='CREATE_COMPLETE'
-        )
-
+        stack = self._probe(self.stacks.create,
+                            **self._stack_configuration(configuration))
+        stack_id = stack['stack']['id']
+        if self.completion == 'poll':
+            return self._poll_stack(stack_id, 'CREATE')
+        self.follow_stack_events(stack_id, 'CREATE')
+        return self._probe(self.stacks.get, stack_id)
+
+    @timed('stack', 'delete')
     def delete_stack(self, stack_id):
-        self.stacks.delete(stack_id)
+        if self.completion == 'poll':
+            self._probe(self.stacks.delete, stack_id)
+            return self._poll_stack(stack_id, 'DELETE')
+        # A stack deleted before may already hold a DELETE_FAILED event.
+        marker = self._latest_event_id(stack_id)
+        self._probe(self.stacks.delete, stack_id)
         try:
-            self.poll(
-                self.stacks.get,
-                stack_id,
-                self.stack_status,
-                target_status='DELETE_COMPLETE'
-            )
+            return self.follow_stack_events(stack_id, 'DELETE', marker)
         except HTTPNotFound:
-            raise
-        except MaximumNumberOfAttemptsExceeded:
-            raise
+            # Heat may stop showing a deleted stack's events at all.
+            return None
 
 
 class KeystoneClientPollingManager(KeystoneClient, ClientManagerMixin):
     '''Manager for keystone client polling.'''
 
     def __init__(self, **kwargs):
-        self.interval = kwargs.pop('interval', 2)
-        self.max_attempts = kwargs.pop('max_attempts', 20)
-
+        self._configure_polling(kwargs, 2, 20)
         super(KeystoneClientPollingManager, self).__init__(**kwargs)
 
 
+class _ChecksummingReader(object):
+    '''File-like view of a buffer that hashes what is read from it.
+
+    Each read returns at most chunk_size bytes, so the HTTP layer only ever
+    holds one chunk of the image.
+    '''
+    def __init__(self, buffer, chunk_size):
+        self.buffer = buffer
+        self.chunk_size = chunk_size
+        self.offset = 0
+        self.md5 = hashlib.md5()
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.chunk_size:
+            size = self.chunk_size
+        chunk = self.buffer[self.offset:self.offset + size]
+        self.offset = self.offset + len(chunk)
+        self.md5.update(chunk)
+        return chunk
+
+
 class GlanceClientPollingManager(GlanceClient, ClientManagerMixin):
     def __init__(self, **kwargs):
-        self.interval = kwargs.pop('interval', 2)
-        self.max_attempts = kwargs.pop('max_attempts', 20)
-
+        self._configure_polling(kwargs, 2, 20)
         super(GlanceClientPollingManager, self).__init__(**kwargs)
 
+    def _upload_mapped(self, image_id, image_file, chunk_size):
+        '''Stream image_file to the image; return the md5 of what was sent.'''
+        size = os.fstat(image_file.fileno()).st_size
+        if not size:
+            # An empty file can't be mapped.
+            reader = _ChecksummingReader(b'', chunk_size)
+            self.images.upload(image_id, reader, image_size=0)
+            return reader.md5.hexdigest()
+        mapped = mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            reader = _ChecksummingReader(mapped, chunk_size)
+            self.images.upload(image_id, reader, image_size=size)
+            return reader.md5.hexdigest()
+        finally:
+            mapped.close()
+
+    @timed('image', 'create')
+    def create_image_from_file(self, path, chunk_size=IMAGE_CHUNK_SIZE,
+                               **properties):
+        '''Create an image from the file at path and wait for it to be active.
+
+        The file is memory-mapped and sent chunk_size bytes at a time, and
+        its md5 is computed from those chunks as they go out, so memory use
+        doesn't grow with the image and the file is read only once.  Glance's
+        checksum must match it.  properties, e.g. name, disk_format and
+        container_format, go to images.create; an image that fails to
+        upload or settle is deleted.
+        '''
+        image = self.images.create(**properties)
+        image_id = image['id']
+        try:
+            with open(path, 'rb') as image_file:
+                checksum = self._upload_mapped(image_id, image_file,
+                                               chunk_size)
+            image = self.wait_until(
+                lambda: self.images.get(image_id),
+                lambda current: current['status'] in ('active', 'killed'))
+            if image['status'] != 'active':
+                raise ImageUploadFailed(image_id, 'status is killed', image)
+            if image.get('checksum') != checksum:
+                raise ImageUploadFailed(
+                    image_id, 'checksum %s, uploaded %s' % (
+                        image.get('checksum'), checksum), image)
+        except Exception:
+            self.images.delete(image_id)
+            raise
+        return image
+
+
+class BigIPPollingManager(ClientManagerMixin):
+    '''Waits for a BIG-IP to reflect the LBaaS objects made in Neutron.
+
+    The agent names each device object after its Neutron id, prefixed with
+    the environment prefix, inside a partition named the same way after
+    the tenant.  Every tick makes one filtered collection query per kind
+    of object awaited, never one call per object.
+    '''
+    MONITOR_TYPES = {'HTTP': 'http', 'HTTPS': 'https', 'TCP': 'tcp',
+                     'PING': 'gateway-icmp'}
+
+    def __init__(self, bigip, **kwargs):
+        self._configure_polling(kwargs, 1, 60)
+        self.environment_prefix = kwargs.pop('environment_prefix', 'Project')
+        self.bigip = bigip
+        self.icr_session = bigip._meta_data['icr_session']
+        self.base_uri = bigip._meta_data['uri']
+
+    def device_name(self, resource_id):
+        return '%s_%s' % (self.environment_prefix, resource_id)
+
+    def _collection(self, path, partition, expand=False):
+        params = '$filter=partition+eq+%s' % partition
+        if expand:
+            params = params + '&expandSubcollections=true'
+        response = self.icr_session.get(self.base_uri + path, params=params)
+        return response.json().get('items', [])
+
+    @staticmethod
+    def _member_name(name):
+        # Drop the route domain: '10.2.0.10%1:80' is '10.2.0.10:80'.
+        address, _, port = name.rpartition(':' if name.count(':') == 1
+                                           else '.')
+        return '%s:%s' % (address.split('%')[0], port)
+
+    def expected_objects(self, listeners=(), pools=(), members=(),
+                         healthmonitors=()):
+        '''Device objects, by collection path, the Neutron objects map to.
+
+        members are (pool_id, member) pairs, since a Neutron member does not
+        name its pool.
+        '''
+        expected = {}
+        for listener in listeners:
+            expected.setdefault('ltm/virtual/', set()).add(
+                self.device_name(listener['id']))
+        for pool in pools:
+            expected.setdefault('ltm/pool/', set()).add(
+                self.device_name(pool['id']))
+        for pool_id, member in members:
+            expected.setdefault('ltm/pool/members', set()).add(
+                (self.device_name(pool_id), '%s:%s' % (
+                    member['address'], member['protocol_port'])))
+        for healthmonitor in healthmonitors:
+            path = 'ltm/monitor/%s/' % self.MONITOR_TYPES.get(
+                healthmonitor['type'], healthmonitor['type'].lower())
+            expected.setdefault(path, set()).add(
+                self.device_name(healthmonitor['id']))
+        return expected
+
+    def _listed(self, path, partition, pools):
+        if path == 'ltm/pool/members':
+            return set((pool['name'], self._member_name(member['name']))
+                       for pool in pools for member in
+                       pool.get('membersReference', {}).get('items', []))
+        if path == 'ltm/pool/':
+            return set(pool['name'] for pool in pools)
+        return set(item['name'] for item in
+                   self._collection(path, partition))
+
+    def outstanding(self, tenant_id, expected, present=True):
+        '''The expected objects still missing (or, if not present, left).'''
+        partition = self.device_name(tenant_id)
+        pools = []
+        if 'ltm/pool/' in expected or 'ltm/pool/members' in expected:
+            # One pool query answers for the members too.
+            pools = self._collection('ltm/pool/', partition,
+                                     'ltm/pool/members' in expected)
+        remaining = {}
+        for path, names in expected.items():
+            listed = self._listed(path, partition, pools)
+            left = names - listed if present else names & listed
+            if left:
+                remaining[path] = left
+        return remaining
+
+    @timed('bigip', 'converge')
+    def wait_for_objects(self, tenant_id, present=True, **neutron_objects):
+        '''Wait until the device holds (or has dropped) the given objects.
+
+        Takes the keyword arguments of expected_objects.
+        '''
+        expected = self.expected_objects(**neutron_objects)
+        self.wait_until(
+            lambda: self.outstanding(tenant_id, expected, present),
+            lambda remaining: not remaining)
+        return True
+
+
+@pytest.fixture(scope='session')
+def bigip_pollster():
+    '''Access to BIG-IP polling for the agent's device configuration.'''
+    return BigIPPollingManager
+
 
-@pytest.fixture
+@pytest.fixture(scope='session')
 def polling_neutronclient():
     '''Invokes Neutronclient methods and polls for target expected states.'''
     return NeutronClientPollingManager
 
 
-@pytest.fixture
+@pytest.fixture(scope='session')
 def heatclient_pollster():
     '''Access to HeatClient polling for create/delete/modify of heat stack.'''
     return HeatClientPollingManager
 
 
-@pytest.fixture
+@pytest.fixture(scope='session')
 def keystoneclient_pollster():
     '''Access to KeystoneClient pollster.'''
     return KeystoneClientPollingManager
 
 
-@pytest.fixture
+@pytest.fixture(scope='session')
 def glanceclient_pollster():
     '''Access to GlanceClient pollster for managing images.'''
     return GlanceClientPollingManager
@@ -0,0 +1,343 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+'''Dependency-aware, concurrent deletion of LBaaS v2 objects.
+
+   LBaaS objects must be deleted leaf first: healthmonitors and members
+before their pool, pools before their listener (or loadbalancer), listeners
+before their loadbalancer.  ResourceGraph records those edges and
+delete_graph walks them on a bounded thread pool, starting an object's
+delete as soon as everything that depends on it is gone.  Separate
+loadbalancer trees are torn down side by side, so the total time follows the
+deepest chain rather than the number of objects.
+'''
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from neutronclient.common.exceptions import NotFound
+import re
+import time
+
+
+class ResourceGraph(object):
+    '''LBaaS objects keyed by (kind, id) with their delete-after edges.
+
+    kind is one of 'loadbalancer', 'listener', 'pool', 'member' or
+    'healthmonitor'.  A node's parents are the objects that may only be
+    deleted once it is gone.
+    '''
+    def __init__(self):
+        self.nodes = {}
+        self.parents = {}
+
+    def add(self, kind, resource_id, parents=(), **attrs):
+        key = (kind, resource_id)
+        self.nodes.setdefault(key, {}).update(attrs)
+        self.parents.setdefault(key, set()).update(parents)
+        for parent in parents:
+            self.nodes.setdefault(parent, {})
+            self.parents.setdefault(parent, set())
+        return key
+
+    def update(self, other):
+        '''Merge the nodes and edges of another graph into this one.'''
+        for key, attrs in other.nodes.items():
+            self.nodes.setdefault(key, {}).update(attrs)
+            self.parents.setdefault(key, set()).update(other.parents[key])
+
+    def discard(self, keys):
+        '''Drop nodes, and the edges that point at them, from the graph.'''
+        keys = set(keys)
+        for key in keys:
+            self.nodes.pop(key, None)
+            self.parents.pop(key, None)
+        for parents in self.parents.values():
+            parents.difference_update(keys)
+
+    def children(self):
+        '''Map every node to the set of nodes that must be deleted first.'''
+        children = dict((key, set()) for key in self.nodes)
+        for key, parents in self.parents.items():
+            for parent in parents:
+                children[parent].add(key)
+        return children
+
+
+def _ids(references):
+    return [reference['id'] for reference in references or []]
+
+
+def parents_of(kind, resource):
+    '''Graph keys of the objects a listed or created resource hangs from.
+
+    Members are not covered: their pool is not part of their body.
+    '''
+    if kind == 'listener':
+        return [('loadbalancer', lbid)
+                for lbid in _ids(resource.get('loadbalancers'))]
+    elif kind == 'pool':
+        listener_ids = _ids(resource.get('listeners'))
+        if listener_ids:
+            return [('listener', lid) for lid in listener_ids]
+        return [('loadbalancer', lbid)
+                for lbid in _ids(resource.get('loadbalancers'))]
+    elif kind == 'healthmonitor':
+        return [('pool', pid) for pid in _ids(resource.get('pools'))]
+    return []
+
+
+def graph_from_listings(loadbalancers, listeners, pools, healthmonitors):
+    '''Build a ResourceGraph from Neutron LBaaS v2 list responses.'''
+    graph = ResourceGraph()
+    for lb in loadbalancers:
+        graph.add('loadbalancer', lb['id'], name=lb.get('name'))
+    for listener in listeners:
+        graph.add('listener', listener['id'],
+                  parents_of('listener', listener),
+                  name=listener.get('name'))
+    for pool in pools:
+        pool_key = graph.add('pool', pool['id'], parents_of('pool', pool),
+                             name=pool.get('name'))
+        for member_id in _ids(pool.get('members')):
+            graph.add('member', member_id, [pool_key], pool_id=pool['id'])
+    for healthmonitor in healthmonitors:
+        graph.add('healthmonitor', healthmonitor['id'],
+                  parents_of('healthmonitor', healthmonitor),
+                  name=healthmonitor.get('name'))
+    return graph
+
+
+def restrict(graph, named):
+    '''Keep the nodes whose name passes named(name) and what hangs off them.
+
+    Members and healthmonitors need no name of their own; they go with the
+    pool or loadbalancer they hang from.
+    '''
+    children = graph.children()
+    inside = set()
+    unvisited = [key for key, attrs in graph.nodes.items()
+                 if named(attrs.get('name') or '')]
+    while unvisited:
+        key = unvisited.pop()
+        if key not in inside:
+            inside.add(key)
+            unvisited.extend(children[key])
+    graph.discard(set(graph.nodes) - inside)
+    return graph
+
+
+def restrict_to_namespace(graph, prefix):
+    '''Drop every node that is not named with prefix or under one that is.'''
+    return restrict(graph, lambda name: name.startswith(prefix))
+
+
+def restrict_to_stale(graph, resource_prefix, namespace, max_age, now=None):
+    '''Keep what earlier runs named under resource_prefix and left behind.
+
+    Namespaces look like '<resource_prefix>-<started>-<run>-<worker>-',
+    started being the run's start in epoch seconds.  Objects in namespace,
+    this run's own, and in runs started less than max_age seconds ago,
+    which may still be going, are dropped.
+    '''
+    now = time.time() if now is None else now
+    pattern = re.compile(r'^%s-(\d+)-[0-9a-f]+-[^-]+-' %
+                         re.escape(resource_prefix))
+
+    def stale(name):
+        match = pattern.match(name)
+        return bool(match) and not name.startswith(namespace) and\
+            int(match.group(1)) < now - max_age
+    return restrict(graph, stale)
+
+
+def _add_status_pool(graph, pool, parent):
+    pool_key = graph.add('pool', pool['id'], [parent])
+    for member in pool.get('members') or []:
+        graph.add('member', member['id'], [pool_key], pool_id=pool['id'])
+    if pool.get('healthmonitor'):
+        graph.add('healthmonitor', pool['healthmonitor']['id'], [pool_key])
+
+
+def graph_from_status_tree(statuses):
+    '''Build a ResourceGraph from a loadbalancer's statuses response.'''
+    graph = ResourceGraph()
+    lb = statuses['statuses']['loadbalancer']
+    lb_key = graph.add('loadbalancer', lb['id'])
+    for listener in lb.get('listeners') or []:
+        listener_key = graph.add('listener', listener['id'], [lb_key])
+        for pool in listener.get('pools') or []:
+            _add_status_pool(graph, pool, listener_key)
+    for pool in lb.get('pools') or []:
+        if ('pool', pool['id']) not in graph.nodes:
+            _add_status_pool(graph, pool, lb_key)
+    return graph
+
+
+def loadbalancer_graph(nclientmanager, lbid):
+    '''Build a ResourceGraph of one loadbalancer and everything under it.
+
+    This costs a single statuses call however large the tenant is.
+    '''
+    return graph_from_status_tree(
+        nclientmanager.retrieve_loadbalancer_status(lbid))
+
+
+def _listed_graph(nclientmanager):
+    return graph_from_listings(
+        nclientmanager.list_loadbalancers()['loadbalancers'],
+        nclientmanager.list_listeners()['listeners'],
+        nclientmanager.list_lbaas_pools()['pools'],
+        nclientmanager.list_lbaas_healthmonitors()['healthmonitors'])
+
+
+# The manager method listing each kind, and the key of its response.
+LISTINGS = {'loadbalancer': ('list_loadbalancers', 'loadbalancers'),
+            'listener': ('list_listeners', 'listeners'),
+            'pool': ('list_lbaas_pools', 'pools'),
+            'healthmonitor': ('list_lbaas_healthmonitors', 'healthmonitors')}
+
+
+def _list(nclientmanager, kind):
+    method, key = LISTINGS[kind]
+    return getattr(nclientmanager, method)()[key]
+
+
+def namespace_ids(nclientmanager, kind, namespace):
+    '''Ids of the kind of object named with namespace or under one that is.
+
+    Only that kind's collection is listed, and a parent collection only when
+    an object not named with namespace itself has to be placed.  Without a
+    namespace that is every such object in the tenant.
+    '''
+    resources = _list(nclientmanager, kind)
+    if not namespace:
+        return [resource['id'] for resource in resources]
+    listed = {}
+
+    def inside(kind, resource):
+        if (resource.get('name') or '').startswith(namespace):
+            return True
+        for parent_kind, parent_id in parents_of(kind, resource):
+            if parent_kind not in listed:
+                listed[parent_kind] = dict(
+                    (parent['id'], parent)
+                    for parent in _list(nclientmanager, parent_kind))
+            parent = listed[parent_kind].get(parent_id)
+            if parent is not None and inside(parent_kind, parent):
+                return True
+        return False
+    return [resource['id'] for resource in resources
+            if inside(kind, resource)]
+
+
+def list_graph(nclientmanager):
+    '''Build a ResourceGraph of the LBaaS objects in the client's namespace.
+
+    A client without a namespace sees every object in the tenant.
+    '''
+    graph = _listed_graph(nclientmanager)
+    namespace = getattr(nclientmanager, 'namespace', None)
+    if namespace:
+        restrict_to_namespace(graph, namespace)
+    return graph
+
+
+def delete_node(nclientmanager, graph, key):
+    '''Delete one graph node and wait for it to disappear.'''
+    kind, resource_id = key
+    try:
+        if kind == 'healthmonitor':
+            nclientmanager.delete_lbaas_healthmonitor(resource_id)
+        elif kind == 'member':
+            nclientmanager.delete_lbaas_member(
+                resource_id, graph.nodes[key]['pool_id'])
+        elif kind == 'pool':
+            nclientmanager.delete_lbaas_pool(resource_id)
+        elif kind == 'listener':
+            nclientmanager.delete_listener(resource_id)
+        elif kind == 'loadbalancer':
+            nclientmanager.delete_loadbalancer(resource_id)
+    except NotFound:
+        nclientmanager.untrack(key)
+    return key
+
+
+def delete_graph(nclientmanager, graph, max_workers=8):
+    '''Delete every node in graph, leaves first, max_workers at a time.
+
+    A failed delete leaves its parents in place; the other branches are
+    still torn down and the first error is raised at the end.
+    '''
+    children = graph.children()
+    blocked = dict((key, len(deps)) for key, deps in children.items())
+    errors = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        def submit(key):
+            return executor.submit(delete_node, nclientmanager, graph, key)
+        running = dict((submit(key), key)
+                       for key, count in blocked.items() if not count)
+        while running:
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                key = running.pop(future)
+                if future.exception() is not None:
+                    errors.append(future.exception())
+                    continue
+                for parent in graph.parents[key]:
+                    blocked[parent] = blocked[parent] - 1
+                    if not blocked[parent]:
+                        running[submit(parent)] = parent
+    if errors:
+        raise errors[0]
+    return True
+
+
+def delete_all(nclientmanager, max_workers=8, keep_loadbalancers=()):
+    '''Tear down every LBaaS object in nclientmanager's namespace.
+
+    Loadbalancers listed in keep_loadbalancers survive, though everything
+    attached to them is still deleted.
+    '''
+    graph = list_graph(nclientmanager)
+    graph.discard([('loadbalancer', lbid) for lbid in keep_loadbalancers])
+    return delete_graph(nclientmanager, graph, max_workers)
+
+
+def delete_created(nclientmanager, max_workers=8, keep_loadbalancers=()):
+    '''Tear down the LBaaS objects nclientmanager created or observed.
+
+    Nothing is listed: the graph comes from the manager's own record, plus
+    one statuses call per loadbalancer created here to observe what Heat
+    or the agent added under it, so the cost follows what the test touched
+    rather than the size of the tenant.
+    '''
+    for kind, lbid in list(nclientmanager.created_graph().nodes):
+        if kind == 'loadbalancer' and lbid not in keep_loadbalancers:
+            try:
+                nclientmanager.observe_loadbalancer(lbid)
+            except NotFound:
+                nclientmanager.untrack((kind, lbid))
+    graph = nclientmanager.created_graph()
+    graph.discard([('loadbalancer', lbid) for lbid in keep_loadbalancers])
+    return delete_graph(nclientmanager, graph, max_workers)
+
+
+def delete_stale(nclientmanager, resource_prefix, max_age, max_workers=8):
+    '''Tear down what earlier runs under resource_prefix left behind.
+
+    See restrict_to_stale; the manager's namespace is this run's.
+    '''
+    graph = restrict_to_stale(_listed_graph(nclientmanager), resource_prefix,
+                              nclientmanager.namespace or '', max_age)
+    return delete_graph(nclientmanager, graph, max_workers)
@@ -0,0 +1,185 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+'''Per-operation timing records for the polling managers.
+
+   Each manager operation decorated with timed() produces one TimingRecord:
+how many HTTP probes it made, how long they took, how long it slept between
+them and how it ended.  Records go to a TimingRecorder, by default the
+module-wide RECORDER, and this plugin prints a per-resource latency summary
+at the end of the run and optionally writes everything to JSON.
+'''
+from contextlib import contextmanager
+import functools
+import json
+import math
+import threading
+import time
+
+
+class TimingRecord(object):
+    '''Where the time of one manager operation went.'''
+    def __init__(self, resource, operation):
+        self.resource = resource
+        self.operation = operation
+        self.attempts = 0
+        self.sleep_time = 0.
+        self.http_time = 0.
+        self.wall_time = 0.
+        self.status = None
+        self.started = time.time()
+
+    def as_dict(self):
+        return {'resource': self.resource,
+                'operation': self.operation,
+                'attempts': self.attempts,
+                'sleep_time': self.sleep_time,
+                'http_time': self.http_time,
+                'wall_time': self.wall_time,
+                'status': self.status,
+                'started': self.started}
+
+
+def percentile(values, fraction):
+    '''Nearest-rank percentile of a non-empty list of numbers.'''
+    ordered = sorted(values)
+    rank = int(math.ceil(fraction * len(ordered)))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+class TimingRecorder(object):
+    '''Collects TimingRecords from any number of managers and threads.'''
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def current(self):
+        '''The innermost operation being measured on this thread, or None.'''
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def finish(self, record, error=None):
+        '''Close a record started with TimingRecord() and keep it.'''
+        record.wall_time = time.time() - record.started
+        if error is not None:
+            record.status = type(error).__name__
+        elif record.status is None:
+            record.status = 'ok'
+        with self._lock:
+            self.records.append(record)
+
+    @contextmanager
+    def measure(self, resource, operation):
+        '''Time the enclosed block as the current operation of this thread.
+
+        Coroutines share a thread, so they create a TimingRecord and pass
+        it to finish() themselves instead.
+        '''
+        record = TimingRecord(resource, operation)
+        stack = self._stack()
+        stack.append(record)
+        error = None
+        try:
+            yield record
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            stack.pop()
+            self.finish(record, error)
+
+    def summary(self):
+        '''Latency figures keyed by (resource, operation).'''
+        with self._lock:
+            records = list(self.records)
+        grouped = {}
+        for record in records:
+            grouped.setdefault(
+                (record.resource, record.operation), []).append(record)
+        summary = {}
+        for key, group in grouped.items():
+            wall = [r.wall_time for r in group]
+            summary[key] = {
+                'count': len(group),
+                'p50': percentile(wall, .5),
+                'p95': percentile(wall, .95),
+                'max': max(wall),
+                'sleep_time': sum(r.sleep_time for r in group),
+                'http_time': sum(r.http_time for r in group),
+                'attempts': sum(r.attempts for r in group),
+                'failures': len([r for r in group if r.status != 'ok'])}
+        return summary
+
+    def as_dict(self):
+        with self._lock:
+            records = [r.as_dict() for r in self.records]
+        summary = [dict(resource=resource, operation=operation, **figures)
+                   for (resource, operation), figures
+                   in sorted(self.summary().items())]
+        return {'records': records, 'summary': summary}
+
+    def clear(self):
+        with self._lock:
+            self.records = []
+
+
+RECORDER = TimingRecorder()
+
+
+def timed(resource, operation):
+    '''Decorate a manager method so each call produces a TimingRecord.'''
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.timing_recorder.measure(resource, operation):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def pytest_addoption(parser):
+    parser.addoption("--timing-json", action="store", default=None,
+                     help="Write polling manager timing records and their "
+                          "summary to this JSON file.")
+
+
+def pytest_terminal_summary(terminalreporter):
+    summary = RECORDER.summary()
+    if not summary:
+        return
+    terminalreporter.write_sep('=', 'polling manager timing')
+    terminalreporter.write_line(
+        '%-14s %-10s %6s %8s %8s %8s %9s %9s' % (
+            'resource', 'operation', 'count', 'p50', 'p95', 'max',
+            'sleep', 'http'))
+    for (resource, operation), figures in sorted(summary.items()):
+        terminalreporter.write_line(
+            '%-14s %-10s %6d %7.2fs %7.2fs %7.2fs %8.2fs %8.2fs' % (
+                resource, operation, figures['count'], figures['p50'],
+                figures['p95'], figures['max'], figures['sleep_time'],
+                figures['http_time']))
+
+
+def pytest_sessionfinish(session):
+    path = session.config.getoption('--timing-json')
+    if path:
+        with open(path, 'w') as timing_file:
+            json.dump(RECORDER.as_dict(), timing_file, indent=2,
+                      sort_keys=True)
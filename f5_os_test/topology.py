@@ -0,0 +1,108 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+'''A session-wide index of the test tenant's networks and subnets.
+
+   The fixtures find their subnets by role, a substring of the subnet name
+such as 'client-v4' or 'server-v4'.  The index lists networks and subnets
+once, answers those lookups from memory and hands out member addresses
+from each subnet's allocation pools without repeats until they are
+released.  If the tenant changes underneath it, invalidate() (or retry())
+makes the next lookup list again.
+'''
+import ipaddress
+from neutronclient.common.exceptions import NotFound
+import threading
+
+
+class TopologyIndex(object):
+    '''Subnets by role and unused member addresses, from one listing.'''
+    def __init__(self, nclientmanager):
+        self.nclientmanager = nclientmanager
+        self._lock = threading.Lock()
+        self._networks = None
+        self._subnets = None
+        self._handed_out = set()
+
+    def _load(self):
+        if self._subnets is None:
+            self._networks = dict(
+                (network['id'], network) for network in
+                self.nclientmanager.list_networks()['networks'])
+            self._subnets = sorted(
+                self.nclientmanager.list_subnets()['subnets'],
+                key=lambda subnet: subnet['name'])
+        return self._subnets
+
+    def invalidate(self):
+        '''Forget the listing; addresses already handed out stay taken.'''
+        with self._lock:
+            self._networks = None
+            self._subnets = None
+
+    def subnet(self, role):
+        '''The first subnet, by name, whose name contains role.'''
+        with self._lock:
+            for subnet in self._load():
+                if role in subnet['name']:
+                    return subnet
+        raise LookupError('No subnet named like %r' % role)
+
+    def network(self, role):
+        '''The network holding subnet(role).'''
+        network_id = self.subnet(role)['network_id']
+        with self._lock:
+            self._load()
+            return self._networks.get(network_id)
+
+    def _free_addresses(self, subnet):
+        taken = set([subnet.get('gateway_ip')]) | self._handed_out
+        for pool in subnet.get('allocation_pools') or []:
+            address = ipaddress.ip_address(pool['start'])
+            end = ipaddress.ip_address(pool['end'])
+            while address <= end:
+                if str(address) not in taken:
+                    yield str(address)
+                address = address + 1
+
+    def allocate_addresses(self, role, count=1):
+        '''Return count addresses of subnet(role) not handed out before.'''
+        subnet = self.subnet(role)
+        with self._lock:
+            addresses = []
+            for address in self._free_addresses(subnet):
+                addresses.append(address)
+                if len(addresses) == count:
+                    break
+            else:
+                raise LookupError('Subnet %s has fewer than %d free '
+                                  'addresses' % (subnet['name'], count))
+            self._handed_out.update(addresses)
+        return addresses
+
+    def release_addresses(self, addresses):
+        '''Let addresses be handed out again, once nothing uses them.'''
+        with self._lock:
+            self._handed_out.difference_update(addresses)
+
+    def retry(self, call):
+        '''Call call(), once more on a fresh listing if it raises NotFound.
+
+        call should do its subnet lookups itself, so the retry sees them.
+        '''
+        try:
+            return call()
+        except NotFound:
+            self.invalidate()
+            return call()
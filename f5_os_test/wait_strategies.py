@@ -0,0 +1,180 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+'''Sleep schedules used by the polling managers between probes.
+
+   A strategy only decides how long to sleep before the next probe and when
+to give up; the managers own the probing.  Each call to ``delays()`` returns
+a fresh iterator, so one strategy instance can be shared by every wait a
+manager performs.  Exhausting the iterator means the wait has failed.
+'''
+import random
+import time
+
+
+class WaitStrategy(object):
+    '''Base class for polling sleep schedules.'''
+    # Seconds to sleep before the very first probe.
+    lead_in = 0
+
+    def delays(self):
+        '''Return an iterator over the seconds to sleep before each probe.'''
+        raise NotImplementedError
+
+
+class FixedWait(WaitStrategy):
+    '''Sleep ``interval`` seconds between probes, ``max_attempts`` times.
+
+    ``max_attempts=None`` never gives up.
+    '''
+    def __init__(self, interval, max_attempts=None):
+        self.interval = interval
+        self.max_attempts = max_attempts
+
+    def delays(self):
+        attempts = 0
+        while self.max_attempts is None or attempts < self.max_attempts:
+            attempts = attempts + 1
+            yield self.interval
+
+
+class ExponentialBackoff(WaitStrategy):
+    '''Multiply the sleep by ``factor`` after each probe, up to a ceiling.'''
+    def __init__(self, initial=.1, factor=2, max_interval=10,
+                 max_attempts=None):
+        self.initial = initial
+        self.factor = factor
+        self.max_interval = max_interval
+        self.max_attempts = max_attempts
+
+    def _schedule(self):
+        delay = self.initial
+        attempts = 0
+        while self.max_attempts is None or attempts < self.max_attempts:
+            attempts = attempts + 1
+            yield min(delay, self.max_interval)
+            delay = delay * self.factor
+
+    def delays(self):
+        return self._schedule()
+
+
+class JitteredBackoff(ExponentialBackoff):
+    '''Exponential backoff with a random share of each sleep removed.
+
+    ``jitter`` is the fraction of each delay that is randomized, so the
+    default of .5 sleeps somewhere between half and all of the exponential
+    delay.  This keeps many fixtures started together from probing in step.
+    '''
+    def __init__(self, initial=.1, factor=2, max_interval=10,
+                 max_attempts=None, jitter=.5):
+        super(JitteredBackoff, self).__init__(
+            initial, factor, max_interval, max_attempts)
+        self.jitter = jitter
+
+    def delays(self):
+        for delay in self._schedule():
+            yield delay * (1 - self.jitter * random.random())
+
+
+class FibonacciBackoff(WaitStrategy):
+    '''Grow the sleep along the Fibonacci sequence in units of ``unit``.'''
+    def __init__(self, unit=.1, max_interval=10, max_attempts=None):
+        self.unit = unit
+        self.max_interval = max_interval
+        self.max_attempts = max_attempts
+
+    def delays(self):
+        previous, current = 0, 1
+        attempts = 0
+        while self.max_attempts is None or attempts < self.max_attempts:
+            attempts = attempts + 1
+            yield min(current * self.unit, self.max_interval)
+            previous, current = current, previous + current
+
+
+class DeadlineWait(WaitStrategy):
+    '''Follow ``strategy`` until ``timeout`` wall-clock seconds have passed.
+
+    The clock starts when ``delays()`` is called, so time spent inside the
+    probes themselves counts against the deadline.  The last sleep is
+    trimmed so the final probe lands on the deadline rather than past it.
+    '''
+    def __init__(self, timeout, strategy=None):
+        self.timeout = timeout
+        self.strategy = strategy or ExponentialBackoff()
+
+    def delays(self):
+        deadline = time.time() + self.timeout
+        for delay in self.strategy.delays():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            yield min(delay, remaining)
+
+
+class LeadInWait(WaitStrategy):
+    '''Wait ``lead_in`` before the first probe, then probe every ``interval``.
+
+    Gives up ``timeout`` seconds after the first probe.  The latency model
+    builds these from how long an operation has taken before.
+    '''
+    def __init__(self, lead_in, interval, timeout):
+        self.lead_in = lead_in
+        self.interval = interval
+        self.timeout = timeout
+
+    def delays(self):
+        return DeadlineWait(self.timeout, FixedWait(self.interval)).delays()
+
+
+STRATEGY_NAMES = ('fixed', 'exponential', 'jittered', 'fibonacci', 'deadline',
+                  'learned')
+
+
+def from_name(name, interval, max_attempts):
+    '''Build a named strategy with the same budget as interval/max_attempts.
+
+    Everything but 'fixed' is bounded by the wall-clock time the fixed
+    schedule would have slept, starting from a fraction of ``interval`` and
+    never sleeping longer than ``interval``.  'learned' is the schedule a
+    latency model falls back to until it has history for an operation,
+    which is 'exponential'.
+    '''
+    budget = interval * max_attempts
+    if name == 'fixed':
+        return FixedWait(interval, max_attempts)
+    elif name in ('exponential', 'learned'):
+        schedule = ExponentialBackoff(initial=interval / 8.,
+                                      max_interval=interval)
+    elif name == 'jittered':
+        schedule = JitteredBackoff(initial=interval / 8.,
+                                   max_interval=interval)
+    elif name == 'fibonacci':
+        schedule = FibonacciBackoff(unit=interval / 8.,
+                                    max_interval=interval)
+    elif name == 'deadline':
+        schedule = FixedWait(interval)
+    else:
+        raise ValueError('Unknown wait strategy: %r' % name)
+    return DeadlineWait(budget, schedule)
+
+
+def resolve(strategy, interval, max_attempts):
+    '''Return a strategy for a manager given an instance, name or None.'''
+    if strategy is None:
+        return FixedWait(interval, max_attempts)
+    if isinstance(strategy, WaitStrategy):
+        return strategy
+    return from_name(strategy, interval, max_attempts)
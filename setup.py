@@ -35,20 +35,32 @@ setup(
                       'mock >= 1.3.0',
                       'f5-sdk >= 0.1.3',
                       'python-neutronclient >= 4.1.2.dev5',
+                      'keystoneauth1 >= 2.0.0',
                       'python-keystoneclient >= 2.3.1',
                       'python-heatclient >= 1.1.0',
                       'python-glanceclient >= 2.0.0'],
+    # async_polling's coroutines are part of the pytest11 plugins.
+    python_requires='>=3.5',
     packages=['f5_os_test'],
     entry_points={
         'pytest11': ['poll_fix = f5_os_test.polling_clients',
                      'infra_fix = f5_os_test.infrastructure',
-                     'heat_utils = f5_os_test.heat_client_utils']
+                     'heat_utils = f5_os_test.heat_client_utils',
+                     'timing = f5_os_test.timing',
+                     'fake_openstack = f5_os_test.fake_openstack',
+                     'async_polling = f5_os_test.async_polling',
+                     'cassette = f5_os_test.cassette',
+                     'api_budget = f5_os_test.api_budget',
+                     'image_cache = f5_os_test.image_cache'],
+        'console_scripts': [
+            'f5-os-test-benchmarks = f5_os_test.benchmarks:main']
     },
     classifiers=[
         'Development Status :: 3 - Alpha',
         'License :: OSI Approved :: Apache Software License',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
+        'Programming Language :: Python :: 3',
         'Intended Audience :: Developers',
     ]
 )
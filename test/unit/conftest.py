@@ -0,0 +1,68 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from f5_os_test.async_polling import async_gather  # noqa
+from f5_os_test.auth_session import make_session
+from f5_os_test.fake_openstack import FakeOpenStack
+from f5_os_test.fake_openstack import FakeOpenStackServer
+from f5_os_test import polling_clients
+import pytest
+
+
+@pytest.fixture(scope='session')
+def fake_server(request):
+    '''A FakeOpenStack served locally for the whole test run.'''
+    server = FakeOpenStackServer(FakeOpenStack(delay=.01)).start()
+    request.addfinalizer(server.stop)
+    return server
+
+
+@pytest.fixture(scope='session')
+def fake_session(fake_server):
+    backend = fake_server.backend
+    return make_session(backend.endpoints['identity'], 'testlab',
+                        'changeme', backend.tenant_name)
+
+
+@pytest.fixture
+def backend(fake_server):
+    return fake_server.backend
+
+
+@pytest.fixture
+def neutron(fake_session):
+    return polling_clients.NeutronClientPollingManager(
+        session=fake_session, wait_strategy='exponential', namespace='ut-')
+
+
+@pytest.fixture
+def heat(fake_server, fake_session):
+    return polling_clients.HeatClientPollingManager(
+        endpoint=fake_server.backend.endpoints['orchestration'],
+        session=fake_session, wait_strategy='exponential')
+
+
+@pytest.fixture
+def client_subnet(backend):
+    for subnet in backend.subnets.values():
+        if 'client-v4' in subnet['name']:
+            return subnet
+
+
+@pytest.fixture
+def glance(fake_server, fake_session):
+    return polling_clients.GlanceClientPollingManager(
+        endpoint=fake_server.backend.endpoints['image'],
+        session=fake_session, wait_strategy='exponential')
@@ -0,0 +1,78 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import subprocess
+import sys
+
+
+BUDGETED_TESTS = '''
+from f5_os_test import api_budget
+import pytest
+from requests.adapters import HTTPAdapter
+
+
+@pytest.fixture(scope='session')
+def lazy_pool():
+    filled = []
+
+    def lease():
+        if not filled:
+            with api_budget.shared_calls():
+                for _ in range(5):
+                    api_budget.COUNTER.count('GET', '/v2.0/lbaas/pools')
+            filled.append(True)
+    return lease
+
+
+def test_patch_follows_the_option(request):
+    enabled = request.config.getoption('--api-budget')
+    patched = HTTPAdapter.send.__name__ == 'counted_send'
+    assert patched == enabled
+
+
+@pytest.mark.api_budget(neutron_list=2)
+def test_pool_filling_is_not_charged(lazy_pool):
+    lazy_pool()
+    api_budget.COUNTER.count('GET', '/v2.0/lbaas/loadbalancers')
+
+
+@pytest.mark.api_budget(neutron_list=0)
+def test_over_budget():
+    api_budget.COUNTER.count('GET', '/v2.0/lbaas/loadbalancers')
+'''
+
+
+def _run(tmp_path, *options):
+    (tmp_path / 'test_budgeted.py').write_text(BUDGETED_TESTS)
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    return subprocess.run(
+        [sys.executable, '-m', 'pytest', '-q', '-p', 'no:cacheprovider',
+         '-p', 'f5_os_test.api_budget', str(tmp_path)] + list(options),
+        cwd=str(tmp_path), env=environment, stdout=subprocess.PIPE,
+        universal_newlines=True).stdout
+
+
+def test_nothing_is_counted_without_the_option(tmp_path):
+    output = _run(tmp_path)
+    assert '3 passed' in output
+    assert 'API calls per test' not in output
+
+
+def test_budgets_are_enforced_with_the_option(tmp_path):
+    output = _run(tmp_path, '--api-budget')
+    assert '3 passed, 1 error' in output
+    assert 'test_over_budget' in output
+    assert 'neutron_list=1 (allowed 0)' in output
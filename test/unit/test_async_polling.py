@@ -0,0 +1,91 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from f5_os_test.exceptions import ProvisioningFailed
+from f5_os_test.exceptions import StackFailed
+import pytest
+
+
+def test_async_gather_creates_listeners(async_gather, neutron,
+                                        client_subnet):
+    lb = neutron.create_loadbalancer({'loadbalancer': {
+        'vip_subnet_id': client_subnet['id'], 'name': 'ut-async'}})
+    lbid = lb['loadbalancer']['id']
+
+    first, second = async_gather(*[
+        neutron.acreate_listener({'listener': {
+            'loadbalancer_id': lbid, 'protocol': 'HTTP',
+            'protocol_port': port, 'name': 'ut-async-%d' % port}})
+        for port in (80, 8080)])
+
+    listeners = neutron.list_listeners()['listeners']
+    assert set([first['listener']['id'], second['listener']['id']]) <=\
+        set(listener['id'] for listener in listeners)
+    async_gather(neutron.adelete_listener(first['listener']['id']),
+                 neutron.adelete_listener(second['listener']['id']))
+    neutron.delete_loadbalancer(lbid)
+
+
+STACK_TEMPLATE = '''heat_template_version: 2015-04-30
+resources:
+  first: {type: 'OS::Heat::None'}
+'''
+
+
+@pytest.mark.parametrize('completion', ['events', 'poll'])
+def test_async_stack_follows_completion_setting(async_gather, heat, backend,
+                                                completion):
+    heat.completion = completion
+    backend.calls.clear()
+    stack, = async_gather(heat.acreate_stack({
+        'stack_name': 'ut-async-%s' % completion,
+        'template': STACK_TEMPLATE}))
+    assert stack.stack_status == 'CREATE_COMPLETE'
+    async_gather(heat.adelete_stack(stack.id))
+    # Events mode lists the event stream; poll mode only shows the stack.
+    assert bool(backend.calls[('orchestration', 'list')]) ==\
+        (completion == 'events')
+
+
+def test_async_stack_failure_raises(async_gather, heat, backend):
+    backend.fail_names.add('ut-async-broken')
+    with pytest.raises(StackFailed):
+        async_gather(heat.acreate_stack({'stack_name': 'ut-async-broken',
+                                         'template': STACK_TEMPLATE}))
+
+
+def test_async_delete_again_waits_for_the_new_delete(async_gather, heat,
+                                                     backend):
+    stack, = async_gather(heat.acreate_stack({
+        'stack_name': 'ut-async-delete-again', 'template': STACK_TEMPLATE}))
+    backend.fail_deletes.add('ut-async-delete-again')
+    with pytest.raises(StackFailed):
+        async_gather(heat.adelete_stack(stack.id))
+    backend.fail_deletes.discard('ut-async-delete-again')
+    last, = async_gather(heat.adelete_stack(stack.id))
+    assert last.resource_status == 'DELETE_COMPLETE'
+
+
+def test_async_child_create_under_an_errored_loadbalancer_fails(
+        async_gather, neutron, backend, client_subnet):
+    lb = neutron.create_loadbalancer({'loadbalancer': {
+        'vip_subnet_id': client_subnet['id'], 'name': 'ut-async-broken-lb'}})
+    lbid = lb['loadbalancer']['id']
+    backend.loadbalancers[lbid]['provisioning_status'] = 'ERROR'
+    with pytest.raises(ProvisioningFailed):
+        async_gather(neutron.acreate_listener({'listener': {
+            'loadbalancer_id': lbid, 'protocol': 'HTTP',
+            'protocol_port': 80, 'name': 'ut-async-orphan'}}))
+    neutron.delete_loadbalancer(lbid)
@@ -0,0 +1,80 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from f5_os_test.auth_session import make_session
+from f5_os_test.auth_session import TokenCache
+from f5_os_test import polling_clients
+import json
+import pytest
+
+
+@pytest.fixture
+def token_cache(tmp_path):
+    return TokenCache(str(tmp_path / 'tokens.json'))
+
+
+def _login(backend, token_cache, username='testlab'):
+    session = make_session(backend.endpoints['identity'], username,
+                           'changeme', backend.tenant_name,
+                           token_cache=token_cache)
+    return session.get_token()
+
+
+def test_token_is_shared_through_the_cache(backend, token_cache):
+    issued = len(backend.tokens)
+    token = _login(backend, token_cache)
+    assert _login(backend, token_cache) == token
+    assert len(backend.tokens) == issued + 1
+
+
+def test_expired_token_is_used_but_not_cached(backend, token_cache,
+                                              monkeypatch):
+    monkeypatch.setattr(backend, 'token_lifetime', -60)
+    assert _login(backend, token_cache) in backend.tokens
+    with token_cache.locked() as entries:
+        assert entries == {}
+
+
+def test_expired_tokens_of_other_keys_are_pruned(backend, token_cache):
+    _login(backend, token_cache, username='other')
+    with token_cache.locked() as entries:
+        (key, state), = entries.items()
+        # Age the other user's token past its expiry.
+        state = json.loads(state)
+        state['body']['access']['token']['expires'] = '2000-01-01T00:00:00Z'
+        entries[key] = json.dumps(state)
+    _login(backend, token_cache)
+    with token_cache.locked() as entries:
+        assert [key.rsplit('|', 1)[-1] for key in entries] == ['testlab']
+
+
+def test_managers_share_one_token_and_connection_pool(backend):
+    session = make_session(backend.endpoints['identity'], 'testlab',
+                           'changeme', backend.tenant_name, pool_size=3)
+    issued = len(backend.tokens)
+    neutron = polling_clients.NeutronClientPollingManager(session=session)
+    heat = polling_clients.HeatClientPollingManager(
+        endpoint=backend.endpoints['orchestration'], session=session)
+    glance = polling_clients.GlanceClientPollingManager(
+        endpoint=backend.endpoints['image'], session=session)
+    neutron.list_loadbalancers()
+    list(heat.stacks.list())
+    list(glance.images.list())
+    assert len(backend.tokens) == issued + 1
+    adapter = session.session.get_adapter(backend.endpoints['network'])
+    pool, = [adapter.poolmanager.pools[key]
+             for key in adapter.poolmanager.pools.keys()]
+    # Three services on one host, all through one kept-alive connection.
+    assert (pool.pool.maxsize, pool.num_connections) == (3, 1)
@@ -0,0 +1,66 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from f5_os_test import bigip_devices
+import pytest
+import requests
+
+
+class BigIP(object):
+    '''Stands in for f5.bigip.BigIP, recording each login.'''
+    logins = []
+
+    def __init__(self, netloc, username, password):
+        self.logins.append(netloc)
+        self.alive = True
+        self.session = requests.Session()
+        self._meta_data = {'icr_session': self,
+                           'uri': 'https://%s/mgmt/tm/' % netloc}
+
+    def get(self, uri):
+        if not self.alive:
+            raise requests.ConnectionError(uri)
+
+
+@pytest.fixture
+def devices(monkeypatch):
+    monkeypatch.setattr(BigIP, 'logins', [])
+    monkeypatch.setattr(bigip_devices, 'BigIP', BigIP)
+    devices = bigip_devices.BigIPDevices(['a', 'b'], 'admin', 'admin',
+                                         pool_size=2)
+    yield devices
+    devices.close()
+
+
+def test_devices_connect_on_first_use_only(devices):
+    assert BigIP.logins == []
+    first = devices.device()
+    assert devices.device('a') is first
+    assert BigIP.logins == ['a']
+
+
+def test_dead_connection_is_rebuilt(devices):
+    first = devices.device()
+    first.alive = False
+    second = devices.device()
+    assert second is not first
+    assert BigIP.logins == ['a', 'a']
+
+
+def test_ha_pair_shares_one_connection_pool(devices):
+    first, second = devices.devices()
+    assert BigIP.logins == ['a', 'b']
+    assert first.session.get_adapter('https://a/') is\
+        second.session.get_adapter('https://b/') is devices.adapter
@@ -0,0 +1,63 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from f5_os_test.auth_session import make_session
+from f5_os_test import cassette
+from f5_os_test import polling_clients
+from f5_os_test.polling_clients import PollingMixin
+import pytest
+import requests
+
+
+def test_request_key_ignores_host_and_query_order():
+    assert cassette.request_key(
+        'GET', 'http://one:9696/v2.0/lbaas/pools?id=b&fields=id') ==\
+        cassette.request_key(
+            'GET', 'https://two/v2.0/lbaas/pools?fields=id&id=b')
+
+
+def _create(session, subnet_id):
+    neutron = polling_clients.NeutronClientPollingManager(
+        session=session, wait_strategy='exponential')
+    return neutron.create_loadbalancer({'loadbalancer': {
+        'vip_subnet_id': subnet_id, 'name': 'ut-cassette'}})['loadbalancer']
+
+
+def test_replay_answers_a_recorded_run_without_network(
+        tmp_path, backend, client_subnet):
+    recorded = cassette.Cassette(str(tmp_path / 'run.json.gz'))
+    cassette.install(recorded, 'record')
+    try:
+        lb = _create(make_session(backend.endpoints['identity'], 'testlab',
+                                  'changeme', backend.tenant_name),
+                     client_subnet['id'])
+    finally:
+        cassette.uninstall()
+    recorded.save()
+    backend.delete_lbaas('loadbalancers', lb['id'])
+
+    replayed = cassette.Cassette(recorded.path).load()
+    cassette.install(replayed, 'replay')
+    try:
+        assert PollingMixin.skip_sleeps
+        # Nothing listens on the discard port; every answer is recorded.
+        session = make_session('http://127.0.0.1:9/v2.0', 'testlab',
+                               'changeme', backend.tenant_name)
+        assert _create(session, client_subnet['id']) == lb
+        with pytest.raises(cassette.CassetteMiss):
+            requests.get('http://127.0.0.1:9/never/recorded')
+    finally:
+        cassette.uninstall()
+    assert not PollingMixin.skip_sleeps
@@ -0,0 +1,112 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from f5_os_test.collection_waiter import CollectionWaiter
+import pytest
+import threading
+import time
+
+
+class Fetch(object):
+    '''A fetch that holds each call until let_go, recording what it got.'''
+    def __init__(self, failures=0):
+        self.requests = []
+        self.failures = failures
+        self.started = threading.Semaphore(0)
+        self.release = threading.Event()
+
+    def __call__(self, key, requested):
+        self.requests.append(requested)
+        self.started.release()
+        assert self.release.wait(5)
+        if self.failures:
+            self.failures = self.failures - 1
+            raise RuntimeError('list failed')
+        return dict((resource_id, {'id': resource_id})
+                    for resource_id in requested)
+
+    def let_go(self):
+        self.release.set()
+
+
+def _in_thread(function, *args):
+    outcome = {}
+
+    def run():
+        try:
+            outcome['result'] = function(*args)
+        except Exception as exc:
+            outcome['error'] = exc
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+
+def _second_waiter(fetch, waiter, resource_ids):
+    '''Start one snapshot, then a second once the first is fetching.'''
+    first = _in_thread(waiter.snapshot, 'members', ['a'])
+    assert fetch.started.acquire(timeout=5)
+    second = _in_thread(waiter.snapshot, 'members', resource_ids)
+    # Give the second waiter time to block on the in-flight fetch.
+    time.sleep(.2)
+    fetch.let_go()
+    for thread, _ in (first, second):
+        thread.join(5)
+        assert not thread.is_alive()
+    return first[1], second[1]
+
+
+def test_covered_waiter_shares_the_in_flight_fetch():
+    fetch = Fetch()
+    waiter = CollectionWaiter(fetch)
+    first, second = _second_waiter(fetch, waiter, ['a'])
+    assert fetch.requests == [frozenset(['a'])]
+    assert first['result'] is second['result']
+
+
+def test_uncovered_waiter_gets_a_fresh_fetch():
+    fetch = Fetch()
+    waiter = CollectionWaiter(fetch)
+    first, second = _second_waiter(fetch, waiter, ['b'])
+    assert fetch.requests == [frozenset(['a']), frozenset(['b'])]
+    assert 'b' in second['result']
+    assert 'b' not in first['result']
+
+
+def test_fetch_includes_every_pending_id():
+    fetch = Fetch()
+    fetch.let_go()
+    waiter = CollectionWaiter(fetch)
+    with waiter.pending('members', ['a', 'b']):
+        assert waiter.pending_ids('members') == frozenset(['a', 'b'])
+        waiter.snapshot('members', ['a'])
+    assert fetch.requests == [frozenset(['a', 'b'])]
+    assert waiter.pending_ids('members') == frozenset()
+
+
+def test_failed_fetch_wakes_the_waiters():
+    fetch = Fetch(failures=1)
+    waiter = CollectionWaiter(fetch)
+    first, second = _second_waiter(fetch, waiter, ['a'])
+    assert isinstance(first['error'], RuntimeError)
+    assert second['result'] == {'a': {'id': 'a'}}
+    assert len(fetch.requests) == 2
+
+
+def test_failed_fetch_raises_to_its_caller():
+    fetch = Fetch(failures=1)
+    fetch.let_go()
+    with pytest.raises(RuntimeError):
+        CollectionWaiter(fetch).snapshot('members', ['a'])
@@ -0,0 +1,99 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from f5_os_test.fake_openstack import FakeError
+from f5_os_test.fake_openstack import FakeOpenStack
+from f5_os_test.fake_openstack import FakeOpenStackServer
+from neutronclient.common.exceptions import StateInvalidClient
+from neutronclient.v2_0.client import Client as NeutronClient
+import pytest
+import time
+
+
+def _loadbalancer(backend):
+    subnet_id = next(iter(backend.subnets))
+    return backend.create_lbaas('loadbalancers', {'vip_subnet_id': subnet_id})
+
+
+def test_objects_pend_for_the_configured_delay():
+    backend = FakeOpenStack(delay=.1)
+    lb = _loadbalancer(backend)
+    assert backend.show('loadbalancers', lb['id'])['provisioning_status'] ==\
+        'PENDING_CREATE'
+    time.sleep(.15)
+    assert backend.show('loadbalancers', lb['id'])['provisioning_status'] ==\
+        'ACTIVE'
+
+
+def test_changes_to_a_busy_loadbalancer_are_refused():
+    backend = FakeOpenStack(delay=.1)
+    lb = _loadbalancer(backend)
+    with pytest.raises(FakeError) as refused:
+        backend.create_lbaas('listeners', {
+            'loadbalancer_id': lb['id'], 'protocol': 'HTTP',
+            'protocol_port': 80})
+    assert (refused.value.status, refused.value.error_type) ==\
+        (409, 'StateInvalid')
+
+
+def test_children_settle_with_their_loadbalancer():
+    backend = FakeOpenStack()
+    lb = _loadbalancer(backend)
+    listener = backend.create_lbaas('listeners', {
+        'loadbalancer_id': lb['id'], 'protocol': 'HTTP',
+        'protocol_port': 80})
+    assert backend.show('listeners', listener['id'])[
+        'provisioning_status'] == 'ACTIVE'
+    with pytest.raises(FakeError) as in_use:
+        backend.delete_lbaas('loadbalancers', lb['id'])
+    assert in_use.value.error_type == 'EntityInUse'
+    backend.delete_lbaas('listeners', listener['id'])
+    backend.delete_lbaas('loadbalancers', lb['id'])
+    assert not backend.list('loadbalancers', {})
+
+
+def test_names_in_fail_names_end_in_error():
+    backend = FakeOpenStack(fail_names=['broken'])
+    lb = _loadbalancer(backend)
+    listener = backend.create_lbaas('listeners', {
+        'loadbalancer_id': lb['id'], 'protocol': 'HTTP',
+        'protocol_port': 80, 'name': 'broken'})
+    assert backend.show('listeners', listener['id'])[
+        'provisioning_status'] == 'ERROR'
+
+
+def test_list_filters_on_the_query_and_trims_fields():
+    backend = FakeOpenStack()
+    _loadbalancer(backend)
+    second = _loadbalancer(backend)
+    listed = backend.list('loadbalancers', {'id': [second['id']],
+                                            'fields': ['id']})
+    assert listed == [{'id': second['id']}]
+
+
+def test_contention_reaches_the_client_as_state_invalid():
+    server = FakeOpenStackServer(FakeOpenStack(contention=1.)).start()
+    try:
+        backend = server.backend
+        lb = _loadbalancer(backend)
+        token = backend.issue_token({'auth': {}})['access']['token']['id']
+        neutron = NeutronClient(endpoint_url=backend.endpoints['network'],
+                                token=token)
+        with pytest.raises(StateInvalidClient):
+            neutron.create_listener({'listener': {
+                'loadbalancer_id': lb['id'], 'protocol': 'HTTP',
+                'protocol_port': 80}})
+    finally:
+        server.stop()
@@ -0,0 +1,91 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from f5_os_test.heat_client_utils import StackCache
+from f5_os_test.heat_client_utils import stack_fingerprint
+from heatclient.exc import HTTPNotFound
+
+
+TEMPLATE = '''heat_template_version: 2015-04-30
+resources:
+  first: {type: 'OS::Heat::None'}
+'''
+
+
+def _create(heat, name):
+    return heat.create_stack({'stack_name': name, 'template': TEMPLATE})
+
+
+def _live_names(heat):
+    return set(stack.stack_name for stack in heat.stacks.list())
+
+
+def test_same_fingerprint_different_names_are_both_kept(heat):
+    cache = StackCache(heat, limit=4)
+    fingerprint = stack_fingerprint(TEMPLATE, {}, {})
+    for name in ('ut-cache-s1', 'ut-cache-s2'):
+        assert cache.get(fingerprint, name) is None
+        cache.put(fingerprint, _create(heat, name))
+    assert cache.get(fingerprint, 'ut-cache-s1').stack_name == 'ut-cache-s1'
+    cache.close()
+    assert not _live_names(heat) & set(['ut-cache-s1', 'ut-cache-s2'])
+
+
+def test_put_deletes_the_stack_it_displaces(heat):
+    cache = StackCache(heat, limit=4)
+    fingerprint = stack_fingerprint(TEMPLATE, {}, {})
+    first = _create(heat, 'ut-cache-twice')
+    cache.put(fingerprint, first)
+    heat.delete_stack(first.id)
+    cache.put(fingerprint, _create(heat, 'ut-cache-twice'))
+    cache.close()
+    assert 'ut-cache-twice' not in _live_names(heat)
+
+
+def test_limit_evicts_least_recently_used(heat):
+    cache = StackCache(heat, limit=1)
+    cache.put('a', _create(heat, 'ut-cache-a'))
+    cache.put('b', _create(heat, 'ut-cache-b'))
+    assert 'ut-cache-a' not in _live_names(heat)
+    cache.close()
+
+
+def _not_found(stack_id):
+    raise HTTPNotFound()
+
+
+def test_stack_deleted_out_of_band_is_forgotten(heat, monkeypatch):
+    cache = StackCache(heat, limit=4)
+    fingerprint = stack_fingerprint(TEMPLATE, {}, {})
+    stack = _create(heat, 'ut-cache-gone')
+    cache.put(fingerprint, stack)
+    heat.delete_stack(stack.id)
+    monkeypatch.setattr(heat.stacks, 'get', _not_found)
+    assert cache.get(fingerprint, 'ut-cache-gone') is None
+    assert not cache._stacks
+
+
+def test_stacks_are_deleted_outside_the_lock(heat, monkeypatch):
+    cache = StackCache(heat, limit=1)
+    delete_stack = heat.delete_stack
+
+    def unlocked_delete(stack_id):
+        assert not cache._lock.locked()
+        return delete_stack(stack_id)
+    monkeypatch.setattr(heat, 'delete_stack', unlocked_delete)
+    cache.put('a', _create(heat, 'ut-cache-lock-a'))
+    cache.put('b', _create(heat, 'ut-cache-lock-b'))
+    cache.close()
+    assert not _live_names(heat) & set(['ut-cache-lock-a', 'ut-cache-lock-b'])
@@ -0,0 +1,74 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from f5_os_test.image_cache import ImageCache
+import pytest
+
+
+@pytest.fixture
+def image_files(tmp_path):
+    paths = []
+    for number in range(3):
+        path = tmp_path / ('image%d.qcow2' % number)
+        path.write_bytes(b'image %d' % number)
+        paths.append(str(path))
+    return paths
+
+
+@pytest.fixture
+def cache(request, glance):
+    cache = ImageCache(glance, limit=1)
+    request.addfinalizer(lambda: [glance.images.delete(image['id'])
+                                  for image in list(cache._images.values())])
+    return cache
+
+
+def _upload(cache, path):
+    return cache.get(path, name='ut-image', disk_format='qcow2',
+                     container_format='bare')
+
+
+def test_leased_image_is_not_evicted(cache, backend, image_files):
+    first = _upload(cache, image_files[0])
+    second = _upload(cache, image_files[1])
+    assert first['id'] in backend.images
+    assert second['id'] in backend.images
+    cache.release(first)
+    assert first['id'] not in backend.images
+    assert second['id'] in backend.images
+
+
+def test_lease_hands_back_the_same_image(cache, backend, image_files):
+    with cache.lease(image_files[0], name='ut-image', disk_format='qcow2',
+                     container_format='bare') as image:
+        assert _upload(cache, image_files[0])['id'] == image['id']
+        cache.release(image)
+    assert image['id'] in backend.images
+
+
+def test_delete_runs_outside_the_lock(cache, glance, monkeypatch,
+                                      image_files):
+    deleted = []
+
+    def delete(image_id):
+        assert not cache._lock.locked()
+        deleted.append(image_id)
+    monkeypatch.setattr(glance.images, 'delete', delete)
+    first = _upload(cache, image_files[0])
+    cache.release(first)
+    with cache.lease(image_files[1], name='ut-image', disk_format='qcow2',
+                     container_format='bare'):
+        pass
+    assert deleted == [first['id']]
@@ -0,0 +1,104 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from f5_os_test.exceptions import MaximumNumberOfAttemptsExceeded
+from f5_os_test import latency_model
+from f5_os_test.latency_model import LatencyModel
+from f5_os_test.polling_clients import ClientManagerMixin
+from f5_os_test.timing import TimingRecorder
+from f5_os_test.wait_strategies import DeadlineWait
+from f5_os_test.wait_strategies import FixedWait
+import pytest
+
+
+FALLBACK = FixedWait(1, 30)
+
+
+def _model(durations, **kwargs):
+    model = LatencyModel(**kwargs)
+    for duration in durations:
+        model.observe('loadbalancer', 'create', duration)
+    return model
+
+
+def test_falls_back_until_enough_samples():
+    model = _model([2.] * (latency_model.MIN_SAMPLES - 1))
+    assert model.strategy('loadbalancer', 'create', FALLBACK) is FALLBACK
+
+
+def test_schedule_follows_the_history():
+    strategy = _model([float(seconds) for seconds in range(1, 11)])\
+        .strategy('loadbalancer', 'create', FALLBACK)
+    assert strategy.lead_in == 1.
+    assert strategy.interval == (9. - 1.) / latency_model.PROBES_PER_SPREAD
+    assert strategy.timeout == 10. * latency_model.TIMEOUT_FACTOR
+
+
+def test_interval_is_floored_at_the_managers_interval():
+    strategy = _model([.01] * 10).strategy('loadbalancer', 'create',
+                                           FALLBACK, min_interval=.4)
+    assert strategy.interval == .4
+    assert strategy.timeout == latency_model.MIN_TIMEOUT
+
+
+def test_timeouts_widen_the_next_timeout():
+    fallback = DeadlineWait(100)
+    model = _model([1.] * 20)
+    assert model.strategy('loadbalancer', 'create', fallback).timeout ==\
+        latency_model.MIN_TIMEOUT
+    model.observe('loadbalancer', 'create', 30., censored=True)
+    strategy = model.strategy('loadbalancer', 'create', fallback)
+    assert strategy.timeout == 30. * latency_model.TIMEOUT_GROWTH
+
+
+def test_repeated_timeouts_stop_growing_at_the_cap():
+    fallback = DeadlineWait(30)
+    cap = 30 * latency_model.MAX_TIMEOUT_FACTOR
+    model = _model([1.] * 20)
+    timeouts = []
+    for _ in range(8):
+        timeout = model.strategy('loadbalancer', 'create', fallback).timeout
+        timeouts.append(timeout)
+        model.observe('loadbalancer', 'create', timeout, censored=True)
+    assert timeouts == [10, 20, 40, 80, cap, cap, cap, cap]
+    # A fixed schedule's budget is its interval times its attempts.
+    assert model.strategy('loadbalancer', 'create',
+                          FixedWait(1, 3)).timeout ==\
+        3 * latency_model.MAX_TIMEOUT_FACTOR
+
+
+def test_scopes_keep_their_own_history(tmp_path):
+    path = str(tmp_path / 'history.json')
+    fast = _model([.01] * 10, path=path, scope='http://fake:5000/v2.0')
+    fast.save()
+    lab = LatencyModel(path, scope='http://lab:5000/v2.0').load()
+    assert lab.strategy('loadbalancer', 'create', FALLBACK) is FALLBACK
+
+
+class Waiter(ClientManagerMixin):
+    def __init__(self, **kwargs):
+        self._configure_polling(kwargs, .01, 3)
+
+
+def test_wait_that_gives_up_is_recorded_as_censored():
+    model = LatencyModel()
+    waiter = Waiter(wait_strategy='learned', latency_model=model,
+                    timing_recorder=TimingRecorder())
+    with pytest.raises(MaximumNumberOfAttemptsExceeded):
+        with waiter.timing_recorder.measure('loadbalancer', 'create'):
+            waiter.wait_until(lambda: False)
+    (key, entries), = model._history.items()
+    assert key.endswith('loadbalancer/create')
+    assert entries[0][1] == 1
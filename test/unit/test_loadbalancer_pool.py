@@ -0,0 +1,69 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from f5_os_test.loadbalancer_pool import LoadbalancerPool
+from f5_os_test.topology import TopologyIndex
+import pytest
+
+
+@pytest.fixture
+def pool(request, neutron, client_subnet):
+    pool = LoadbalancerPool(neutron, lambda: {'loadbalancer': {
+        'vip_subnet_id': client_subnet['id'],
+        'name': neutron.namespaced('pooled')}})
+    request.addfinalizer(pool.close)
+    return pool
+
+
+def test_renamed_loadbalancer_is_reset_and_leased_again(pool, neutron,
+                                                        backend,
+                                                        monkeypatch):
+    # Long enough for the reset's update to still be pending when checked.
+    monkeypatch.setattr(backend, 'delay', .3)
+    lb = pool.lease()
+    lbid = lb['loadbalancer']['id']
+    neutron.update_loadbalancer(lbid, {'loadbalancer': {'name': 'renamed'}})
+    pool.release(lb)
+    assert pool.loadbalancer_ids == set([lbid])
+    assert lbid in backend.loadbalancers
+    again = pool.lease()
+    assert again['loadbalancer']['id'] == lbid
+    assert backend.loadbalancers[lbid]['name'] == neutron.namespaced('pooled')
+    assert backend.loadbalancers[lbid]['provisioning_status'] == 'ACTIVE'
+    pool.release(again)
+
+
+def test_release_strips_children(pool, neutron, backend):
+    lb = pool.lease()
+    lbid = lb['loadbalancer']['id']
+    neutron.create_listener({'listener': {
+        'loadbalancer_id': lbid, 'protocol': 'HTTP', 'protocol_port': 80,
+        'name': neutron.namespaced('pooled-listener')}})
+    pool.release(lb)
+    assert not backend.loadbalancers[lbid]['listeners']
+    assert pool.lease()['loadbalancer']['id'] == lbid
+
+
+def test_create_retries_on_a_fresh_topology(request, neutron, client_subnet):
+    topology = TopologyIndex(neutron)
+    # A listing from before the subnet was replaced.
+    topology._subnets = [dict(subnet, id='0' * 32)
+                         for subnet in topology._load()]
+    pool = LoadbalancerPool(neutron, lambda: {'loadbalancer': {
+        'vip_subnet_id': topology.subnet('client-v4')['id'],
+        'name': neutron.namespaced('pooled-retry')}}, retry=topology.retry)
+    request.addfinalizer(pool.close)
+    assert pool.lease()['loadbalancer']['vip_subnet_id'] ==\
+        client_subnet['id']
@@ -0,0 +1,334 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from f5_os_test.exceptions import ImageUploadFailed
+from f5_os_test.exceptions import ProvisioningFailed
+from f5_os_test.exceptions import StackFailed
+from f5_os_test import polling_clients
+from f5_os_test import teardown
+from neutronclient.v2_0.client import Client as NeutronClient
+import hashlib
+import os
+import pytest
+import threading
+import time
+
+
+STACK_TEMPLATE = '''heat_template_version: 2015-04-30
+resources:
+  first: {type: 'OS::Heat::None'}
+'''
+
+
+def test_delete_again_waits_for_the_new_delete(heat, backend):
+    stack = heat.create_stack({'stack_name': 'ut-delete-again',
+                               'template': STACK_TEMPLATE})
+    backend.fail_deletes.add('ut-delete-again')
+    with pytest.raises(StackFailed):
+        heat.delete_stack(stack.id)
+    backend.fail_deletes.discard('ut-delete-again')
+    last = heat.delete_stack(stack.id)
+    assert last.resource_status == 'DELETE_COMPLETE'
+
+
+def test_create_of_a_reused_name_follows_the_new_stack(heat, backend):
+    backend.fail_names.add('ut-reused')
+    with pytest.raises(StackFailed):
+        heat.create_stack({'stack_name': 'ut-reused',
+                           'template': STACK_TEMPLATE})
+    backend.fail_names.discard('ut-reused')
+    broken, = [stack for stack in heat.stacks.list()
+               if stack.stack_name == 'ut-reused']
+    heat.delete_stack(broken.id)
+    stack = heat.create_stack({'stack_name': 'ut-reused',
+                               'template': STACK_TEMPLATE})
+    assert stack.stack_status == 'CREATE_COMPLETE'
+    heat.delete_stack(stack.id)
+
+
+@pytest.fixture
+def broken_lb(request, neutron, backend, client_subnet):
+    lb = neutron.create_loadbalancer({'loadbalancer': {
+        'vip_subnet_id': client_subnet['id'],
+        'name': neutron.namespaced('broken')}})['loadbalancer']
+    backend.loadbalancers[lb['id']]['provisioning_status'] = 'ERROR'
+    request.addfinalizer(lambda: neutron.delete_loadbalancer(lb['id']))
+    return lb
+
+
+def test_child_create_under_an_errored_loadbalancer_fails_at_once(
+        neutron, broken_lb):
+    with pytest.raises(ProvisioningFailed) as failed:
+        neutron.create_listener({'listener': {
+            'loadbalancer_id': broken_lb['id'], 'protocol': 'HTTP',
+            'protocol_port': 80, 'name': neutron.namespaced('orphan')}})
+    assert failed.value.resource_id == broken_lb['id']
+
+
+def test_concurrent_waits_share_one_list_call(neutron, client_subnet):
+    lb = neutron.create_loadbalancer({'loadbalancer': {
+        'vip_subnet_id': client_subnet['id'],
+        'name': neutron.namespaced('shared')}})['loadbalancer']
+    listener_ids = [neutron.create_listener({'listener': {
+        'loadbalancer_id': lb['id'], 'protocol': 'HTTP',
+        'protocol_port': port}})['listener']['id'] for port in (80, 81)]
+    listed, started, release = [], threading.Event(), threading.Event()
+    list_ids_filtered = neutron._list_ids_filtered
+
+    def held(collection, resource_ids):
+        listed.append(collection)
+        started.set()
+        assert release.wait(5)
+        return list_ids_filtered(collection, resource_ids)
+    neutron._list_ids_filtered = held
+    try:
+        waits = [threading.Thread(target=neutron.wait_for_ids,
+                                  args=('listeners', listener_ids))]
+        waits[0].start()
+        assert started.wait(5)
+        waits.append(threading.Thread(target=neutron.wait_for_ids,
+                                      args=('listeners', listener_ids[:1])))
+        waits[1].start()
+        # Give the second wait time to block on the in-flight list call.
+        time.sleep(.2)
+        release.set()
+        for wait in waits:
+            wait.join(5)
+            assert not wait.is_alive()
+    finally:
+        del neutron._list_ids_filtered
+    assert listed == ['listeners']
+    teardown.delete_created(neutron)
+
+
+@pytest.fixture
+def listeners(neutron, client_subnet):
+    lb = neutron.create_loadbalancer({'loadbalancer': {
+        'vip_subnet_id': client_subnet['id'],
+        'name': neutron.namespaced('probed')}})['loadbalancer']
+    yield [neutron.create_listener({'listener': {
+        'loadbalancer_id': lb['id'], 'protocol': 'HTTP',
+        'protocol_port': port}})['listener']['id'] for port in (80, 81, 82)]
+    teardown.delete_created(neutron)
+
+
+def _recorded_listings(monkeypatch):
+    queries = []
+    list_listeners = NeutronClient.list_listeners
+
+    def recording(self, **query):
+        queries.append(query)
+        return list_listeners(self, **query)
+    monkeypatch.setattr(NeutronClient, 'list_listeners', recording)
+    return queries
+
+
+def test_probe_asks_only_for_the_awaited_ids(neutron, listeners,
+                                             monkeypatch):
+    queries = _recorded_listings(monkeypatch)
+    listed = neutron._list_collection_ids('listeners', listeners[:2])
+    assert sorted(listed) == sorted(listeners[:2])
+    query, = queries
+    assert sorted(query['id']) == sorted(listeners[:2])
+    assert 'id' in query['fields'] and 'name' not in query['fields']
+    assert set(listed[listeners[0]]) <= set(query['fields'])
+
+
+def test_probe_lists_once_unfiltered_past_the_id_filter_limit(
+        neutron, listeners, monkeypatch):
+    monkeypatch.setattr(polling_clients, 'ID_FILTER_CHUNK', 1)
+    queries = _recorded_listings(monkeypatch)
+    listed = neutron._list_collection_ids('listeners', listeners[:2])
+    assert sorted(listed) == sorted(listeners[:2])
+    query, = queries
+    assert 'id' not in query
+
+
+def test_members_of_a_missing_pool_read_as_none(neutron):
+    assert neutron._list_collection_ids(
+        ('members', 'no-such-pool'), ['m1']) == {}
+
+
+def test_loadbalancer_delete_is_confirmed_by_not_found(
+        neutron, client_subnet, backend):
+    lb = neutron.create_loadbalancer({'loadbalancer': {
+        'vip_subnet_id': client_subnet['id'],
+        'name': neutron.namespaced('gone')}})['loadbalancer']
+    neutron.delete_loadbalancer(lb['id'])
+    assert neutron._loadbalancer_gone(lb['id'])
+    assert lb['id'] not in backend.loadbalancers
+
+
+def test_bulk_members_are_confirmed_together(neutron, listeners, backend):
+    pool = neutron.create_lbaas_pool({'pool': {
+        'listener_id': listeners[0], 'protocol': 'HTTP',
+        'lb_algorithm': 'ROUND_ROBIN'}})['pool']
+    server_subnet_id, = [subnet['id'] for subnet in backend.subnets.values()
+                         if subnet['name'].startswith('server')]
+    listed = []
+    list_ids_filtered = neutron._list_ids_filtered
+
+    def recording(collection, resource_ids):
+        listed.append((collection, frozenset(resource_ids)))
+        return list_ids_filtered(collection, resource_ids)
+    neutron._list_ids_filtered = recording
+    try:
+        members = neutron.create_lbaas_members(pool['id'], [
+            {'member': {'address': '10.2.0.%d' % host, 'protocol_port': 80,
+                        'subnet_id': server_subnet_id}}
+            for host in range(20, 25)])
+    finally:
+        del neutron._list_ids_filtered
+    member_ids = frozenset(member['member']['id'] for member in members)
+    assert len(member_ids) == 5
+    # Every tick asks about the whole batch in one list call.
+    assert listed and set(listed) == set([(('members', pool['id']),
+                                           member_ids)])
+    assert all(backend.members[member_id]['provisioning_status'] == 'ACTIVE'
+               for member_id in member_ids)
+    assert member_ids <= set(member_id for kind, member_id
+                             in neutron.created_graph().nodes
+                             if kind == 'member')
+
+
+def test_bulk_healthmonitors_cover_several_pools(neutron, listeners,
+                                                 backend):
+    pool_ids = [neutron.create_lbaas_pool({'pool': {
+        'listener_id': listener_id, 'protocol': 'HTTP',
+        'lb_algorithm': 'ROUND_ROBIN'}})['pool']['id']
+        for listener_id in listeners[:2]]
+    healthmonitors = neutron.create_lbaas_healthmonitors([
+        {'healthmonitor': {'pool_id': pool_id, 'type': 'HTTP', 'delay': 5,
+                           'timeout': 3, 'max_retries': 3}}
+        for pool_id in pool_ids])
+    assert [backend.healthmonitors[healthmonitor['healthmonitor']['id']]
+            ['pools'][0]['id'] for healthmonitor in healthmonitors] ==\
+        pool_ids
+
+
+class Device(object):
+    '''An iControl REST session answering collection queries from items.
+
+    Nothing is listed until after the first hidden_ticks queries.
+    '''
+    def __init__(self, items, hidden_ticks=0):
+        self.items = items
+        self.hidden_ticks = hidden_ticks
+        self.queries = []
+        self._meta_data = {'icr_session': self,
+                           'uri': 'https://bigip/mgmt/tm/'}
+
+    def get(self, uri, params=None):
+        path = uri[len(self._meta_data['uri']):]
+        self.queries.append((path, params))
+        shown = len(self.queries) > self.hidden_ticks
+        response = {'items': self.items.get(path, []) if shown else []}
+        return type('Response', (), {'json': lambda self: response})()
+
+
+def _device_objects():
+    return {'ltm/virtual/': [{'name': 'Project_l1'}],
+            'ltm/pool/': [{'name': 'Project_p1', 'membersReference': {
+                'items': [{'name': '10.2.0.10%1:80'},
+                          {'name': '2001:db8::10.80'}]}}],
+            'ltm/monitor/http/': [{'name': 'Project_hm1'}]}
+
+
+def _expected():
+    return dict(listeners=[{'id': 'l1'}], pools=[{'id': 'p1'}],
+                members=[('p1', {'address': '10.2.0.10',
+                                 'protocol_port': 80}),
+                         ('p1', {'address': '2001:db8::10',
+                                 'protocol_port': 80})],
+                healthmonitors=[{'id': 'hm1', 'type': 'HTTP'}])
+
+
+def test_bigip_wait_makes_one_query_per_kind_each_tick():
+    device = Device(_device_objects(), hidden_ticks=3)
+    bigip = polling_clients.BigIPPollingManager(device, interval=.01)
+    assert bigip.wait_for_objects('tenant', **_expected())
+    # The first tick's three queries found nothing; the second found all.
+    assert len(device.queries) == 6
+    paths = [path for path, _ in device.queries]
+    assert sorted(paths[:3]) == sorted(paths[3:]) ==\
+        ['ltm/monitor/http/', 'ltm/pool/', 'ltm/virtual/']
+    for _, params in device.queries:
+        assert 'partition+eq+Project_tenant' in params
+    pool_params, = [params for path, params in device.queries[:3]
+                    if path == 'ltm/pool/']
+    assert 'expandSubcollections=true' in pool_params
+
+
+def test_bigip_outstanding_names_what_is_missing_or_left():
+    items = _device_objects()
+    items['ltm/virtual/'] = []
+    bigip = polling_clients.BigIPPollingManager(Device(items))
+    expected = bigip.expected_objects(**_expected())
+    assert bigip.outstanding('tenant', expected) ==\
+        {'ltm/virtual/': set(['Project_l1'])}
+    left = bigip.outstanding('tenant', expected, present=False)
+    assert left['ltm/pool/members'] == set([
+        ('Project_p1', '10.2.0.10:80'), ('Project_p1', '2001:db8::10:80')])
+    assert 'ltm/virtual/' not in left
+
+
+IMAGE_PROPERTIES = {'disk_format': 'qcow2', 'container_format': 'bare'}
+
+
+def test_image_is_streamed_in_chunks_and_checksummed(glance, tmp_path,
+                                                     monkeypatch):
+    content = os.urandom(10000)
+    path = tmp_path / 'image.qcow2'
+    path.write_bytes(content)
+    sent = []
+    read = polling_clients._ChecksummingReader.read
+
+    def recording(self, size=-1):
+        chunk = read(self, size)
+        sent.append(len(chunk))
+        return chunk
+    monkeypatch.setattr(polling_clients._ChecksummingReader, 'read',
+                        recording)
+    image = glance.create_image_from_file(
+        str(path), chunk_size=1024, name='ut-streamed', **IMAGE_PROPERTIES)
+    try:
+        assert image['status'] == 'active'
+        assert image['checksum'] == hashlib.md5(content).hexdigest()
+        assert sum(sent) == len(content) and max(sent) == 1024
+    finally:
+        glance.images.delete(image['id'])
+
+
+def test_empty_image_file_is_uploaded(glance, tmp_path):
+    path = tmp_path / 'empty.qcow2'
+    path.write_bytes(b'')
+    image = glance.create_image_from_file(str(path), name='ut-empty',
+                                          **IMAGE_PROPERTIES)
+    glance.images.delete(image['id'])
+    assert image['checksum'] == hashlib.md5(b'').hexdigest()
+
+
+def test_failed_upload_deletes_the_image(glance, backend, tmp_path):
+    path = tmp_path / 'broken.qcow2'
+    path.write_bytes(b'broken')
+    backend.fail_names.add('ut-broken')
+    try:
+        with pytest.raises(ImageUploadFailed):
+            glance.create_image_from_file(str(path), name='ut-broken',
+                                          **IMAGE_PROPERTIES)
+    finally:
+        backend.fail_names.discard('ut-broken')
+    assert not [image for image in backend.images.values()
+                if image.get('name') == 'ut-broken']
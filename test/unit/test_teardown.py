@@ -0,0 +1,198 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from f5_os_test import teardown
+from neutronclient.v2_0.client import Client as NeutronClient
+import pytest
+import threading
+
+
+def _graph(*named):
+    graph = teardown.ResourceGraph()
+    for kind, resource_id, name, parents in named:
+        graph.add(kind, resource_id, parents, name=name)
+    return graph
+
+
+class Deleter(object):
+    '''Records the order of deletes; ids in failing raise instead.'''
+    def __init__(self, failing=()):
+        self.deleted = []
+        self.failing = set(failing)
+        self._lock = threading.Lock()
+
+    def _delete(self, kind, resource_id):
+        if resource_id in self.failing:
+            raise RuntimeError('cannot delete %s' % resource_id)
+        with self._lock:
+            self.deleted.append((kind, resource_id))
+
+    def delete_loadbalancer(self, resource_id):
+        self._delete('loadbalancer', resource_id)
+
+    def delete_listener(self, resource_id):
+        self._delete('listener', resource_id)
+
+    def delete_lbaas_pool(self, resource_id):
+        self._delete('pool', resource_id)
+
+    def delete_lbaas_member(self, resource_id, pool_id):
+        self._delete('member', resource_id)
+
+    def delete_lbaas_healthmonitor(self, resource_id):
+        self._delete('healthmonitor', resource_id)
+
+
+def _two_trees():
+    return teardown.graph_from_listings(
+        [{'id': 'lb1', 'name': 'ut-lb1'}, {'id': 'lb2', 'name': 'ut-lb2'}],
+        [{'id': 'l1', 'name': 'ut-l1', 'loadbalancers': [{'id': 'lb1'}]},
+         {'id': 'l2', 'name': 'ut-l2', 'loadbalancers': [{'id': 'lb2'}]}],
+        [{'id': 'p1', 'name': 'ut-p1', 'listeners': [{'id': 'l1'}],
+          'members': [{'id': 'm1'}, {'id': 'm2'}]},
+         {'id': 'p2', 'name': 'ut-p2', 'listeners': [{'id': 'l2'}],
+          'members': [{'id': 'm3'}]}],
+        [{'id': 'hm1', 'name': 'ut-hm1', 'pools': [{'id': 'p1'}]}])
+
+
+def test_delete_graph_deletes_leaves_first():
+    graph = _two_trees()
+    deleter = Deleter()
+    assert teardown.delete_graph(deleter, graph, max_workers=4)
+    assert set(deleter.deleted) == set(graph.nodes)
+    order = dict((key, index) for index, key in enumerate(deleter.deleted))
+    for key, parents in graph.parents.items():
+        for parent in parents:
+            assert order[key] < order[parent]
+
+
+def test_failed_branch_leaves_its_parents_alone():
+    deleter = Deleter(failing=['m1'])
+    with pytest.raises(RuntimeError):
+        teardown.delete_graph(deleter, _two_trees(), max_workers=4)
+    assert set(deleter.deleted) == set([
+        ('member', 'm2'), ('healthmonitor', 'hm1'), ('member', 'm3'),
+        ('pool', 'p2'), ('listener', 'l2'), ('loadbalancer', 'lb2')])
+
+
+def test_restrict_to_namespace_keeps_what_hangs_off_named_nodes():
+    graph = _two_trees()
+    graph.add('loadbalancer', 'lb3', name='other-lb3')
+    graph.nodes[('loadbalancer', 'lb2')]['name'] = 'other-lb2'
+    graph.nodes[('listener', 'l2')]['name'] = 'other-l2'
+    graph.nodes[('pool', 'p2')]['name'] = 'ut-p2'
+    teardown.restrict_to_namespace(graph, 'ut-')
+    assert set(graph.nodes) == set([
+        ('loadbalancer', 'lb1'), ('listener', 'l1'), ('pool', 'p1'),
+        ('member', 'm1'), ('member', 'm2'), ('healthmonitor', 'hm1'),
+        ('pool', 'p2'), ('member', 'm3')])
+    assert graph.parents[('pool', 'p2')] == set()
+
+
+def test_restrict_to_stale_keeps_only_old_runs_under_the_prefix():
+    graph = _graph(
+        ('loadbalancer', 'old', 'f5ost-1000-abcdef12-main-lb', ()),
+        ('listener', 'old-l', None, [('loadbalancer', 'old')]),
+        ('loadbalancer', 'recent', 'f5ost-9000-abcdef13-gw0-lb', ()),
+        ('loadbalancer', 'mine', 'f5ost-1000-abcdef14-main-lb', ()),
+        ('loadbalancer', 'other', 'someone-elses-lb', ()),
+        ('loadbalancer', 'prefix', 'f5ostx-1000-abcdef15-main-lb', ()))
+    teardown.restrict_to_stale(graph, 'f5ost', 'f5ost-1000-abcdef14-main-',
+                               max_age=3600, now=10000)
+    assert set(graph.nodes) == set([('loadbalancer', 'old'),
+                                    ('listener', 'old-l')])
+
+
+def test_delete_stale_sweeps_dead_runs(neutron, client_subnet):
+    stale = neutron.create_loadbalancer({'loadbalancer': {
+        'vip_subnet_id': client_subnet['id'],
+        'name': 'f5ost-1000-abcdef12-main-testlb_01'}})
+    neutron.namespace = 'f5ost-1001-abcdef99-main-'
+    current = neutron.create_loadbalancer({'loadbalancer': {
+        'vip_subnet_id': client_subnet['id'],
+        'name': neutron.namespaced('testlb_01')}})
+    teardown.delete_stale(neutron, 'f5ost', max_age=3600)
+    remaining = set(lb['id'] for lb in
+                    neutron.list_loadbalancers()['loadbalancers'])
+    assert stale['loadbalancer']['id'] not in remaining
+    assert current['loadbalancer']['id'] in remaining
+    neutron.delete_loadbalancer(current['loadbalancer']['id'])
+
+
+class Lister(object):
+    '''Answers the LBaaS list calls from canned listings, recording them.'''
+    def __init__(self, **listings):
+        self.listings = listings
+        self.listed = []
+
+    def _list(self, key):
+        self.listed.append(key)
+        return {key: self.listings.get(key, [])}
+
+    def list_loadbalancers(self):
+        return self._list('loadbalancers')
+
+    def list_listeners(self):
+        return self._list('listeners')
+
+    def list_lbaas_pools(self):
+        return self._list('pools')
+
+    def list_lbaas_healthmonitors(self):
+        return self._list('healthmonitors')
+
+
+def test_namespace_ids_lists_one_collection_when_names_decide():
+    lister = Lister(pools=[{'id': 'p1', 'name': 'ut-p1'},
+                           {'id': 'p2', 'name': 'ut-p2'}])
+    assert teardown.namespace_ids(lister, 'pool', 'ut-') == ['p1', 'p2']
+    assert lister.listed == ['pools']
+    lister.listed = []
+    assert teardown.namespace_ids(lister, 'pool', None) == ['p1', 'p2']
+    assert lister.listed == ['pools']
+
+
+def test_namespace_ids_places_unnamed_objects_through_their_parents():
+    lister = Lister(
+        loadbalancers=[{'id': 'lb1', 'name': 'ut-lb1'},
+                       {'id': 'lb2', 'name': 'other-lb2'}],
+        listeners=[{'id': 'l1', 'name': '', 'loadbalancers': [{'id': 'lb1'}]},
+                   {'id': 'l2', 'name': '', 'loadbalancers': [{'id': 'lb2'}]}],
+        healthmonitors=[
+            {'id': 'hm1', 'name': '', 'pools': [{'id': 'p1'}]},
+            {'id': 'hm2', 'name': '', 'pools': [{'id': 'p2'}]},
+            {'id': 'hm3', 'name': 'ut-hm3', 'pools': [{'id': 'p2'}]}],
+        pools=[{'id': 'p1', 'name': '', 'listeners': [{'id': 'l1'}]},
+               {'id': 'p2', 'name': '', 'listeners': [{'id': 'l2'}]}])
+    assert teardown.namespace_ids(lister, 'healthmonitor', 'ut-') ==\
+        ['hm1', 'hm3']
+    assert lister.listed == ['healthmonitors', 'pools', 'listeners',
+                             'loadbalancers']
+
+
+def test_delete_created_takes_children_made_elsewhere(neutron, client_subnet):
+    lb = neutron.create_loadbalancer({'loadbalancer': {
+        'vip_subnet_id': client_subnet['id'],
+        'name': neutron.namespaced('testlb_01')}})['loadbalancer']
+    # Made as Heat or the agent would, without the manager's tracking.
+    listener = NeutronClient.create_listener(neutron, {'listener': {
+        'loadbalancer_id': lb['id'], 'protocol': 'HTTP',
+        'protocol_port': 80}})['listener']
+    neutron.wait_for_loadbalancer(lb['id'])
+    assert ('listener', listener['id']) not in neutron.created_graph().nodes
+    teardown.delete_created(neutron)
+    assert not neutron.list_loadbalancers()['loadbalancers']
+    assert not neutron.list_listeners()['listeners']
+    assert not neutron.created_graph().nodes
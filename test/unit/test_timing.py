@@ -0,0 +1,97 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from f5_os_test import polling_clients
+from f5_os_test import teardown
+from f5_os_test import timing
+import json
+import os
+import pytest
+import subprocess
+import sys
+
+
+TIMED_TESTS = '''
+from f5_os_test import timing
+
+
+def test_timed_operation():
+    with timing.RECORDER.measure('listener', 'create') as record:
+        record.attempts = 2
+'''
+
+
+def test_percentile_is_nearest_rank():
+    values = [5, 1, 4, 2, 3]
+    assert timing.percentile(values, .5) == 3
+    assert timing.percentile(values, .95) == 5
+    assert timing.percentile(values, 0) == 1
+    assert timing.percentile([7], .5) == 7
+
+
+def test_measure_records_how_the_operation_ended():
+    recorder = timing.TimingRecorder()
+    with recorder.measure('pool', 'create') as record:
+        assert recorder.current() is record
+        record.attempts = 3
+    with pytest.raises(KeyError):
+        with recorder.measure('pool', 'create'):
+            raise KeyError('pool')
+    assert recorder.current() is None
+    ok, failed = recorder.records
+    assert (ok.status, ok.attempts) == ('ok', 3)
+    assert failed.status == 'KeyError'
+    figures = recorder.summary()[('pool', 'create')]
+    assert (figures['count'], figures['attempts'], figures['failures']) ==\
+        (2, 3, 1)
+    summary, = recorder.as_dict()['summary']
+    assert (summary['resource'], summary['operation']) == ('pool', 'create')
+
+
+def test_manager_operations_charge_their_calls_and_sleeps(fake_session,
+                                                          client_subnet):
+    recorder = timing.TimingRecorder()
+    neutron = polling_clients.NeutronClientPollingManager(
+        session=fake_session, wait_strategy='exponential', namespace='ut-',
+        timing_recorder=recorder)
+    neutron.create_loadbalancer({'loadbalancer': {
+        'vip_subnet_id': client_subnet['id'],
+        'name': neutron.namespaced('timed')}})
+    teardown.delete_created(neutron)
+    record = [r for r in recorder.records
+              if (r.resource, r.operation) == ('loadbalancer', 'create')][0]
+    assert record.status == 'ok'
+    # The create itself, then at least one show.
+    assert record.attempts >= 2
+    assert 0 < record.http_time <= record.wall_time
+    assert record.sleep_time <= record.wall_time
+
+
+def test_report_is_printed_and_written_to_json(tmp_path):
+    (tmp_path / 'test_timed.py').write_text(TIMED_TESTS)
+    report = tmp_path / 'timing.json'
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.run(
+        [sys.executable, '-m', 'pytest', '-q', '-p', 'no:cacheprovider',
+         '-p', 'f5_os_test.timing', str(tmp_path),
+         '--timing-json', str(report)],
+        cwd=str(tmp_path), env=environment, stdout=subprocess.PIPE,
+        universal_newlines=True).stdout
+    assert 'polling manager timing' in output
+    written = json.loads(report.read_text())
+    record, = written['records']
+    assert (record['resource'], record['attempts']) == ('listener', 2)
+    summary, = written['summary']
+    assert (summary['operation'], summary['count']) == ('create', 1)
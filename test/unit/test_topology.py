@@ -0,0 +1,39 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from f5_os_test.topology import TopologyIndex
+import pytest
+
+
+def test_allocated_addresses_are_unique_and_skip_the_gateway(neutron):
+    topology = TopologyIndex(neutron)
+    gateway = topology.subnet('server-v4')['gateway_ip']
+    addresses = topology.allocate_addresses('server-v4', 10)
+    assert len(set(addresses)) == 10 and gateway not in addresses
+    assert not set(topology.allocate_addresses('server-v4', 10)) &\
+        set(addresses)
+
+
+def test_released_addresses_are_handed_out_again(neutron):
+    topology = TopologyIndex(neutron)
+    for _ in range(1000):
+        addresses = topology.allocate_addresses('server-v4')
+        topology.release_addresses(addresses)
+    assert topology.allocate_addresses('server-v4') == addresses
+
+
+def test_unknown_role_raises_lookup_error(neutron):
+    with pytest.raises(LookupError):
+        TopologyIndex(neutron).subnet('no-such-role')
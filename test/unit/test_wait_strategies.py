@@ -0,0 +1,108 @@
+# Copyright 2016 F5 Networks Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from f5_os_test import wait_strategies
+from f5_os_test.wait_strategies import DeadlineWait
+from f5_os_test.wait_strategies import ExponentialBackoff
+from f5_os_test.wait_strategies import FibonacciBackoff
+from f5_os_test.wait_strategies import FixedWait
+from f5_os_test.wait_strategies import JitteredBackoff
+from f5_os_test.wait_strategies import LeadInWait
+import itertools
+import pytest
+
+
+class Clock(object):
+    '''Stands in for the time module; sleeping is advancing now.'''
+    def __init__(self):
+        self.now = 0.
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(wait_strategies, 'time', clock)
+    return clock
+
+
+def _slept(strategy, clock):
+    delays = []
+    for delay in strategy.delays():
+        delays.append(delay)
+        clock.now = clock.now + delay
+    return delays
+
+
+def test_fixed_wait():
+    assert list(FixedWait(2, 3).delays()) == [2, 2, 2]
+    assert list(itertools.islice(FixedWait(2).delays(), 50)) == [2] * 50
+
+
+def test_exponential_backoff_is_capped():
+    strategy = ExponentialBackoff(initial=1, factor=2, max_interval=5,
+                                  max_attempts=5)
+    assert list(strategy.delays()) == [1, 2, 4, 5, 5]
+
+
+def test_jittered_backoff_stays_within_its_share(monkeypatch):
+    strategy = JitteredBackoff(initial=1, factor=2, max_interval=5,
+                               max_attempts=5, jitter=.5)
+    monkeypatch.setattr(wait_strategies.random, 'random', lambda: 1.)
+    assert list(strategy.delays()) == [.5, 1, 2, 2.5, 2.5]
+    monkeypatch.setattr(wait_strategies.random, 'random', lambda: 0.)
+    assert list(strategy.delays()) == [1, 2, 4, 5, 5]
+
+
+def test_fibonacci_backoff_is_capped():
+    strategy = FibonacciBackoff(unit=1, max_interval=6, max_attempts=7)
+    assert list(strategy.delays()) == [1, 1, 2, 3, 5, 6, 6]
+
+
+def test_deadline_wait_trims_the_last_sleep(clock):
+    assert _slept(DeadlineWait(10, FixedWait(4)), clock) == [4, 4, 2]
+
+
+def test_lead_in_wait(clock):
+    strategy = LeadInWait(3, 2, 5)
+    assert strategy.lead_in == 3
+    assert _slept(strategy, clock) == [2, 2, 1]
+
+
+@pytest.mark.parametrize('name', ['exponential', 'jittered', 'fibonacci',
+                                  'deadline', 'learned'])
+def test_named_strategies_share_the_fixed_budget(name, clock):
+    delays = _slept(wait_strategies.from_name(name, 2, 10), clock)
+    assert sum(delays) == pytest.approx(20)
+    assert max(delays) <= 2
+
+
+def test_from_name_fixed_and_unknown():
+    strategy = wait_strategies.from_name('fixed', 2, 10)
+    assert (strategy.interval, strategy.max_attempts) == (2, 10)
+    with pytest.raises(ValueError):
+        wait_strategies.from_name('eventually', 2, 10)
+
+
+def test_resolve():
+    default = wait_strategies.resolve(None, 2, 10)
+    assert isinstance(default, FixedWait)
+    assert (default.interval, default.max_attempts) == (2, 10)
+    given = FibonacciBackoff()
+    assert wait_strategies.resolve(given, 2, 10) is given
+    assert isinstance(wait_strategies.resolve('deadline', 2, 10),
+                      DeadlineWait)